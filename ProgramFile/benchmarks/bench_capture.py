@@ -0,0 +1,116 @@
+"""Compares aligned metadata capture with naive per-sector reads on sparse GPT images.
+
+Each image gets a protective MBR, primary and backup GPT. The naive paths
+read every metadata sector on its own (LBA 0-33 and the last 33 LBAs on
+512-byte sectors), either through the page cache ("cached", seek + read)
+or uncached like capture ("direct"); capture_metadata() reads the same
+regions with one aligned read each.
+
+    python benchmarks/bench_capture.py --drives 20 --size 64
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from usbLock_device import ImageDevices, SectorGeometry
+from usbLock_metadata import RawDisk, capture_metadata, head_span
+from usbLock_sim import make_gpt_image
+
+GEOMETRIES = ((512, 512), (512, 4096), (4096, 4096))
+
+
+def drop_cache(path):
+    if hasattr(os, 'posix_fadvise'):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def metadata_lbas(size, logical):
+    """LBA 0 through the primary entry array, then the backup entry array and header"""
+    head_sectors = head_span(SectorGeometry(logical, logical)) // logical
+    last = size // logical
+    return list(range(head_sectors)) + list(range(last - head_sectors + 1, last))
+
+
+def naive_cached(devices, drive, logical):
+    """Seeks and reads each metadata sector through the page cache; returns (bytes, syscalls)"""
+    fd = os.open(devices.path(drive), os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        size = os.lseek(fd, 0, os.SEEK_END)
+        data = []
+        for lba in metadata_lbas(size, logical):
+            os.lseek(fd, lba * logical, os.SEEK_SET)
+            data.append(os.read(fd, logical))
+    finally:
+        os.close(fd)
+    return b''.join(data), 1 + 2 * len(data)
+
+
+def naive_direct(devices, drive, logical):
+    """Reads each metadata sector on its own through the same uncached path as capture_metadata()"""
+    with RawDisk.open(devices, drive) as disk:
+        data = [disk.read(lba * logical, logical) for lba in metadata_lbas(disk.size(), logical)]
+        return b''.join(data), disk.syscalls
+
+
+def run(tmp, drives, size, logical, physical, cold):
+    devices = ImageDevices(tmp)
+    paths = []
+    for i in range(drives):
+        path = devices.path(i)
+        make_gpt_image(path, size, logical)
+        with open(os.path.join(tmp, f"drive{i}.sectors"), 'w') as f:
+            f.write(f"{logical} {physical}")
+        paths.append(path)
+
+    results = {}
+    for name in ('cached', 'direct', 'aligned'):
+        elapsed = 0.0
+        syscalls = 0
+        captured = 0
+        for i, path in enumerate(paths):
+            if cold:
+                drop_cache(path)
+            start = time.perf_counter()
+            if name == 'cached':
+                data, calls = naive_cached(devices, i, logical)
+            elif name == 'direct':
+                data, calls = naive_direct(devices, i, logical)
+            else:
+                capture = capture_metadata(i, devices)
+                data, calls = capture.data, capture.syscalls
+            elapsed += time.perf_counter() - start
+            syscalls += calls
+            captured += len(data)
+        results[name] = (elapsed / drives, syscalls / drives, captured / drives)
+    for path in paths:
+        os.remove(path)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--drives', type=int, default=20)
+    parser.add_argument('--size', type=int, default=64, help="image size in GiB (sparse)")
+    parser.add_argument('--warm', action='store_true', help="do not drop the page cache between captures")
+    parser.add_argument('--dir', help="directory for the images (default: a temporary one)")
+    args = parser.parse_args()
+
+    size = args.size * 1024**3
+    print(f"{'sectors':>12} {'method':>8} {'syscalls/drive':>15} {'bytes/drive':>12} {'latency/drive':>14}")
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        for logical, physical in GEOMETRIES:
+            results = run(tmp, args.drives, size, logical, physical, not args.warm)
+            for name, (latency, syscalls, captured) in results.items():
+                print(f"{f'{logical}/{physical}':>12} {name:>8} {syscalls:>15.0f} {captured:>12.0f} {latency * 1000:>11.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Compares the batched enumeration engine with the old per-drive code path.
+
+The old get_usb_drives() ran psutil.disk_usage and a `vol X:` shell for
+every drive, one after another. Each of those is simulated here with a
+sleep of --latency seconds so the benchmark runs on any platform.
+
+    python benchmarks/bench_enum.py --drives 1 5 10 20 --latency 0.03
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from usbLock_enum import FakeBackend, LinuxBackend, enumerate_drives, make_drive
+
+
+def fake_drives(count):
+    return [
+        make_drive(f"/dev/sd{i}1", f"/media/usb{i}", 'vfat', (8 + i) * 1024**3, f"STICK{i}")
+        for i in range(count)
+    ]
+
+
+def legacy_enumerate(drives, latency):
+    """Mirrors the old loop: disk_usage then `vol` per drive, sequentially"""
+    result = []
+    for drive in drives:
+        time.sleep(latency)  # psutil.disk_usage
+        time.sleep(latency)  # subprocess.run(f'vol {device}')
+        result.append(dict(drive))
+    return result
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--drives', type=int, nargs='+', default=[1, 5, 10, 20])
+    parser.add_argument('--latency', type=float, default=0.03, help="seconds per simulated probe")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'drives':>6} {'legacy ms':>10} {'bulk ms':>9} {'probed ms':>10}")
+    for count in args.drives:
+        drives = fake_drives(count)
+        bulk = FakeBackend(drives)
+        probed = FakeBackend(drives, args.latency, [d['device'] for d in drives])
+        legacy_ms = timed(lambda: legacy_enumerate(drives, args.latency), args.repeat)
+        # The bulk path still costs one query on real hardware
+        bulk_ms = timed(lambda: (time.sleep(args.latency), enumerate_drives(bulk)), args.repeat)
+        probed_ms = timed(lambda: enumerate_drives(probed), args.repeat)
+        print(f"{count:>6} {legacy_ms:>10.1f} {bulk_ms:>9.1f} {probed_ms:>10.1f}")
+
+    if sys.platform.startswith('linux'):
+        ms = timed(lambda: enumerate_drives(LinuxBackend()), args.repeat)
+        print(f"\nLinux sysfs backend on this host: {ms:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
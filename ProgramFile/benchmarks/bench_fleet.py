@@ -0,0 +1,96 @@
+"""Measures fleet-wide list, lock and unlock against many local agents.
+
+Starts --hosts agent processes on localhost, each over its own simulated
+fleet of --drives disks (serials SIM00000...) with its own backup folder,
+and drives them from one FleetController: list, lock everything but
+SIM00000, lock again (nothing left to do), then unlock the locked
+serials. Reports wall time, per-host p50/p95 and how many connections
+were opened, which stays at one per agent as they are reused.
+
+    python benchmarks/bench_fleet.py --hosts 50 --drives 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from usbLock_fleet import FleetController
+from usbLock_sim import SimulatedFleet
+
+CLI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'usbLock_cli.py')
+
+
+def start_agents(tmp, args):
+    """Starts one agent per host and returns (processes, [(host, port)])"""
+    processes = []
+    for n in range(args.hosts):
+        home = os.path.join(tmp, f"host{n}")
+        SimulatedFleet(os.path.join(home, "drives"), args.drives, size=args.size * 1024 * 1024).create()
+        env = dict(os.environ, USBLOCK_LOG_DIR=os.path.join(home, "logs"))
+        processes.append(subprocess.Popen(
+            [sys.executable, CLI, '--image-dir', os.path.join(home, "drives"), 'agent', '--port', '0'],
+            cwd=home, env=env, stdout=subprocess.PIPE, text=True))
+    hosts = []
+    for process in processes:
+        listening = json.loads(process.stdout.readline())
+        hosts.append((listening['host'], listening['port']))
+    return processes, hosts
+
+
+async def rounds(hosts, args):
+    locked = [f"SIM{i:05d}" for i in range(1, args.drives)]
+    steps = (
+        ('list', 'list', {'kind': 'physical'}),
+        ('lock unknown', 'lock', {'allow': ['SIM00000']}),
+        ('lock again', 'lock', {'allow': ['SIM00000']}),
+        ('unlock', 'unlock', {'serials': locked}),
+    )
+    print(f"{'step':>14} {'hosts ok':>9} {'drives':>7} {'wall s':>8} {'p50 ms':>8} {'p95 ms':>8} {'connects':>9}")
+    async with FleetController(hosts, timeout=args.timeout) as fleet:
+        for label, method, params in steps:
+            start = time.perf_counter()
+            results = [r async for r in fleet.stream(method, params)]
+            wall = time.perf_counter() - start
+            ok = [r for r in results if r.success]
+            drives = sum(1 for r in ok for d in r.result.get('drives', ()) if d['success'] and
+                         d['message'] != 'already_disabled')
+            durations = sorted(r.duration * 1000 for r in results)
+            p50 = durations[len(durations) // 2]
+            p95 = durations[min(len(durations) - 1, int(0.95 * len(durations)))]
+            connects = sum(c.connects for c in fleet.clients.values())
+            print(f"{label:>14} {len(ok):>9} {drives:>7} {wall:>8.3f} {p50:>8.1f} {p95:>8.1f} {connects:>9}")
+            for r in results:
+                if not r.success:
+                    print(f"{'':>14} {r.host}: {r.error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hosts', type=int, default=20)
+    parser.add_argument('--drives', type=int, default=4, help="simulated drives per host")
+    parser.add_argument('--size', type=int, default=16, help="image size in MiB (sparse)")
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--dir', help="directory for the hosts (default: a temporary one)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        start = time.perf_counter()
+        processes, hosts = start_agents(tmp, args)
+        print(f"{len(hosts)} agents up in {time.perf_counter() - start:.2f}s")
+        try:
+            asyncio.run(rounds(hosts, args))
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Measures journal group commit against one fsync per intent.
+
+--drives threads each append one durable intent at once, the way a batch
+of disable jobs reaches its first sector write. Reports how many syncs
+the journal made and the mean and worst wait per intent.
+
+    python benchmarks/bench_journal.py --drives 1 8 32 --rounds 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from usbLock_journal import Journal
+
+
+class SyncEachJournal(Journal):
+    """Baseline: appends are serialized, so every one writes and syncs on its own"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._one_at_a_time = threading.Lock()
+
+    def append(self, record, durable=True):
+        with self._one_at_a_time:
+            return super().append(record, durable)
+
+
+def run(path, journal_class, drives, rounds):
+    journal = journal_class(path)
+    waits = []
+    lock = threading.Lock()
+
+    def worker(drive):
+        start = time.perf_counter()
+        journal.begin('disable', drive, f"SERIAL{drive}", [(0, 512)], '0' * 64, '1' * 64, None)
+        with lock:
+            waits.append(time.perf_counter() - start)
+
+    for _ in range(rounds):
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(drives)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    journal.close()
+    os.remove(path)
+    return journal.fsyncs / rounds, sum(waits) / len(waits), max(waits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--drives', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--dir', help="directory for the journal (default: a temporary one)")
+    args = parser.parse_args()
+
+    print(f"{'drives':>6} {'mode':>10} {'fsyncs/batch':>13} {'mean wait':>10} {'worst wait':>11}")
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        path = os.path.join(tmp, "journal.jsonl")
+        for drives in args.drives:
+            for name, journal_class in (('sync-each', SyncEachJournal), ('group', Journal)):
+                syncs, mean, worst = run(path, journal_class, drives, args.rounds)
+                print(f"{drives:>6} {name:>10} {syncs:>13.1f} {mean * 1000:>7.2f} ms {worst * 1000:>8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
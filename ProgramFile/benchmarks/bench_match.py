@@ -0,0 +1,88 @@
+"""Times backup-to-drive matching against a large synthetic backup store.
+
+Writes --backups MBR backup files plus one sparse disk image whose partition
+table was zeroed (as disable does), then ranks every backup against it.
+
+    python benchmarks/bench_match.py --backups 5000
+"""
+import argparse
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from usbLock_catalog import BackupEntry
+from usbLock_device import ImageDevices
+from usbLock_match import rank_backups
+from usbLock_partition import parse_mbr
+
+DISK_SIZE = 16 * 1024**3
+
+
+def make_mbr(signature, lba_start, sectors):
+    sector = bytearray(512)
+    struct.pack_into('<I', sector, 440, signature)
+    struct.pack_into('<B3xB3xII', sector, 446, 0x80, 0x0C, lba_start, sectors)
+    sector[510:512] = b'\x55\xaa'
+    return bytes(sector)
+
+
+def make_fat32_boot_sector():
+    sector = bytearray(512)
+    sector[3:11] = b'MSDOS5.0'
+    sector[82:87] = b'FAT32'
+    sector[510:512] = b'\x55\xaa'
+    return bytes(sector)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backups', type=int, default=5000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        true_start = 2048
+        with open(os.path.join(tmp, 'drive1.img'), 'wb') as disk:
+            disk.truncate(DISK_SIZE)
+            disk.seek(true_start * 512)
+            disk.write(make_fat32_boot_sector())
+
+        entries = []
+        for i in range(args.backups):
+            if i == args.backups // 2:
+                sector = make_mbr(0x1234ABCD, true_start, DISK_SIZE // 512 - true_start)
+                size, serial = DISK_SIZE, 'TARGET'
+            else:
+                start = rng.choice((63, 2048, 4096, 8192, 32768))
+                size = rng.choice((8, 16, 32, 64)) * 1024**3
+                sector = make_mbr(rng.getrandbits(32), start, size // 512 - start)
+                serial = f"S{i:06d}"
+            path = os.path.join(tmp, f"usb_backup_drive{i}_{1700000000 + i}.bin")
+            with open(path, 'wb') as f:
+                f.write(sector)
+            entries.append(BackupEntry(i, path, str(i), serial, size, None, '', 512, 1700000000 + i))
+
+        sectors = [make_mbr(rng.getrandbits(32), 2048, 1000) for _ in range(args.backups)]
+        start = time.perf_counter()
+        for sector in sectors:
+            parse_mbr(sector)
+        parse_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        matches = rank_backups(1, entries, ImageDevices(tmp), serial='TARGET')
+        rank_ms = (time.perf_counter() - start) * 1000
+
+        print(f"backups:          {args.backups}")
+        print(f"parse in memory:  {parse_ms:.1f} ms ({parse_ms * 1000 / args.backups:.2f} us/sector)")
+        print(f"read + rank:      {rank_ms:.1f} ms")
+        best = matches[0]
+        print(f"best match:       {os.path.basename(best.entry.path)} score={best.score} ({'; '.join(best.reasons)})")
+
+
+if __name__ == '__main__':
+    main()
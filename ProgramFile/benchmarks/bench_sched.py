@@ -0,0 +1,95 @@
+"""Measures how long lock operations wait behind wipes sharing their USB hubs.
+
+A simulated fleet of --drives disks, --hub-ports per hub, is installed with
+the I/O scheduler. Half the drives on every hub are wiped (bulk jobs) while
+the other half are disabled and re-enabled (metadata jobs) through the
+batch pool, once with the per-hub caps and once with caps high enough to
+admit everything. Reports metadata p50/p95, total time and the
+scheduler's queue wait histograms.
+
+    python benchmarks/bench_sched.py --drives 16 --hub-ports 4 --size 256
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import usbLock_core as core
+import usbLock_metrics as metrics
+from usbLock_batch import BatchJob, run_batch
+from usbLock_scheduler import HUB_SLOTS, CONTROLLER_SLOTS
+from usbLock_sim import SimulatedFleet
+
+UNCAPPED = 1 << 20
+
+
+def lock_cycle(drive, devices):
+    success, message = core.disable_usb_drive(drive, devices, verify=False)
+    if not success:
+        return success, message
+    return core.enable_usb_drive(drive, message[2], devices, verify=False)
+
+
+def run(tmp, args, hub_slots, controller_slots):
+    fleet = SimulatedFleet(os.path.join(tmp, "drives"), args.drives, size=args.size * 1024 * 1024,
+                           hub_ports=args.hub_ports, controller_hubs=args.controller_hubs).create()
+    core.BACKUP_DIR = Path(tmp) / "backups"
+    metrics.reset()
+    wiped = [i for i in range(args.drives) if i % args.hub_ports < args.hub_ports // 2]
+    locked = [i for i in range(args.drives) if i not in wiped]
+    with fleet.install(hub_slots=hub_slots, controller_slots=controller_slots):
+        wipes = [BatchJob(i, str(i), core.wipe_usb_drive, (i, ('zero',), 'none', fleet.devices)) for i in wiped]
+        wiper = threading.Thread(target=run_batch, args=(wipes,), kwargs={'max_workers': len(wipes)})
+        start = time.perf_counter()
+        wiper.start()
+        # Let the wipes take their slots before the lock jobs arrive
+        time.sleep(0.05)
+        locks = run_batch([BatchJob(i, str(i), lock_cycle, (i, fleet.devices)) for i in locked],
+                          max_workers=len(locked))
+        locks_done = time.perf_counter() - start
+        wiper.join()
+        total = time.perf_counter() - start
+    fleet.remove()
+    shutil.rmtree(core.BACKUP_DIR, ignore_errors=True)
+    failed = [r for r in locks if not r.success]
+    if failed:
+        raise SystemExit(f"lock cycle on drive {failed[0].key} failed: {failed[0].message}")
+    durations = sorted(r.duration * 1000 for r in locks)
+    return durations, locks_done, total, metrics.snapshot()['operations']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--drives', type=int, default=16)
+    parser.add_argument('--hub-ports', type=int, default=4)
+    parser.add_argument('--controller-hubs', type=int, default=4)
+    parser.add_argument('--size', type=int, default=256, help="image size in MiB (sparse)")
+    parser.add_argument('--dir', help="directory for the images (default: a temporary one)")
+    args = parser.parse_args()
+
+    metrics.enable()
+    print(f"{'caps':>18} {'lock p50 ms':>12} {'lock p95 ms':>12} {'locks done s':>13} {'total s':>8}")
+    for label, hub_slots, controller_slots in (
+        (f"hub {HUB_SLOTS}, ctrl {CONTROLLER_SLOTS}", HUB_SLOTS, CONTROLLER_SLOTS),
+        ("uncapped", UNCAPPED, UNCAPPED),
+    ):
+        with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+            durations, locks_done, total, operations = run(tmp, args, hub_slots, controller_slots)
+        p50 = durations[len(durations) // 2]
+        p95 = durations[min(len(durations) - 1, int(0.95 * len(durations)))]
+        print(f"{label:>18} {p50:>12.2f} {p95:>12.2f} {locks_done:>13.3f} {total:>8.3f}")
+        for name in ('sched.wait.metadata', 'sched.wait.bulk'):
+            if name in operations:
+                op = operations[name]
+                print(f"{'':>18} {name}: {op['count']} waits, p50 {op['p50'] * 1000:.2f} ms, "
+                      f"p95 {op['p95'] * 1000:.2f} ms, max {op['max'] * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""Load-tests the core operations on 1 to 1000 simulated drives and saves the results.
+
+Each scale gets a fresh fleet of sparse MBR and GPT images (usbLock_sim)
+installed as the device backend and topology, and its own backup folder.
+Measured per scale: get_usb_drives (with --probe-latency per volume probe),
+the mountpoint -> drive number mapping, backup_partition_table,
+disable_usb_drive, enable_usb_drive and list_backups over every backup the
+run created. Results go to benchmarks/results/<label>.json; --compare
+checks them against an earlier file and flags p50 regressions.
+
+    python benchmarks/bench_suite.py --scales 1 10 100 1000 --label v1.3
+    python benchmarks/bench_suite.py --scales 10 100 --compare latest --fail-on-regression
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import usbLock_core as core
+from usbLock_sim import SimulatedFleet
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+# p50 differences below this are noise, whatever the ratio
+NOISE_MS = 0.05
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def measure(func, items):
+    """Calls func(item) for each item; returns per-call statistics in milliseconds"""
+    times = []
+    began = time.perf_counter()
+    for item in items:
+        start = time.perf_counter()
+        func(item)
+        times.append((time.perf_counter() - start) * 1000)
+    total = time.perf_counter() - began
+    times.sort()
+    return {'ops': len(times), 'total_s': round(total, 4), 'p50_ms': round(percentile(times, 0.5), 4),
+            'p95_ms': round(percentile(times, 0.95), 4), 'max_ms': round(times[-1], 4)}
+
+
+def succeeded(result):
+    success, message = result
+    if not success:
+        raise SystemExit(f"operation failed: {message}")
+    return message
+
+
+def run_scale(tmp, count, args):
+    fleet = SimulatedFleet(
+        os.path.join(tmp, "drives"), count, size=args.size * 1024 * 1024,
+        probe_latency=args.probe_latency, unresolved=count if args.probe_latency else 0,
+        query_latency=args.query_latency
+    ).create()
+    core.BACKUP_DIR = Path(tmp) / "backups"
+    results = {}
+    disabled = {}
+    with fleet:
+        volumes = fleet.enum_backend()
+        results['get_usb_drives'] = measure(lambda _: core.get_usb_drives(volumes), range(args.repeat))
+        results['drive_number'] = measure(lambda i: core.get_physical_drive_number(fleet.mountpoint(i)),
+                                          range(count))
+        results['backup_partition_table'] = measure(
+            lambda i: core.backup_partition_table(i, fleet.devices, fleet.serial(i)), range(count)
+        )
+        results['disable_usb_drive'] = measure(
+            lambda i: disabled.__setitem__(i, succeeded(core.disable_usb_drive(i, fleet.devices))[2]), range(count)
+        )
+        results['enable_usb_drive'] = measure(
+            lambda i: succeeded(core.enable_usb_drive(i, disabled[i], fleet.devices)), range(count)
+        )
+        results['list_backups'] = measure(lambda _: core.list_backups(), range(args.repeat))
+        results['list_backups']['backups'] = len(core.list_backups())
+    fleet.remove()
+    shutil.rmtree(core.BACKUP_DIR, ignore_errors=True)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def latest_result(exclude=None):
+    paths = [p for p in glob.glob(os.path.join(RESULTS_DIR, "*.json")) if p != exclude]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+def compare(current, baseline, threshold):
+    """Prints p50 changes against a baseline; returns the number of regressions"""
+    regressions = 0
+    print(f"\ncompared with {baseline.get('label')} ({baseline.get('commit')})")
+    print(f"{'scale':>6} {'case':>24} {'base p50':>10} {'p50':>10} {'change':>8}")
+    for scale, cases in current['results'].items():
+        for case, stats in cases.items():
+            base = baseline['results'].get(scale, {}).get(case)
+            if base is None:
+                continue
+            change = stats['p50_ms'] / base['p50_ms'] - 1 if base['p50_ms'] else 0.0
+            regressed = change > threshold and stats['p50_ms'] - base['p50_ms'] > NOISE_MS
+            regressions += regressed
+            print(f"{scale:>6} {case:>24} {base['p50_ms']:>10.3f} {stats['p50_ms']:>10.3f} {change:>+7.0%}"
+                  f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--size', type=int, default=64, help="image size in MiB (sparse)")
+    parser.add_argument('--probe-latency', type=float, default=0.002, help="seconds per volume label/size probe")
+    parser.add_argument('--query-latency', type=float, default=0.0, help="seconds per physical drive listing")
+    parser.add_argument('--repeat', type=int, default=5, help="runs of the enumeration and listing cases")
+    parser.add_argument('--label', help="name of the results file (default: commit and time)")
+    parser.add_argument('--compare', help="earlier results file, or 'latest'")
+    parser.add_argument('--threshold', type=float, default=0.2, help="p50 slowdown that counts as a regression")
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--dir', help="directory for the images (default: a temporary one)")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    label = args.label or f"{commit or 'run'}-{time.strftime('%Y%m%d-%H%M%S')}"
+    document = {'label': label, 'commit': commit, 'created': time.time(), 'python': platform.python_version(),
+                'platform': platform.platform(), 'args': vars(args), 'results': {}}
+
+    print(f"{'scale':>6} {'case':>24} {'ops':>6} {'total s':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for scale in args.scales:
+        with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+            results = run_scale(tmp, scale, args)
+        document['results'][str(scale)] = results
+        for case, stats in results.items():
+            print(f"{scale:>6} {case:>24} {stats['ops']:>6} {stats['total_s']:>9.3f} "
+                  f"{stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{label}.json")
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+    print(f"\nresults saved to {path}")
+
+    if args.compare:
+        baseline_path = latest_result(exclude=path) if args.compare == 'latest' else args.compare
+        if baseline_path is None:
+            print("no earlier results to compare with")
+            return
+        with open(baseline_path) as f:
+            regressions = compare(document, json.load(f), args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Measures sustained wipe throughput per device on sparse image files.
+
+Wipes --drives images of --size MiB at once through the batch pool, for
+each pass pattern and verification mode, and reports MB/s per device and
+in aggregate. Images are recreated sparse before every run.
+
+    python benchmarks/bench_wipe.py --drives 1 4 --size 512
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from usbLock_batch import BatchJob, run_batch
+from usbLock_device import ImageDevices
+from usbLock_wipe import wipe_drive
+
+CASES = (
+    (('zero',), 'none'),
+    (('zero',), 'sample'),
+    (('random',), 'none'),
+    (('random',), 'full'),
+)
+
+
+def wipe_job(drive, passes, verify, devices):
+    result = wipe_drive(drive, passes, verify, devices)
+    return result.complete and result.verified is not False, result
+
+
+def run(tmp, drives, size, passes, verify):
+    devices = ImageDevices(tmp)
+    for i in range(drives):
+        with open(devices.path(i), 'wb') as f:
+            f.truncate(size)
+    jobs = [BatchJob(i, str(i), wipe_job, (i, passes, verify, devices)) for i in range(drives)]
+    start = time.perf_counter()
+    results = run_batch(jobs, max_workers=drives)
+    elapsed = time.perf_counter() - start
+    for result in results:
+        if not result.success:
+            raise SystemExit(f"wipe of image {result.key} failed: {result.message}")
+    for i in range(drives):
+        os.remove(devices.path(i))
+    written = size * len(passes)
+    per_device = [written / r.duration / 1e6 for r in results]
+    return min(per_device), sum(per_device) / len(per_device), written * drives / elapsed / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--drives', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--size', type=int, default=512, help="image size in MiB")
+    parser.add_argument('--dir', help="directory for the images (default: a temporary one)")
+    args = parser.parse_args()
+
+    size = args.size * 1024 * 1024
+    print(f"{'drives':>6} {'passes':>8} {'verify':>7} {'min MB/s':>9} {'mean MB/s':>10} {'total MB/s':>11}")
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        for drives in args.drives:
+            for passes, verify in CASES:
+                slowest, mean, total = run(tmp, drives, size, passes, verify)
+                print(f"{drives:>6} {'+'.join(passes):>8} {verify:>7} {slowest:>9.1f} {mean:>10.1f} {total:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import usbLock_core as core
+from usbLock_sim import SimulatedFleet
+
+# Small enough to read whole images in a test, large enough for a GPT with its backup tail
+TEST_DISK_SIZE = 4 * 1024 * 1024
+
+
+@pytest.fixture
+def fleet(tmp_path, monkeypatch):
+    """Four simulated drives (0 and 2 MBR, 1 and 3 GPT) installed as the device backend,
+    with backups and the journal in a fresh folder"""
+    monkeypatch.setattr(core, 'BACKUP_DIR', Path(tmp_path) / "backups")
+    sim = SimulatedFleet(Path(tmp_path) / "drives", 4, size=TEST_DISK_SIZE).create()
+    with sim:
+        yield sim
+
+
+def read_image(fleet, drive):
+    with open(fleet.devices.path(drive), 'rb') as f:
+        return f.read()
+
+
+def write_image(fleet, drive, offset, data):
+    """Changes an image behind the backend's back, as a crash or another program would"""
+    with open(fleet.devices.path(drive), 'r+b') as f:
+        f.seek(offset)
+        f.write(data)
+
+
+def open_intents():
+    """The journal's open intents; end records are not synced on their own, so flush first"""
+    journal = core.get_journal(core.BACKUP_DIR)
+    journal.flush()
+    return journal.open_intents()
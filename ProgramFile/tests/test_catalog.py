@@ -0,0 +1,61 @@
+import os
+
+from usbLock_catalog import BackupCatalog
+from usbLock_store import BackupStore
+
+
+def sector(fill):
+    return bytes([fill]) * 512
+
+
+def test_rescan_adopts_references_and_legacy_files(tmp_path):
+    store = BackupStore(tmp_path)
+    ref = store.write_reference("usb_backup_drive2_1700000000", sector(1), drive='2', serial='ABC',
+                                disk_size=1 << 20, created=1700000000.5)
+    legacy = tmp_path / "usb_backup_drive3_1600000000.bin"
+    legacy.write_bytes(sector(2))
+    (tmp_path / "notes.txt").write_text("not a backup")
+
+    catalog = BackupCatalog(tmp_path)
+    try:
+        assert catalog.rescan() == (2, 0)
+        newest, oldest = catalog.entries()
+        assert (newest.serial, newest.disk_size, newest.created) == ('ABC', 1 << 20, 1700000000.5)
+        assert os.path.normpath(str(ref)) == newest.path
+        # A legacy file only has what its name tells
+        assert (oldest.drive, oldest.serial, oldest.created) == ('3', None, 1600000000.0)
+        # Nothing changed, nothing is read again
+        assert catalog.rescan() == (0, 0)
+    finally:
+        catalog.close()
+
+
+def test_rescan_drops_rows_of_deleted_files(tmp_path):
+    legacy = tmp_path / "usb_backup_drive1_1600000000.bin"
+    legacy.write_bytes(sector(3))
+    catalog = BackupCatalog(tmp_path)
+    try:
+        catalog.rescan()
+        legacy.unlink()
+        assert catalog.rescan() == (0, 1)
+        assert catalog.entries() == []
+    finally:
+        catalog.close()
+
+
+def test_entries_filter_and_latest(tmp_path):
+    catalog = BackupCatalog(tmp_path)
+    try:
+        for n, (drive, serial) in enumerate([('1', 'A'), ('1', 'A'), ('2', 'B')]):
+            path = tmp_path / f"usb_backup_drive{drive}_{1000 + n}.bin"
+            path.write_bytes(sector(n))
+            catalog.record(path, sector(n), drive=drive, serial=serial, created=1000 + n)
+        assert [e.created for e in catalog.entries(serial='A')] == [1001, 1000]
+        assert [e.serial for e in catalog.entries(drive=2)] == ['B']
+        assert len(catalog.entries(since=1001)) == 2
+        assert catalog.latest(serial='A').created == 1001
+        assert catalog.latest(serial='missing') is None
+        catalog.forget(tmp_path / "usb_backup_drive2_1002.bin")
+        assert catalog.entries(serial='B') == []
+    finally:
+        catalog.close()
@@ -0,0 +1,36 @@
+import usbLock_core as core
+from usbLock_cli import EXIT_OK, Output, build_parser
+from usbLock_sim import make_gpt_image
+
+from conftest import read_image, write_image
+
+
+def enable(argv):
+    args = build_parser().parse_args(['enable'] + argv)
+    out = Output(ndjson=False)
+    return args.func(args, out), out.records
+
+
+def test_enable_chooses_the_best_match_or_the_newest_backup(fleet):
+    # Backed up, then reformatted and backed up again, then the first layout restored and disabled
+    matching = core.backup_partition_table(1, fleet.devices, fleet.serial(1))
+    original = read_image(fleet, 1)
+    make_gpt_image(fleet.devices.path(1), len(original))
+    newest = core.backup_partition_table(1, fleet.devices, fleet.serial(1))
+    assert core.enable_usb_drive(1, matching, fleet.devices)[0]
+    write_image(fleet, 1, 0, bytes(512))
+    assert core.list_backups(serial=fleet.serial(1))[0].path == newest
+
+    assert core.best_backup_for_drive(1, fleet.serial(1), fleet.devices) == matching
+    status, records = enable(['1'])
+    assert status == EXIT_OK and records[0]['details'][-1] == matching
+    assert read_image(fleet, 1) == original
+
+    write_image(fleet, 1, 0, bytes(512))
+    status, records = enable(['1', '--latest'])
+    assert status == EXIT_OK and records[0]['details'][-1] == newest
+
+
+def test_enable_without_drives_is_a_usage_error(fleet):
+    status, records = enable([])
+    assert status != EXIT_OK and records[0]['message'] == 'no_drives_given'
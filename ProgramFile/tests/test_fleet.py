@@ -0,0 +1,116 @@
+import socket
+import threading
+
+import pytest
+
+import usbLock_core as core
+from usbLock_agent import INVALID_PARAMS, METHOD_NOT_FOUND, PARSE_ERROR, Agent, AgentServer
+from usbLock_fleet import load_hosts, parse_host, run_fleet
+
+
+@pytest.fixture
+def serve(fleet):
+    """Starts agents over the simulated drives; yields a function returning (host, port)"""
+    servers = []
+
+    def start(token=None):
+        server = AgentServer(Agent(fleet.devices, workers=2), '127.0.0.1', 0, token)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server.server_address[:2]
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def call(hosts, method, params=None, **options):
+    return {r.host: r for r in run_fleet(hosts, method, params, **options)}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_parse_host():
+    assert parse_host("10.0.0.5") == ("10.0.0.5", 8765)
+    assert parse_host(" pc-12:9000 ") == ("pc-12", 9000)
+    assert parse_host("[fe80::1]:9000") == ("fe80::1", 9000)
+    with pytest.raises(ValueError):
+        parse_host(":9000")
+
+
+def test_load_hosts_skips_comments_and_duplicates(tmp_path):
+    hosts = tmp_path / "hosts.txt"
+    hosts.write_text("# lab\npc-1\npc-2:9000  # second\n\npc-1:8765\n")
+    assert load_hosts(str(hosts)) == [("pc-1", 8765), ("pc-2", 9000)]
+    assert load_hosts("pc-1,pc-2") == [("pc-1", 8765), ("pc-2", 8765)]
+
+
+def test_lock_then_unlock_across_agents(fleet, serve):
+    hosts = [serve(), serve()]
+    (result,) = call(hosts[:1], 'lock', {'allow': [fleet.serial(0).lower()]}).values()
+    assert result.success
+    locked = {d['serial'] for d in result.result['drives'] if d['success']}
+    assert locked == {fleet.serial(i) for i in (1, 2, 3)}
+    assert not core.is_drive_disabled(0, fleet.devices)
+
+    # Both agents see the same drives: the second finds them already locked
+    (again,) = call(hosts[1:], 'lock', {'allow': [fleet.serial(0)]}).values()
+    assert {d['message'] for d in again.result['drives']} == {'already_disabled'}
+
+    (unlocked,) = call(hosts[:1], 'unlock', {'serials': sorted(locked)}).values()
+    assert all(d['success'] for d in unlocked.result['drives'])
+    assert not any(core.is_drive_disabled(i, fleet.devices) for i in range(fleet.count))
+
+
+def test_agent_errors_come_back_per_host(serve):
+    host = serve()
+    (unknown,) = call([host], 'format').values()
+    assert not unknown.success and "Unknown method" in unknown.error
+    (bad,) = call([host], 'unlock', {'serials': 'SIM00001'}).values()
+    assert not bad.success and "'serials' must be a list" in bad.error
+    (bad_kind,) = call([host], 'list', {'kind': 'everything'}).values()
+    assert not bad_kind.success
+
+
+def test_token_is_required_when_set(serve):
+    host = serve(token="s3cret")
+    (refused,) = call([host], 'info').values()
+    assert not refused.success and "HTTP 401" in refused.error
+    (accepted,) = call([host], 'info', token="s3cret").values()
+    assert accepted.success and accepted.result['drives'] == 4
+
+
+def test_unreachable_and_silent_agents_fail_alone(serve):
+    good = serve()
+    silent = socket.socket()
+    silent.bind(('127.0.0.1', 0))
+    # Connections queue in the backlog but nobody ever answers
+    silent.listen()
+    try:
+        results = call([good, ('127.0.0.1', free_port()), silent.getsockname()], 'info', timeout=0.5)
+    finally:
+        silent.close()
+    assert [r.success for r in results.values()].count(True) == 1
+    assert any("no answer within" in (r.error or '') for r in results.values())
+
+
+def test_dispatch_rejects_malformed_requests(fleet):
+    server = AgentServer(Agent(fleet.devices), '127.0.0.1', 0)
+    try:
+        assert server.dispatch(b'{not json', 'test')['error']['code'] == PARSE_ERROR
+        response = server.dispatch(b'{"jsonrpc": "2.0", "id": 1, "method": "nope"}', 'test')
+        assert response['error']['code'] == METHOD_NOT_FOUND
+        response = server.dispatch(b'{"jsonrpc": "2.0", "id": 2, "method": "list", "params": []}', 'test')
+        assert response['id'] == 2 and response['error']['code'] == INVALID_PARAMS
+    finally:
+        server.server_close()
+
+
+def test_agent_refuses_a_public_address_without_a_token(fleet):
+    with pytest.raises(ValueError):
+        AgentServer(Agent(fleet.devices), '0.0.0.0', 0)
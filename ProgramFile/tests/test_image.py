@@ -0,0 +1,66 @@
+import hashlib
+import os
+import threading
+
+import pytest
+
+import usbLock_core as core
+import usbLock_image
+from usbLock_image import ImagingError, checkpoint_path, create_image, read_checkpoint
+
+from conftest import read_image, write_image
+
+
+def test_image_is_an_exact_copy_with_its_hash(fleet, tmp_path):
+    write_image(fleet, 0, 2 * 1024 * 1024, os.urandom(4096))
+    original = read_image(fleet, 0)
+    image = tmp_path / "stick.img"
+    success, message = core.image_usb_drive(0, str(image), fleet.devices)
+    assert success and message[0] == 'image_success'
+    digest = hashlib.sha256(original).hexdigest()
+    assert image.read_bytes() == original and message[3] == digest
+    assert (tmp_path / "stick.img.sha256").read_text() == f"{digest} *stick.img\n"
+    assert not os.path.exists(checkpoint_path(str(image)))
+
+
+def test_interrupted_image_resumes_from_its_checkpoint(fleet, tmp_path, monkeypatch):
+    monkeypatch.setattr(usbLock_image, 'IMAGE_CHUNK', 64 * 1024)
+    monkeypatch.setattr(usbLock_image, 'CHECKPOINT_INTERVAL', 256 * 1024)
+    monkeypatch.setattr(usbLock_image, 'PROGRESS_INTERVAL', 0)
+    write_image(fleet, 1, 1024 * 1024, os.urandom(64 * 1024))
+    image = str(tmp_path / "stick.img")
+    cancel = threading.Event()
+
+    def stop_half_way(progress):
+        if progress.done >= progress.total // 2:
+            cancel.set()
+
+    first = create_image(1, image, fleet.devices, stop_half_way, cancel)
+    assert not first.complete and first.sha256 is None
+    assert read_checkpoint(image)['offset'] > 0
+
+    second = create_image(1, image, fleet.devices)
+    assert second.complete and second.resumed_from > 0
+    assert second.sha256 == hashlib.sha256(read_image(fleet, 1)).hexdigest()
+    with open(image, 'rb') as f:
+        assert f.read() == read_image(fleet, 1)
+
+
+def test_checkpoint_of_another_disk_is_ignored(fleet, tmp_path, monkeypatch):
+    monkeypatch.setattr(usbLock_image, 'IMAGE_CHUNK', 64 * 1024)
+    monkeypatch.setattr(usbLock_image, 'CHECKPOINT_INTERVAL', 256 * 1024)
+    monkeypatch.setattr(usbLock_image, 'PROGRESS_INTERVAL', 0)
+    image = str(tmp_path / "stick.img")
+    cancel = threading.Event()
+    create_image(2, image, fleet.devices, lambda p: cancel.set(), cancel)
+    result = create_image(3, image, fleet.devices)
+    assert result.complete and result.resumed_from == 0
+    assert result.sha256 == hashlib.sha256(read_image(fleet, 3)).hexdigest()
+
+
+def test_zero_size_drive_is_not_imaged(fleet, tmp_path):
+    open(fleet.devices.path(2), 'wb').close()
+    with pytest.raises(ImagingError):
+        create_image(2, str(tmp_path / "empty.img"), fleet.devices)
+    success, message = core.image_usb_drive(2, str(tmp_path / "empty.img"), fleet.devices)
+    assert not success and message[0] == 'error_image'
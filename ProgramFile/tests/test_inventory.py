@@ -0,0 +1,104 @@
+from usbLock_device import DeviceBackend
+from usbLock_enum import make_drive
+from usbLock_hotplug import HotplugEvent
+from usbLock_inventory import Inventory
+
+
+class FakeDevices(DeviceBackend):
+    """Linux-style names: a volume maps to /dev/<disk> while it exists"""
+
+    def __init__(self, volumes):
+        self.present = dict(volumes)
+
+    def disk_for_device(self, name):
+        return self.present.get(name)
+
+
+class FakeDrives:
+    """What a full scan and the per-device probe would list"""
+
+    def __init__(self, devices, *volumes):
+        self.devices = devices
+        self.volumes = {}
+        for volume, disk in volumes:
+            self.plug(volume, disk)
+
+    def plug(self, volume, disk):
+        self.volumes[volume] = disk
+        self.devices.present[volume] = disk
+
+    def pull(self, disk):
+        for volume in [v for v, d in self.volumes.items() if d == disk]:
+            del self.volumes[volume]
+            # Gone from sysfs: the backend cannot place it any more
+            del self.devices.present[volume]
+
+    def scan(self):
+        # Backends list in their own order; reversed here so the inventory has to sort
+        return [make_drive(f"/dev/{v}", f"/media/{v}", 'vfat', 1 << 20, v) for v in reversed(list(self.volumes))]
+
+    def probe(self, device):
+        return [item for item in self.scan() if self.volumes[item['label']] == f"/dev/{device}"
+                or item['label'] == device]
+
+
+def make_inventory(*volumes):
+    devices = FakeDevices({})
+    drives = FakeDrives(devices, *volumes)
+    inventory = Inventory(drives.scan, list, load_device=drives.probe, devices=devices)
+    return inventory, drives
+
+
+def names(snapshot):
+    return [r.device[5:] for r in snapshot.records]
+
+
+def test_listing_is_in_natural_device_order():
+    inventory, _ = make_inventory(('sdb10', '/dev/sdb'), ('sdb2', '/dev/sdb'), ('sdb1', '/dev/sdb'),
+                                  ('nvme0n1p1', '/dev/nvme0n1'))
+    assert names(inventory.volumes()) == ['nvme0n1p1', 'sdb1', 'sdb2', 'sdb10']
+
+
+def test_removing_a_disk_drops_only_its_own_volumes():
+    inventory, drives = make_inventory(('mmcblk1p1', '/dev/mmcblk1'), ('mmcblk10p1', '/dev/mmcblk10'),
+                                       ('nvme0n1p1', '/dev/nvme0n1'), ('sdb1', '/dev/sdb'), ('sdc', '/dev/sdc'))
+    inventory.volumes()
+    drives.pull('/dev/mmcblk1')
+    snapshot = inventory.apply_event(HotplugEvent('remove', 'mmcblk1', 0.0))
+    assert names(snapshot) == ['mmcblk10p1', 'nvme0n1p1', 'sdb1', 'sdc']
+    drives.pull('/dev/nvme0n1')
+    snapshot = inventory.apply_event(HotplugEvent('remove', 'nvme0n1', 0.0))
+    assert names(snapshot) == ['mmcblk10p1', 'sdb1', 'sdc']
+    # A filesystem on the whole disk goes with its own name
+    drives.pull('/dev/sdc')
+    snapshot = inventory.apply_event(HotplugEvent('remove', 'sdc', 0.0))
+    assert names(snapshot) == ['mmcblk10p1', 'sdb1']
+
+
+def test_unmount_drops_one_volume():
+    inventory, _ = make_inventory(('sdb1', '/dev/sdb'), ('sdb2', '/dev/sdb'))
+    inventory.volumes()
+    snapshot = inventory.apply_event(HotplugEvent('unmount', 'sdb1', 0.0))
+    assert names(snapshot) == ['sdb2']
+
+
+def test_incremental_updates_agree_with_a_full_scan():
+    inventory, drives = make_inventory(('sdb1', '/dev/sdb'), ('sdd1', '/dev/sdd'))
+    inventory.volumes()
+    drives.plug('sdc2', '/dev/sdc')
+    drives.plug('sdc10', '/dev/sdc')
+    updated = inventory.apply_event(HotplugEvent('add', 'sdc', 0.0))
+    drives.pull('/dev/sdb')
+    updated = inventory.apply_event(HotplugEvent('remove', 'sdb', 0.0))
+    inventory.invalidate()
+    rescanned = inventory.volumes()
+    assert updated.records == rescanned.records
+    assert names(rescanned) == ['sdc2', 'sdc10', 'sdd1']
+    # The added volumes were placed on their disk, so pulling it clears them again
+    drives.pull('/dev/sdc')
+    assert names(inventory.apply_event(HotplugEvent('remove', 'sdc', 0.0))) == ['sdd1']
+
+
+def test_without_a_cached_listing_events_invalidate():
+    inventory, _ = make_inventory(('sdb1', '/dev/sdb'))
+    assert inventory.apply_event(HotplugEvent('add', 'sdb', 0.0)) is None
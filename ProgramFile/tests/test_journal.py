@@ -0,0 +1,76 @@
+import os
+import threading
+import time
+
+import usbLock_journal
+from usbLock_journal import Journal, digest
+
+
+def begin(journal, drive):
+    return journal.begin('disable', drive, f'SIM{drive:05d}', [[0, 512]], digest([b'a']), digest([b'b']), None)
+
+
+def test_done_and_aborted_close_intents(tmp_path):
+    journal = Journal(tmp_path / "journal.jsonl")
+    first, second, third = (begin(journal, n) for n in range(3))
+    journal.end(first)
+    journal.end(second, 'aborted', error="write failed")
+    journal.flush()
+    (still_open,) = journal.open_intents()
+    assert still_open.id == third.id and still_open.regions == [[0, 512]]
+    journal.close()
+
+
+def test_torn_tail_is_ignored(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = Journal(path)
+    intent = begin(journal, 1)
+    journal.close()
+    # An append cut short by a crash, and one whose bytes were damaged
+    with open(path, 'ab') as f:
+        f.write(b'0badc0de {"id": "x", "type": "intent"}\n')
+        f.write(b'1234abcd {"id": "y", "ty')
+    assert [i.id for i in Journal(path).open_intents()] == [intent.id]
+
+
+def test_concurrent_appends_share_syncs(tmp_path, monkeypatch):
+    fsync = os.fsync
+
+    def slow_fsync(fd):
+        # Gives the other writers time to queue behind the sync in progress
+        time.sleep(0.005)
+        fsync(fd)
+
+    monkeypatch.setattr(usbLock_journal.os, 'fsync', slow_fsync)
+    journal = Journal(tmp_path / "journal.jsonl")
+    start = threading.Barrier(16)
+
+    def worker(drive):
+        start.wait()
+        for _ in range(10):
+            begin(journal, drive)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert journal.records == 160
+    assert journal.fsyncs < journal.records // 2
+    assert len(journal.open_intents()) == 160
+    journal.close()
+
+
+def test_compact_keeps_only_open_intents(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = Journal(path)
+    done = begin(journal, 1)
+    kept = begin(journal, 2)
+    journal.end(done)
+    journal.compact()
+    assert len(journal.read()) == 1
+    # The journal reopens its file after the rename
+    journal.end(kept)
+    journal.flush()
+    assert journal.open_intents() == []
+    journal.close()
@@ -0,0 +1,49 @@
+import usbLock_core as core
+from usbLock_match import MATCH_THRESHOLD, rank_backups, read_target_metadata, suggest_backup
+
+from conftest import TEST_DISK_SIZE
+
+
+def disable_all(fleet):
+    backups = {}
+    for drive in range(fleet.count):
+        success, message = core.disable_usb_drive(drive, fleet.devices)
+        assert success
+        backups[drive] = message[2]
+    return backups
+
+
+def test_target_size_comes_from_the_backend(fleet):
+    asked = []
+    real = fleet.devices.disk_size
+    fleet.devices.disk_size = lambda drive: asked.append(drive) or real(drive)
+    target = read_target_metadata(1, devices=fleet.devices)
+    assert asked == [1]
+    assert target.disk_size == TEST_DISK_SIZE
+    assert target.backup_gpt is not None and target.backup_gpt.crc_valid
+
+
+def test_gpt_drive_matches_its_own_backup(fleet):
+    backups = disable_all(fleet)
+    matches = rank_backups(1, core.list_backups(), fleet.devices)
+    best = matches[0]
+    assert best.entry.path == backups[1]
+    assert "GPT disk GUID matches backup header" in best.reasons
+    assert "serial matches" in best.reasons
+    # The other GPT drive's backup has a different GUID and serial
+    other = next(m for m in matches if m.entry.path == backups[3])
+    assert "GPT disk GUID differs" in other.reasons and other.score < 0
+
+
+def test_mbr_drive_matches_its_own_backup(fleet):
+    backups = disable_all(fleet)
+    match = suggest_backup(2, core.list_backups(), fleet.devices)
+    assert match.entry.path == backups[2] and match.score >= MATCH_THRESHOLD
+    assert "disk size matches" in match.reasons
+
+
+def test_no_suggestion_without_the_serial_or_the_disk(fleet):
+    disable_all(fleet)
+    # A stick whose serial cannot be read and whose disk tells nothing apart
+    entries = [e for e in core.list_backups() if e.serial == fleet.serial(0)]
+    assert suggest_backup(2, entries, fleet.devices, serial="Unknown") is None
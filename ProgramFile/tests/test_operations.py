@@ -0,0 +1,43 @@
+import pytest
+
+import usbLock_core as core
+from usbLock_partition import disk_identity
+from usbLock_wipe import WipeError, wipe_drive
+
+from conftest import open_intents, read_image
+
+
+@pytest.mark.parametrize('drive', [0, 1], ids=['mbr', 'gpt'])
+def test_disable_then_enable_restores_identical_bytes(fleet, drive):
+    original = read_image(fleet, drive)
+
+    success, message = core.disable_usb_drive(drive, fleet.devices)
+    assert success and message[0] == 'disable_success'
+    assert core.is_drive_disabled(drive, fleet.devices)
+    assert disk_identity(read_image(fleet, drive)) is None
+
+    success, message = core.enable_usb_drive(drive, message[2], fleet.devices)
+    assert success and message[0] == 'enable_success'
+    assert not core.is_drive_disabled(drive, fleet.devices)
+    assert read_image(fleet, drive) == original
+
+
+def test_enable_picks_the_backup_of_the_same_disk(fleet):
+    success, message = core.disable_usb_drive(1, fleet.devices)
+    assert success
+    assert core.best_backup_for_drive(1, fleet.serial(1), fleet.devices) == message[2]
+    assert open_intents() == []
+
+
+def test_wipe_refuses_a_zero_size_drive(fleet):
+    open(fleet.devices.path(2), 'wb').close()
+    with pytest.raises(WipeError):
+        wipe_drive(2, devices=fleet.devices)
+    success, message = core.wipe_usb_drive(2, devices=fleet.devices)
+    assert not success and message[0] == 'error_wipe'
+
+
+def test_wipe_zeroes_and_verifies(fleet):
+    success, message = core.wipe_usb_drive(0, devices=fleet.devices)
+    assert success, message
+    assert not read_image(fleet, 0).strip(b'\0')
@@ -0,0 +1,50 @@
+import uuid
+
+from usbLock_partition import SECTOR_SIZE, disk_identity, parse_gpt_entries, parse_gpt_header, parse_mbr
+from usbLock_sim import make_gpt_image, make_mbr_image
+
+from conftest import TEST_DISK_SIZE
+
+
+def _head(path, length=34 * SECTOR_SIZE):
+    with open(path, 'rb') as f:
+        return f.read(length)
+
+
+def test_mbr_round_trip(tmp_path):
+    path = tmp_path / "mbr.img"
+    make_mbr_image(str(path), TEST_DISK_SIZE)
+    mbr = parse_mbr(_head(path))
+    assert mbr.valid and not mbr.protective
+    (partition,) = [p for p in mbr.partitions if p.type]
+    assert partition.type == 0x0C
+    assert partition.lba_start + partition.sectors == TEST_DISK_SIZE // SECTOR_SIZE
+    assert disk_identity(_head(path)) == f"mbr:{mbr.signature:08x}"
+
+
+def test_gpt_round_trip(tmp_path):
+    path = tmp_path / "gpt.img"
+    make_gpt_image(str(path), TEST_DISK_SIZE)
+    head = _head(path)
+    assert parse_mbr(head).protective
+    header = parse_gpt_header(head, SECTOR_SIZE)
+    last_lba = TEST_DISK_SIZE // SECTOR_SIZE - 1
+    assert header.crc_valid
+    assert (header.current_lba, header.backup_lba, header.entries_lba) == (1, last_lba, 2)
+    entries, entries_valid = parse_gpt_entries(head, header, header.entries_lba * SECTOR_SIZE)
+    assert entries_valid
+    (entry,) = entries
+    assert entry.first_lba == 2048
+    assert entry.type_guid == uuid.UUID('EBD0A0A2-B9E5-4433-87C0-68B6B72699C7')
+    assert disk_identity(head) == f"gpt:{header.disk_guid}"
+
+    with open(path, 'rb') as f:
+        f.seek(last_lba * SECTOR_SIZE)
+        backup = parse_gpt_header(f.read(SECTOR_SIZE))
+    assert backup.crc_valid
+    assert (backup.current_lba, backup.backup_lba, backup.disk_guid) == (last_lba, 1, header.disk_guid)
+
+
+def test_blank_sector_has_no_identity():
+    assert not parse_mbr(bytes(SECTOR_SIZE)).valid
+    assert disk_identity(bytes(SECTOR_SIZE)) is None
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+import usbLock_core as core
+from usbLock_hotplug import HotplugEvent, HotplugSource, HotplugWatcher
+from usbLock_policy import ALLOW, LOCK, PolicyDaemon, SerialPolicy, parse_policy, verdict
+from usbLock_sim import make_mbr_image
+
+from conftest import TEST_DISK_SIZE
+
+POLICY = """
+# office sticks
+sim00000
+allow  SIM00001   # trailing comment
+deny SIM00001
+deny sim00002
+"""
+
+
+def test_parse_policy():
+    allowed, denied = parse_policy(POLICY)
+    assert allowed == frozenset({'SIM00000', 'SIM00001'})
+    assert denied == frozenset({'SIM00001', 'SIM00002'})
+
+
+def test_empty_policy_allows_nothing():
+    assert parse_policy("\n# nothing\n") == (frozenset(), frozenset())
+
+
+def test_verdict():
+    allowed, denied = parse_policy(POLICY)
+    assert verdict('SIM00000', allowed, denied) == ALLOW
+    assert verdict(' sim00000 ', allowed, denied) == ALLOW
+    # deny wins over allow
+    assert verdict('SIM00001', allowed, denied) == LOCK
+    assert verdict('SIM00002', allowed, denied) == LOCK
+    assert verdict('SIM00003', allowed, denied) == LOCK
+
+
+def test_drives_without_a_serial_are_locked():
+    allowed = frozenset({'UNKNOWN', ''})
+    for serial in (None, '', 'Unknown'):
+        assert verdict(serial, allowed, frozenset()) == LOCK
+
+
+class IdleSource(HotplugSource):
+    """Emits nothing; the tests hand events to the daemon themselves"""
+    name = 'idle'
+
+    def run(self, emit, stop):
+        stop.wait()
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def daemon(fleet, tmp_path):
+    policy_file = tmp_path / "allowed.txt"
+    policy_file.write_text(f"{fleet.serial(0)}\n")
+    daemon = PolicyDaemon(SerialPolicy(policy_file), fleet.devices, watcher=HotplugWatcher(IdleSource()))
+    yield daemon
+    daemon.stop()
+
+
+def test_sweep_locks_every_drive_not_allowed(fleet, daemon):
+    daemon.start(sweep=True)
+    wait_for(lambda: len(daemon.decisions) == fleet.count)
+    outcomes = {d.drive: d.outcome for d in daemon.decisions}
+    assert outcomes == {0: 'allowed', 1: 'locked', 2: 'locked', 3: 'locked'}
+    assert not core.is_drive_disabled(0, fleet.devices)
+    assert all(core.is_drive_disabled(i, fleet.devices) for i in (1, 2, 3))
+
+
+def test_stick_plugged_into_a_swept_port_is_locked(fleet, daemon):
+    daemon.start(sweep=True)
+    wait_for(lambda: len(daemon.decisions) == fleet.count)
+    # A repeated arrival of a drive already decided is not checked again
+    daemon.on_event(HotplugEvent('add', 'drive2', time.monotonic()))
+
+    daemon.on_event(HotplugEvent('remove', 'drive1', time.monotonic()))
+    make_mbr_image(fleet.devices.path(1), TEST_DISK_SIZE)
+    (fleet.directory / "drive1.serial").write_text("STRANGER")
+    daemon.on_event(HotplugEvent('add', 'drive1', time.monotonic()))
+    wait_for(lambda: len(daemon.decisions) == fleet.count + 1)
+    assert daemon.decisions[-1][:4] == (1, 'STRANGER', LOCK, 'locked')
+    assert core.is_drive_disabled(1, fleet.devices)
@@ -0,0 +1,142 @@
+import os
+
+import pytest
+
+import usbLock_core as core
+from usbLock_journal import ABORTED, DONE
+from usbLock_metadata import clear_boot_sector, restore_metadata
+from usbLock_sim import make_mbr_image
+from usbLock_store import load_backup
+
+from conftest import open_intents, read_image, write_image
+
+
+class Crash(Exception):
+    """Stands in for the process dying between journaling a write and finishing it"""
+
+
+def crash_after(hook, then=None):
+    """Wraps a _journaled hook so the intent is written, `then` runs, and the operation dies"""
+    def before_write(disk, writes):
+        hook(disk, writes)
+        if then:
+            then(writes)
+        raise Crash()
+    return before_write
+
+
+def crashed_disable(fleet, drive, serial, then=None):
+    """Backs up a drive and journals a disable that never finishes; returns the backup"""
+    backup = core.backup_partition_table(drive, fleet.devices, serial)
+    hook = core._journaled('disable', drive, serial, backup, [])
+    with pytest.raises(Crash):
+        clear_boot_sector(drive, fleet.devices, True, crash_after(hook, then))
+    return backup
+
+
+def crashed_enable(fleet, drive, then=None):
+    """Disables a drive, then journals an enable that never finishes"""
+    success, message = core.disable_usb_drive(drive, fleet.devices)
+    assert success
+    backup = message[2]
+    data, ref = load_backup(backup)
+    hook = core._journaled('enable', drive, fleet.serial(drive), backup, [])
+    with pytest.raises(Crash):
+        restore_metadata(drive, data, ref.get('layout'), fleet.devices, True, crash_after(hook, then))
+
+
+def recover_one(fleet):
+    (recovery,) = core.recover_operations(fleet.devices)
+    return recovery
+
+
+def test_nothing_to_recover(fleet):
+    assert core.recover_operations(fleet.devices) == []
+
+
+def test_disable_that_never_wrote_is_aborted(fleet):
+    original = read_image(fleet, 0)
+    crashed_disable(fleet, 0, fleet.serial(0))
+    recovery = recover_one(fleet)
+    assert (recovery.op, recovery.outcome, recovery.detail) == ('disable', ABORTED, 'not_started')
+    assert read_image(fleet, 0) == original
+    assert open_intents() == []
+
+
+def test_torn_disable_is_rolled_back(fleet):
+    original = read_image(fleet, 0)
+    # The write stopped inside the partition table: the disk signature is gone, the entries are not
+    crashed_disable(fleet, 0, fleet.serial(0), lambda writes: write_image(fleet, 0, 0, bytes(448)))
+    assert read_image(fleet, 0) != original
+    recovery = recover_one(fleet)
+    assert (recovery.outcome, recovery.detail) == (ABORTED, 'rolled_back')
+    assert read_image(fleet, 0) == original
+    assert open_intents() == []
+
+
+def test_disable_on_a_repartitioned_disk_stays_open(fleet, tmp_path):
+    crashed_disable(fleet, 0, fleet.serial(0))
+    # Reformatted after the crash: a new partition table with its own disk signature
+    make_mbr_image(str(tmp_path / "new.img"), 1024 * 1024)
+    write_image(fleet, 0, 0, (tmp_path / "new.img").read_bytes()[:512])
+    changed = read_image(fleet, 0)
+    recovery = recover_one(fleet)
+    assert (recovery.op, recovery.outcome, recovery.detail) == ('disable', None, 'changed_externally')
+    assert read_image(fleet, 0) == changed
+    assert len(open_intents()) == 1
+
+
+def test_finished_disable_is_completed(fleet):
+    crashed_disable(fleet, 2, fleet.serial(2), lambda writes: write_image(fleet, 2, 0, bytes(512)))
+    recovery = recover_one(fleet)
+    assert (recovery.outcome, recovery.detail) == (DONE, 'completed')
+    assert core.is_drive_disabled(2, fleet.devices)
+
+
+def test_interrupted_enable_is_rolled_forward(fleet):
+    original = read_image(fleet, 1)
+    # The GPT's backup header at the end is written first; LBA 0 never was
+    crashed_enable(fleet, 1, lambda writes: write_image(fleet, 1, *writes[0]))
+    assert core.is_drive_disabled(1, fleet.devices)
+    recovery = recover_one(fleet)
+    assert (recovery.op, recovery.outcome, recovery.detail) == ('enable', DONE, 'rolled_forward')
+    assert read_image(fleet, 1) == original
+    assert open_intents() == []
+
+
+def test_enable_on_a_rewritten_disk_stays_open(fleet):
+    crashed_enable(fleet, 0)
+    write_image(fleet, 0, 0, os.urandom(512))
+    changed = read_image(fleet, 0)
+    recovery = recover_one(fleet)
+    assert (recovery.outcome, recovery.detail) == (None, 'changed_externally')
+    assert read_image(fleet, 0) == changed
+    assert len(open_intents()) == 1
+
+
+def test_missing_drive_stays_open(fleet):
+    crashed_disable(fleet, 3, fleet.serial(3))
+    os.remove(fleet.devices.path(3))
+    recovery = recover_one(fleet)
+    assert (recovery.outcome, recovery.detail) == (None, 'drive_missing')
+    assert len(open_intents()) == 1
+
+
+def test_serial_less_intent_needs_the_same_content(fleet):
+    crashed_disable(fleet, 0, None)
+    # Another disk now answers to drive 0: neither the pre- nor the post-image
+    write_image(fleet, 0, 0, os.urandom(512))
+    changed = read_image(fleet, 0)
+    recovery = recover_one(fleet)
+    assert (recovery.serial, recovery.outcome, recovery.detail) == (None, None, 'drive_unverified')
+    assert read_image(fleet, 0) == changed
+    assert len(open_intents()) == 1
+
+
+def test_serial_less_intent_on_an_unchanged_disk_is_closed(fleet):
+    original = read_image(fleet, 0)
+    crashed_disable(fleet, 0, "Unknown")
+    recovery = recover_one(fleet)
+    assert (recovery.outcome, recovery.detail) == (ABORTED, 'not_started')
+    assert read_image(fleet, 0) == original
+    assert open_intents() == []
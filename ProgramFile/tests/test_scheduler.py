@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pytest
+
+from usbLock_scheduler import BULK, METADATA, IOScheduler
+from usbLock_sim import SimulatedFleet
+
+
+def sim_bus(count=8, hub_ports=4, controller_hubs=2):
+    """Drives 0-3 share one hub, 4-7 the next, both hubs one controller"""
+    return SimulatedFleet('.', count, hub_ports=hub_ports, controller_hubs=controller_hubs).bus_source()
+
+
+class Holder:
+    """Holds a scheduler slot on another thread until released"""
+
+    def __init__(self, scheduler, drive, priority=METADATA):
+        self.granted = threading.Event()
+        self.release = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(scheduler, drive, priority), daemon=True)
+        self.thread.start()
+
+    def _run(self, scheduler, drive, priority):
+        with scheduler.slot(drive, priority):
+            self.granted.set()
+            self.release.wait(10)
+
+    def done(self):
+        self.release.set()
+        self.thread.join(10)
+
+
+def settle():
+    time.sleep(0.05)
+
+
+@pytest.mark.parametrize('slots', [dict(hub_slots=1), dict(controller_slots=1), dict(hub_slots=0)])
+def test_single_slot_limits_are_refused(slots):
+    with pytest.raises(ValueError):
+        IOScheduler(sim_bus(), **slots)
+
+
+def test_hub_limit_queues_the_third_drive():
+    scheduler = IOScheduler(sim_bus(), hub_slots=2, controller_slots=4)
+    first, second = Holder(scheduler, 0), Holder(scheduler, 1)
+    assert first.granted.wait(5) and second.granted.wait(5)
+    third = Holder(scheduler, 2)
+    # A drive behind the other hub is not held up
+    other_hub = Holder(scheduler, 4)
+    assert other_hub.granted.wait(5)
+    settle()
+    assert not third.granted.is_set()
+    assert scheduler.stats()['queued'] == 1
+    first.done()
+    assert third.granted.wait(5)
+    for holder in (second, third, other_hub):
+        holder.done()
+    assert scheduler.stats() == {'queued': 0, 'in_flight': 0, 'hubs': {}}
+
+
+def test_bulk_jobs_leave_a_slot_for_metadata():
+    scheduler = IOScheduler(sim_bus(), hub_slots=2, controller_slots=4)
+    image = Holder(scheduler, 0, BULK)
+    assert image.granted.wait(5)
+    wipe = Holder(scheduler, 1, BULK)
+    settle()
+    assert not wipe.granted.is_set()
+    disable = Holder(scheduler, 2, METADATA)
+    assert disable.granted.wait(5)
+    disable.done()
+    image.done()
+    assert wipe.granted.wait(5)
+    wipe.done()
+
+
+def test_slots_are_reentrant_per_thread():
+    scheduler = IOScheduler(sim_bus(), hub_slots=2, controller_slots=2)
+    with scheduler.slot(0):
+        with scheduler.slot(0):
+            assert scheduler.stats()['in_flight'] == 1
+
+
+def test_unknown_drives_count_as_their_own_hub():
+    scheduler = IOScheduler(sim_bus(count=0))
+    assert scheduler.placement(5).hub != scheduler.placement(6).hub
+
+
+def test_interleave_visits_every_hub_first():
+    scheduler = IOScheduler(sim_bus())
+    assert scheduler.interleave([0, 1, 2, 4, 5, 3]) == [0, 4, 1, 5, 2, 3]
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+import usbLock_store
+from usbLock_store import BackupStore, StoreError, load_backup
+
+
+def test_identical_captures_share_one_blob(tmp_path):
+    store = BackupStore(tmp_path)
+    data = bytes(512) + os.urandom(512)
+    first = store.write_reference("usb_backup_drive1_1", data, drive="1")
+    second = store.write_reference("usb_backup_drive1_1", data, drive="1")
+    assert first != second
+    assert len(list(store.blobs())) == 1
+    assert load_backup(second) == (data, store.read_reference(second))
+
+
+def test_large_captures_are_compressed(tmp_path):
+    store = BackupStore(tmp_path)
+    data = bytes(64 * 1024)
+    digest = store.put(data)
+    assert os.path.getsize(store.blob_path(digest)) < len(data)
+    assert store.get(digest) == data
+
+
+def test_writes_are_synced_before_and_after_the_rename(tmp_path, monkeypatch):
+    events = []
+    real_fsync, real_replace = os.fsync, os.replace
+    monkeypatch.setattr(usbLock_store.os, 'fsync', lambda fd: events.append('fsync') or real_fsync(fd))
+    monkeypatch.setattr(usbLock_store.os, 'replace', lambda *a: events.append('replace') or real_replace(*a))
+    BackupStore(tmp_path).write_reference("usb_backup_drive1_1", b"x" * 512)
+    # Blob and reference: the file before its rename, the directory after
+    assert events[:2] == ['fsync', 'replace'] and events[2] == 'fsync'
+    assert events.count('replace') == 2
+    if os.name != 'nt':
+        # Blob: file, bucket, and the parents of the new bucket and objects/; reference: file, folder
+        assert events.count('fsync') == 4 + 2
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('.tmp-')]
+
+
+def test_gc_keeps_referenced_and_young_blobs(tmp_path):
+    store = BackupStore(tmp_path)
+    kept = store.write_reference("usb_backup_drive1_1", b"kept" * 128)
+    orphan = store.put(b"orphan" * 100)
+    young = store.put(b"young" * 100)
+    old = os.stat(store.blob_path(orphan)).st_mtime - 2 * usbLock_store.GC_GRACE
+    os.utime(store.blob_path(orphan), (old, old))
+    assert store.gc() == 1
+    assert not store.blob_path(orphan).exists()
+    assert store.blob_path(young).exists()
+    assert load_backup(kept)[0] == b"kept" * 128
+
+
+def test_scrub_finds_corrupt_blobs(tmp_path):
+    store = BackupStore(tmp_path)
+    good = store.put(b"good" * 128)
+    bad = store.put(b"bad" * 128)
+    with open(store.blob_path(bad), 'r+b') as f:
+        f.seek(10)
+        f.write(b"!")
+    result = store.scrub()
+    assert result.checked == 2 and result.corrupt == [bad]
+    assert store.get(good) == b"good" * 128
+    with pytest.raises(StoreError):
+        store.get(bad)
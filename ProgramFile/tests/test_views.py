@@ -0,0 +1,27 @@
+from usbLock_views import diff_rows
+
+
+def test_identical_rows_need_nothing():
+    shown = {'a': (1,), 'b': (2,)}
+    assert diff_rows(shown, [('a', (1,)), ('b', (2,))]) == ([], [], [], False)
+
+
+def test_added_removed_and_changed_rows():
+    shown = {'a': (1,), 'b': (2,), 'c': (3,)}
+    diff = diff_rows(shown, [('a', (1,)), ('c', (30,)), ('d', (4,))])
+    assert diff.removed == ['b']
+    assert diff.added == [(2, 'd', (4,))]
+    assert diff.changed == [('c', (30,))]
+    assert not diff.reordered
+
+
+def test_reordered_rows():
+    shown = {'a': (1,), 'b': (2,)}
+    diff = diff_rows(shown, [('b', (2,)), ('a', (1,))])
+    assert (diff.removed, diff.added, diff.changed, diff.reordered) == ([], [], [], True)
+
+
+def test_empty_screen_adds_every_row_in_order():
+    diff = diff_rows({}, [('x', ('1',)), ('y', ('2',))])
+    assert diff.added == [(0, 'x', ('1',)), (1, 'y', ('2',))]
+    assert not diff.reordered
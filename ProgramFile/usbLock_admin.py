@@ -0,0 +1,27 @@
+import sys
+import ctypes
+import logging
+
+
+def is_admin():
+    """Check if the script is running with admin privileges"""
+    try:
+        return ctypes.windll.shell32.IsUserAnAdmin()
+    except:
+        return False
+
+
+def run_as_admin():
+    """Restart the script with admin privileges"""
+    try:
+        ctypes.windll.shell32.ShellExecuteW(
+            None,
+            "runas",
+            sys.executable,
+            " ".join(sys.argv),
+            None,
+            1
+        )
+    except Exception as e:
+        logging.error(f"Failed to run as admin: {e}")
+    sys.exit()
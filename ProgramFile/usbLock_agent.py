@@ -0,0 +1,226 @@
+import json
+import hmac
+import socket
+import logging
+import threading
+import ipaddress
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from usbLock_device import get_device_backend, parse_drive_number
+from usbLock_batch import BATCH_WORKERS, BatchJob, run_batch, result_to_dict
+from usbLock_policy import LOCK, normalize_serial, verdict
+import usbLock_core as core
+
+AGENT_PORT = 8765
+RPC_PATH = '/rpc'
+# Seconds an idle keep-alive connection from a controller is held open
+IDLE_TIMEOUT = 120
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+
+
+class RpcError(Exception):
+    """An error returned to the caller as a JSON-RPC error object"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+def is_loopback(host):
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == 'localhost'
+
+
+def read_token(path):
+    """Reads a shared secret from a file; surrounding whitespace is ignored"""
+    with open(path, encoding='utf-8') as f:
+        token = f.read().strip()
+    if not token:
+        raise ValueError(f"Token file {path} is empty")
+    return token
+
+
+def _serials(params, name, required=False):
+    value = params.get(name)
+    if value is None and not required:
+        return None
+    if not isinstance(value, list) or not all(isinstance(s, str) for s in value):
+        raise RpcError(INVALID_PARAMS, f"'{name}' must be a list of serials")
+    return frozenset(normalize_serial(s) for s in value)
+
+
+class Agent:
+    """The drive operations one workstation offers to a fleet controller.
+
+    Methods take and return JSON-compatible values and run on the same
+    functions as the GUI and CLI: lock is the regular backup-then-disable
+    path, unlock restores each drive's best matching backup. Lock and
+    unlock calls are serialized, so two controllers cannot back up a drive
+    the other one just blanked.
+    """
+
+    def __init__(self, devices=None, workers=BATCH_WORKERS, verify=True):
+        self.devices = devices or get_device_backend()
+        self.workers = workers
+        self.verify = verify
+        self._writes = threading.Lock()
+        self.methods = {
+            'info': self.info,
+            'list': self.list_drives,
+            'backups': self.list_backups,
+            'lock': self.lock,
+            'unlock': self.unlock
+        }
+
+    def call(self, method, params):
+        func = self.methods.get(method)
+        if func is None:
+            raise RpcError(METHOD_NOT_FOUND, f"Unknown method {method!r}")
+        if not isinstance(params, dict):
+            raise RpcError(INVALID_PARAMS, "params must be an object")
+        return func(params)
+
+    def info(self, params):
+        return {'host': socket.gethostname(), 'backend': self.devices.name,
+                'drives': len(core.get_all_physical_drives(self.devices))}
+
+    def list_drives(self, params):
+        kind = params.get('kind', 'all')
+        if kind not in ('all', 'volumes', 'physical'):
+            raise RpcError(INVALID_PARAMS, "kind must be all, volumes or physical")
+        result = {}
+        if kind in ('all', 'volumes'):
+            result['volumes'] = core.get_usb_drives()
+        if kind in ('all', 'physical'):
+            result['physical'] = core.get_all_physical_drives(self.devices)
+        return result
+
+    def list_backups(self, params):
+        drive = params.get('drive')
+        drive = None if drive is None else parse_drive_number(drive)
+        serials = _serials(params, 'serials')
+        entries = core.list_backups(drive)
+        if serials is not None:
+            entries = [e for e in entries if normalize_serial(e.serial) in serials]
+        return {'backups': [entry._asdict() for entry in entries]}
+
+    def _select(self, serials):
+        return [d for d in core.get_all_physical_drives(self.devices) if normalize_serial(d['serial']) in serials]
+
+    def _run(self, drives, func):
+        serials = {d['index']: d['serial'] for d in drives}
+        jobs = [BatchJob(d['index'], str(d['index']), func, (d['index'], d['serial'])) for d in drives]
+        with self._writes:
+            results = run_batch(jobs, max_workers=self.workers)
+        return {'drives': [dict(result_to_dict(r), serial=serials[r.key]) for r in results]}
+
+    def _lock_one(self, drive, serial):
+        if core.is_drive_disabled(drive, self.devices):
+            return True, ("already_disabled", drive)
+        return core.disable_usb_drive(drive, self.devices, self.verify, serial)
+
+    def _unlock_one(self, drive, serial):
+        backup_file = core.best_backup_for_drive(drive, serial, self.devices)
+        if backup_file is None:
+            return False, ("no_backup_for_drive",)
+        return core.enable_usb_drive(drive, backup_file, self.devices, self.verify)
+
+    def lock(self, params):
+        """Locks the drives with the given `serials`, or every drive `allow`/`deny` lists do not allow.
+
+        Drives that are already locked are reported as such and left alone.
+        """
+        serials = _serials(params, 'serials')
+        if serials is not None:
+            drives = self._select(serials)
+        else:
+            allowed = _serials(params, 'allow') or frozenset()
+            denied = _serials(params, 'deny') or frozenset()
+            drives = [d for d in core.get_all_physical_drives(self.devices)
+                      if verdict(d['serial'], allowed, denied) == LOCK]
+        return self._run(drives, self._lock_one)
+
+    def unlock(self, params):
+        """Restores the drives with the given `serials` from their best matching backups"""
+        return self._run(self._select(_serials(params, 'serials', required=True)), self._unlock_one)
+
+
+class AgentHandler(BaseHTTPRequestHandler):
+    """JSON-RPC 2.0 over HTTP/1.1 POST /rpc; connections are kept alive between calls"""
+    protocol_version = 'HTTP/1.1'
+    timeout = IDLE_TIMEOUT
+
+    def _send(self, status, document):
+        body = json.dumps(document).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        token = self.server.token
+        if token is None:
+            return True
+        return hmac.compare_digest(self.headers.get('Authorization', ''), f"Bearer {token}")
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            self._send(400, {'error': 'bad Content-Length'})
+            return
+        body = self.rfile.read(length)
+        if self.path != RPC_PATH:
+            self._send(404, {'error': f"POST {RPC_PATH}"})
+            return
+        if not self._authorized():
+            logging.warning(f"Agent refused a call from {self.client_address[0]}: bad or missing token")
+            self._send(401, {'error': 'unauthorized'})
+            return
+        self._send(200, self.server.dispatch(body, self.client_address[0]))
+
+    def log_message(self, format, *args):
+        logging.debug(f"Agent {self.client_address[0]}: {format % args}")
+
+
+class AgentServer(ThreadingHTTPServer):
+    """Serves an Agent to fleet controllers, one thread per connection"""
+    daemon_threads = True
+
+    def __init__(self, agent, host='127.0.0.1', port=AGENT_PORT, token=None):
+        if token is None and not is_loopback(host):
+            raise ValueError(f"Refusing to serve on {host} without a token")
+        self.agent = agent
+        self.token = token
+        super().__init__((host, port), AgentHandler)
+
+    def dispatch(self, body, client):
+        """Runs one JSON-RPC request and returns its response object"""
+        try:
+            request = json.loads(body)
+        except ValueError as e:
+            return {'jsonrpc': '2.0', 'id': None, 'error': {'code': PARSE_ERROR, 'message': str(e)}}
+        if not isinstance(request, dict) or not isinstance(request.get('method'), str):
+            return {'jsonrpc': '2.0', 'id': None, 'error': {'code': INVALID_REQUEST, 'message': 'not a request'}}
+        rid = request.get('id')
+        method = request['method']
+        logging.info(f"Agent call {method} from {client}")
+        try:
+            result = self.agent.call(method, request.get('params', {}))
+        except RpcError as e:
+            return {'jsonrpc': '2.0', 'id': rid, 'error': {'code': e.code, 'message': str(e)}}
+        except Exception as e:
+            logging.error(f"Agent call {method} failed: {e}")
+            return {'jsonrpc': '2.0', 'id': rid, 'error': {'code': SERVER_ERROR, 'message': str(e)}}
+        return {'jsonrpc': '2.0', 'id': rid, 'result': result}
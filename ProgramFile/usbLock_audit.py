@@ -0,0 +1,272 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import functools
+import threading
+import logging.handlers
+from datetime import datetime
+from pathlib import Path
+from usbLock_metrics import observe
+
+LOG_NAME = "usblock.log"
+AUDIT_NAME = "audit.jsonl"
+# A file is rotated when it reaches LOG_MAX_BYTES or has been written for LOG_ROTATE_SECONDS
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_ROTATE_SECONDS = 24 * 3600
+# Rotated files kept per log
+LOG_BACKUPS = 14
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_audit_log = logging.getLogger('usblock.audit')
+_context = threading.local()
+_listener = None
+
+
+def default_log_dir():
+    """USBLOCK_LOG_DIR, else a logs folder next to the program (not the working directory)"""
+    if os.environ.get('USBLOCK_LOG_DIR'):
+        return Path(os.environ['USBLOCK_LOG_DIR'])
+    if getattr(sys, 'frozen', False):
+        return Path(sys.executable).resolve().parent / "logs"
+    return Path(__file__).resolve().parent / "logs"
+
+
+def _rotation_key(suffix):
+    # <stamp> or <stamp>-<n> when several rotations fall within one second
+    stamp, _, counter = suffix.partition('-')[2].partition('-')
+    return suffix[:8], stamp, int(counter) if counter.isdigit() else 0
+
+
+def rotated_files(path):
+    """Returns the rotated copies of a log followed by the live file, oldest first"""
+    path = Path(path)
+    prefix = f"{path.name}."
+    files = []
+    if path.parent.is_dir():
+        suffixes = [name[len(prefix):] for name in os.listdir(path.parent)
+                    if name.startswith(prefix) and name[len(prefix):][:1].isdigit()]
+        files = [os.path.join(path.parent, prefix + suffix) for suffix in sorted(suffixes, key=_rotation_key)]
+    if path.exists():
+        files.append(str(path))
+    return files
+
+
+class RotatingHandler(logging.handlers.BaseRotatingHandler):
+    """Appends to a file and rotates it by size or age into <name>.<YYYYmmdd-HHMMSS>"""
+
+    def __init__(self, filename, max_bytes=LOG_MAX_BYTES, interval=LOG_ROTATE_SECONDS, backups=LOG_BACKUPS):
+        super().__init__(filename, 'a', encoding='utf-8', delay=True)
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backups = backups
+        now = time.time()
+        try:
+            # A file last written more than an interval ago is rotated on the first record
+            started = min(now, os.path.getmtime(filename))
+        except OSError:
+            started = now
+        self.rollover_at = started + interval if now - started < interval else now
+
+    def shouldRollover(self, record):
+        if time.time() >= self.rollover_at:
+            if os.path.exists(self.baseFilename):
+                return True
+            self.rollover_at = time.time() + self.interval
+        if self.max_bytes <= 0:
+            return False
+        if self.stream is None:
+            self.stream = self._open()
+        return self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        target = f"{self.baseFilename}.{stamp}"
+        counter = 1
+        while os.path.exists(target):
+            target = f"{self.baseFilename}.{stamp}-{counter}"
+            counter += 1
+        if os.path.exists(self.baseFilename):
+            os.replace(self.baseFilename, target)
+        old = [path for path in rotated_files(self.baseFilename) if path != self.baseFilename]
+        for path in old[:max(0, len(old) - self.backups)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.rollover_at = time.time() + self.interval
+        self.stream = self._open()
+
+
+class JsonFormatter(logging.Formatter):
+    """One audit event per line: ts, time, event and the event's fields, keys sorted"""
+
+    def format(self, record):
+        event = {
+            'ts': round(record.created, 3),
+            'time': datetime.fromtimestamp(record.created).astimezone().isoformat(timespec='milliseconds'),
+            'level': record.levelname
+        }
+        event.update(record.audit)
+        return json.dumps(event, sort_keys=True, separators=(',', ':'), default=str)
+
+
+def _is_audit(record):
+    return hasattr(record, 'audit')
+
+
+def setup_logging(log_dir=None, level=logging.INFO):
+    """Routes all logging through a queue to a thread that writes the rotated files.
+
+    Callers only enqueue records, so neither the Tk thread nor workers wait
+    on the disk. Plain records go to usblock.log, audit events to audit.jsonl.
+    Returns the log directory.
+    """
+    global _listener
+    log_dir = Path(log_dir or default_log_dir())
+    if _listener is not None:
+        return log_dir
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    text = RotatingHandler(log_dir / LOG_NAME)
+    text.setFormatter(logging.Formatter(TEXT_FORMAT))
+    text.addFilter(lambda record: not _is_audit(record))
+    events = RotatingHandler(log_dir / AUDIT_NAME)
+    events.setFormatter(JsonFormatter())
+    events.addFilter(_is_audit)
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.setLevel(level)
+    _audit_log.setLevel(logging.INFO)
+
+    _listener = logging.handlers.QueueListener(records, text, events)
+    _listener.start()
+    atexit.register(stop_logging)
+    return log_dir
+
+
+def stop_logging():
+    """Writes out queued records and stops the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def audit(event, **fields):
+    """Records one structured audit event"""
+    _audit_log.info(f"{event} {fields.get('outcome', '')}".rstrip(), extra={'audit': dict(fields, event=event)})
+
+
+def annotate(**fields):
+    """Adds fields, such as the drive serial, to the audit event of the operation running on this thread"""
+    stack = getattr(_context, 'stack', None)
+    if stack:
+        stack[-1].update(fields)
+
+
+def _outcome(result):
+    """Reads the outcome from what an operation returned"""
+    if isinstance(result, tuple) and len(result) == 2 and isinstance(result[0], bool):
+        success, message = result
+        key, *details = message if isinstance(message, tuple) else (message,)
+        fields = {'outcome': 'ok' if success else 'failed', 'message': key}
+        if details:
+            fields['details'] = [str(d) for d in details]
+        return fields
+    if isinstance(result, list):
+        return {'outcome': 'ok', 'count': len(result)}
+    if result is None or result is False:
+        return {'outcome': 'failed'}
+    return {'outcome': 'ok'}
+
+
+def audited(event):
+    """Decorator: writes an audit event with the duration and outcome of each call"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            fields = {}
+            stack = _context.__dict__.setdefault('stack', [])
+            stack.append(fields)
+            began = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                fields.update(outcome='error', error=f"{type(e).__name__}: {e}")
+                raise
+            else:
+                # Fields the operation annotated itself take precedence
+                for key, value in _outcome(result).items():
+                    fields.setdefault(key, value)
+                return result
+            finally:
+                stack.pop()
+                seconds = time.perf_counter() - began
+                observe(f"op.{event}", seconds)
+                audit(event, duration_ms=round(seconds * 1000, 3), **fields)
+        return wrapper
+    return decorate
+
+
+def parse_time(text):
+    """Parses a query bound: seconds since the epoch or an ISO 8601 date/time (local if no zone)"""
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+
+def _first_ts(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                return json.loads(line)['ts']
+            except (ValueError, KeyError):
+                continue
+    return None
+
+
+def query(log_dir=None, serial=None, since=None, until=None, event=None):
+    """Yields audit events, oldest first, filtered by serial, event and time range (epoch seconds).
+
+    Whole files outside the time range are skipped using their first event
+    and modification time, and lines are matched against the serial as text
+    before they are parsed.
+    """
+    needle = None if serial is None else f'"serial":{json.dumps(serial)}'
+    for path in rotated_files(Path(log_dir or default_log_dir()) / AUDIT_NAME):
+        try:
+            if since is not None and os.path.getmtime(path) < since:
+                continue
+            first = _first_ts(path)
+            if until is not None and first is not None and first > until:
+                break
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if needle is not None and needle not in line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    ts = record.get('ts', 0)
+                    if since is not None and ts < since or until is not None and ts > until:
+                        continue
+                    if event is not None and record.get('event') != event:
+                        continue
+                    yield record
+        except OSError as e:
+            logging.warning(f"Cannot read audit log {path}: {e}")
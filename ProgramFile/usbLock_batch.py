@@ -0,0 +1,97 @@
+import time
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from usbLock_scheduler import get_scheduler
+
+# Upper bound on drives written concurrently
+BATCH_WORKERS = 8
+
+# key identifies the target (the physical drive number); func(*args) returns (success, message)
+BatchJob = namedtuple('BatchJob', ['key', 'label', 'func', 'args'])
+BatchResult = namedtuple('BatchResult', ['key', 'label', 'success', 'message', 'duration'])
+
+
+def dedupe_jobs(jobs):
+    """Drops jobs whose key was already queued, e.g. two partitions of one stick"""
+    seen = set()
+    unique = []
+    for job in jobs:
+        if job.key not in seen:
+            seen.add(job.key)
+            unique.append(job)
+    return unique
+
+
+def _run_job(job, on_start):
+    if on_start:
+        on_start(job)
+    started = time.perf_counter()
+    try:
+        success, message = job.func(*job.args)
+    except Exception as e:
+        logging.error(f"Batch job {job.label} failed: {e}")
+        success, message = False, f"Unexpected error: {e}"
+    return BatchResult(job.key, job.label, success, message, time.perf_counter() - started)
+
+
+def run_batch(jobs, max_workers=BATCH_WORKERS, on_start=None, on_result=None):
+    """Runs jobs on a bounded worker pool and returns results in completion order.
+
+    on_start(job) and on_result(result) are called from worker threads. Jobs
+    are started round-robin across USB hubs; the scheduler caps how many run
+    behind each one.
+    """
+    jobs = get_scheduler().interleave(dedupe_jobs(jobs), key=lambda job: job.key)
+    results = []
+    if not jobs:
+        return results
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as executor:
+        futures = [executor.submit(_run_job, job, on_start) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if on_result:
+                on_result(result)
+    succeeded, failed = summarize(results)
+    logging.info(
+        f"Batch finished: {len(succeeded)} succeeded, {len(failed)} failed "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
+    return results
+
+
+def message_to_dict(message):
+    """Flattens an operation's (key, *args) message for JSON output"""
+    if isinstance(message, tuple):
+        key, *args = message
+    else:
+        key, args = message, []
+    return {'message': key, 'details': [str(arg) for arg in args]}
+
+
+def result_to_dict(result):
+    """A BatchResult as a JSON-ready record, as the CLI and the agent report it"""
+    record = {
+        'drive': result.key,
+        'success': result.success,
+        'duration': round(result.duration, 4)
+    }
+    record.update(message_to_dict(result.message))
+    return record
+
+
+def summarize(results):
+    """Splits results into (succeeded, failed) lists"""
+    succeeded = [r for r in results if r.success]
+    failed = [r for r in results if not r.success]
+    return succeeded, failed
+
+
+def resolve_serials(serials, physical_drives):
+    """Maps disk serials to physical drive numbers; returns (numbers, unknown serials)"""
+    by_serial = {drive['serial']: drive['index'] for drive in physical_drives}
+    numbers = [by_serial[serial] for serial in serials if serial in by_serial]
+    unknown = [serial for serial in serials if serial not in by_serial]
+    return numbers, unknown
@@ -0,0 +1,155 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from pathlib import Path
+from usbLock_partition import disk_identity
+from usbLock_store import BackupStore, StoreError, read_backup, is_reference
+from usbLock_records import BackupEntry
+
+CATALOG_NAME = "catalog.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    drive TEXT,
+    serial TEXT,
+    disk_size INTEGER,
+    disk_id TEXT,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS backups_serial ON backups (serial, created);
+CREATE INDEX IF NOT EXISTS backups_drive ON backups (drive, created);
+CREATE INDEX IF NOT EXISTS backups_created ON backups (created);
+"""
+
+_COLUMNS = ', '.join(BackupEntry._fields)
+_BACKUP_NAME = re.compile(r'^usb_backup_drive(.+)_(\d+)(?:-\d+)?\.(bin|ref)$')
+
+
+class BackupCatalog:
+    """SQLite index of partition table backups in one directory"""
+
+    def __init__(self, backup_dir):
+        self.backup_dir = Path(backup_dir)
+        self.backup_dir.mkdir(exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.backup_dir / CATALOG_NAME), check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _key(self, path):
+        return os.path.normpath(str(path))
+
+    def record(self, path, sector, drive=None, serial=None, disk_size=None, disk_id=None, created=None):
+        """Adds or replaces the catalog row for a backup file that was just written"""
+        path = self._key(path)
+        stat = os.stat(path)
+        row = (
+            path, drive, serial, disk_size, disk_id or disk_identity(sector),
+            hashlib.sha256(sector).hexdigest(), len(sector),
+            created if created is not None else time.time(), stat.st_mtime
+        )
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO backups (path, drive, serial, disk_size, disk_id, sha256, size, created, mtime)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row
+            )
+
+    def forget(self, path):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM backups WHERE path = ?", (self._key(path),))
+
+    def _query(self, where, params, limit=None):
+        sql = f"SELECT {_COLUMNS} FROM backups"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created DESC, id DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            return [BackupEntry(*row) for row in self._db.execute(sql, params)]
+
+    def entries(self, serial=None, drive=None, since=None, limit=None):
+        """Returns catalog entries, newest first, filtered by serial, drive and creation time"""
+        where, params = [], []
+        if serial is not None:
+            where.append("serial = ?")
+            params.append(serial)
+        if drive is not None:
+            where.append("drive = ?")
+            params.append(str(drive))
+        if since is not None:
+            where.append("created >= ?")
+            params.append(since)
+        return self._query(where, params, limit)
+
+    def latest(self, serial=None, drive=None):
+        """Returns the newest entry for a serial (or drive), or None"""
+        entries = self.entries(serial=serial, drive=drive, limit=1)
+        return entries[0] if entries else None
+
+    def rescan(self):
+        """Adopts backup files added by hand and drops rows whose file is gone.
+
+        Only files that are new or whose mtime changed are read. Reference
+        files carry their own metadata, so their rows are restored in full.
+        Returns (added, removed).
+        """
+        with self._lock:
+            known = {path: mtime for path, mtime in self._db.execute("SELECT path, mtime FROM backups")}
+        seen = set()
+        added = 0
+        with os.scandir(self.backup_dir) as entries:
+            for entry in entries:
+                match = _BACKUP_NAME.match(entry.name)
+                if not match or not entry.is_file():
+                    continue
+                path = self._key(entry.path)
+                seen.add(path)
+                if known.get(path) == entry.stat().st_mtime:
+                    continue
+                try:
+                    sector = read_backup(path)
+                    meta = BackupStore(self.backup_dir).read_reference(path) if is_reference(path) else {}
+                except (OSError, StoreError) as e:
+                    logging.warning(f"Cannot read backup {path}: {e}")
+                    continue
+                self.record(
+                    path, sector, drive=meta.get('drive', match.group(1)), serial=meta.get('serial'),
+                    disk_size=meta.get('disk_size'), disk_id=meta.get('disk_id'),
+                    created=meta.get('created', float(match.group(2)))
+                )
+                added += 1
+        missing = [path for path in known if path not in seen]
+        if missing:
+            with self._lock, self._db:
+                self._db.executemany("DELETE FROM backups WHERE path = ?", [(p,) for p in missing])
+        if added or missing:
+            logging.info(f"Backup catalog rescan: {added} adopted, {len(missing)} removed")
+        return added, len(missing)
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(backup_dir):
+    """Returns the shared catalog for a backup directory, rescanning it on first use"""
+    key = os.path.abspath(str(backup_dir))
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            catalog = _catalogs[key] = BackupCatalog(backup_dir)
+            catalog.rescan()
+        return catalog
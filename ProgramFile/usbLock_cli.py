@@ -0,0 +1,470 @@
+"""usblock - headless USBLock with JSON output.
+
+    python usbLock_cli.py list
+    python usbLock_cli.py disable 1 2 --ndjson
+    python usbLock_cli.py enable 1 --latest
+    python usbLock_cli.py backups --drive 1
+    python usbLock_cli.py image 1 stick.img --ndjson
+    python usbLock_cli.py wipe 1 2 --pass random --pass zero --verify full --yes
+    python usbLock_cli.py recover
+    python usbLock_cli.py daemon --policy allowed_serials.txt --sweep
+    python usbLock_cli.py agent --port 8765
+    python usbLock_cli.py fleet lock --hosts hosts.txt --policy allowed_serials.txt
+    python usbLock_cli.py audit --serial 4C530001 --since 2024-05-01
+
+Set --image-dir (or USBLOCK_IMAGE_DIR) to run against drive<N>.img files.
+"""
+import os
+import sys
+import json
+import argparse
+
+# Exit codes
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+
+class Output:
+    """Writes records as one JSON document, or as NDJSON lines as they arrive"""
+
+    def __init__(self, ndjson, stream=None):
+        self.ndjson = ndjson
+        self.stream = stream or sys.stdout
+        self.records = []
+
+    def emit(self, record):
+        if self.ndjson:
+            self.stream.write(json.dumps(record) + "\n")
+            self.stream.flush()
+        else:
+            self.records.append(record)
+
+    def close(self, document=None):
+        if not self.ndjson:
+            json.dump(self.records if document is None else document, self.stream, indent=2)
+            self.stream.write("\n")
+
+
+def metrics_to_dict():
+    """The p50/p95 summary of every instrumented operation, in milliseconds"""
+    import usbLock_metrics as metrics
+    snapshot = metrics.snapshot()
+    return {
+        'kind': 'metrics',
+        'operations': {
+            name: {'count': op['count'], 'p50_ms': round(op['p50'] * 1000, 3),
+                   'p95_ms': round(op['p95'] * 1000, 3), 'max_ms': round(op['max'] * 1000, 3)}
+            for name, op in snapshot['operations'].items()
+        },
+        'counters': snapshot['counters'],
+        'gauges': snapshot['gauges']
+    }
+
+
+def cmd_list(args, out):
+    from usbLock_core import get_usb_drives, get_all_physical_drives
+    if args.kind in ('all', 'volumes'):
+        for drive in get_usb_drives():
+            out.emit(dict(drive, kind='volume'))
+    if args.kind in ('all', 'physical'):
+        for drive in get_all_physical_drives():
+            out.emit(dict(drive, kind='physical'))
+    return EXIT_OK
+
+
+def cmd_backups(args, out):
+    from usbLock_core import list_backups, BACKUP_DIR
+    from usbLock_catalog import get_catalog
+    if args.rescan:
+        get_catalog(BACKUP_DIR).rescan()
+    for entry in list_backups(args.drive, args.serial):
+        out.emit(entry._asdict())
+    return EXIT_OK
+
+
+def cmd_match(args, out):
+    from usbLock_core import list_backups, get_all_physical_drives
+    from usbLock_match import rank_backups
+    serial = {d['index']: d['serial'] for d in get_all_physical_drives()}.get(args.drive)
+    for match in rank_backups(args.drive, list_backups(), serial=serial)[:args.limit]:
+        out.emit({'score': match.score, 'path': match.entry.path, 'reasons': match.reasons})
+    return EXIT_OK
+
+
+def cmd_store(args, out):
+    from usbLock_core import collect_garbage, scrub_backups
+    if args.action == 'gc':
+        out.emit({'action': 'gc', 'removed': collect_garbage()})
+        return EXIT_OK
+    result = scrub_backups()
+    out.emit({'action': 'scrub', 'checked': result.checked, 'corrupt': result.corrupt})
+    return EXIT_OK if not result.corrupt else EXIT_FAILED
+
+
+def _resolve_targets(args, out):
+    """Returns drive numbers from positional drives and --serial, or None on error"""
+    from usbLock_core import get_all_physical_drives
+    from usbLock_batch import resolve_serials
+    drives = list(args.drives)
+    if args.serial:
+        numbers, unknown = resolve_serials(args.serial, get_all_physical_drives())
+        for serial in unknown:
+            out.emit({'serial': serial, 'success': False, 'message': 'unknown_serial', 'details': []})
+        if unknown:
+            return None
+        drives += numbers
+    if not drives:
+        out.emit({'success': False, 'message': 'no_drives_given', 'details': []})
+        return None
+    return drives
+
+
+def _run_jobs(jobs, args, out):
+    from usbLock_batch import run_batch, result_to_dict
+    results = run_batch(jobs, max_workers=args.workers, on_result=lambda r: out.emit(result_to_dict(r)))
+    return EXIT_OK if results and all(r.success for r in results) else EXIT_FAILED
+
+
+def cmd_disable(args, out):
+    from usbLock_core import disable_usb_drive
+    from usbLock_batch import BatchJob
+    drives = _resolve_targets(args, out)
+    if drives is None:
+        return EXIT_USAGE
+    jobs = [BatchJob(drive, str(drive), disable_usb_drive, (drive, None, args.verify)) for drive in drives]
+    return _run_jobs(jobs, args, out)
+
+
+def _enable_one(drive, backup_file, delete_after, verify=True):
+    from usbLock_core import enable_usb_drive, delete_backup
+    if backup_file is None:
+        return False, ("no_backup_for_drive",)
+    success, message = enable_usb_drive(drive, backup_file, verify=verify)
+    if success and delete_after:
+        delete_backup(backup_file)
+    return success, message
+
+
+def cmd_enable(args, out):
+    from usbLock_core import best_backup_for_drive, get_all_physical_drives, latest_backup_for_drive
+    from usbLock_batch import BatchJob
+    drives = _resolve_targets(args, out)
+    if drives is None:
+        return EXIT_USAGE
+    if args.backup and len(drives) > 1:
+        out.emit({'success': False, 'message': 'backup_needs_single_drive', 'details': []})
+        return EXIT_USAGE
+    jobs = []
+    # Backups are matched by disk serial first; drive numbers can change between boots
+    serials = {} if args.backup else {d['index']: d['serial'] for d in get_all_physical_drives()}
+    pick = latest_backup_for_drive if args.latest else best_backup_for_drive
+    for drive in drives:
+        backup_file = args.backup or pick(drive, serials.get(drive))
+        jobs.append(BatchJob(drive, str(drive), _enable_one, (drive, backup_file, args.delete_backup, args.verify)))
+    return _run_jobs(jobs, args, out)
+
+
+def cmd_image(args, out):
+    from usbLock_core import image_usb_drive
+    from usbLock_batch import message_to_dict
+
+    def progress(p):
+        out.emit({'drive': args.drive, 'progress': round(p.done / p.total, 4) if p.total else 1.0,
+                  'done': p.done, 'total': p.total, 'mb_per_s': round(p.rate, 1)})
+
+    success, message = image_usb_drive(args.drive, args.output, on_progress=progress if args.ndjson else None)
+    record = {'drive': args.drive, 'success': success}
+    record.update(message_to_dict(message))
+    out.emit(record)
+    return EXIT_OK if success else EXIT_FAILED
+
+
+def cmd_wipe(args, out):
+    from usbLock_core import wipe_usb_drive
+    from usbLock_batch import BatchJob
+    if not args.yes:
+        out.emit({'success': False, 'message': 'wipe_needs_yes', 'details': []})
+        return EXIT_USAGE
+    drives = _resolve_targets(args, out)
+    if drives is None:
+        return EXIT_USAGE
+    passes = tuple(args.passes or ('zero',))
+    jobs = [BatchJob(drive, str(drive), wipe_usb_drive, (drive, passes, args.verify)) for drive in drives]
+    return _run_jobs(jobs, args, out)
+
+
+def cmd_daemon(args, out):
+    import time
+    from usbLock_policy import PolicyDaemon, PolicyError, SerialPolicy
+    try:
+        policy = SerialPolicy(args.policy)
+    except PolicyError as e:
+        out.emit({'success': False, 'message': 'policy_unreadable', 'details': [str(e)]})
+        return EXIT_USAGE
+    # A daemon never finishes, so decisions are streamed whatever the output mode
+    out.ndjson = True
+
+    def decided(d):
+        out.emit({'kind': 'decision', 'drive': d.drive, 'serial': d.serial, 'verdict': d.verdict,
+                  'outcome': d.outcome, 'latency_ms': round(d.latency * 1000, 3)})
+
+    daemon = PolicyDaemon(policy, workers=args.workers, on_decision=decided, verify=args.verify)
+    daemon.start(sweep=args.sweep)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.stop()
+        out.emit(dict(daemon.stats(), kind='summary'))
+    return EXIT_OK
+
+
+def cmd_agent(args, out):
+    from usbLock_agent import Agent, AgentServer, read_token
+    try:
+        token = read_token(args.token_file) if args.token_file else None
+        server = AgentServer(Agent(workers=args.workers, verify=args.verify), args.bind, args.port, token)
+    except (OSError, ValueError) as e:
+        out.emit({'success': False, 'message': 'agent_not_started', 'details': [str(e)]})
+        return EXIT_USAGE
+    out.ndjson = True
+    host, port = server.server_address[:2]
+    out.emit({'kind': 'listening', 'host': host, 'port': port})
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return EXIT_OK
+
+
+def _fleet_params(args, out):
+    """JSON-RPC params for a fleet action, or None after reporting a usage error"""
+    from usbLock_policy import PolicyError, SerialPolicy
+    if args.action == 'list':
+        return {'kind': args.kind}
+    if args.action == 'backups' and not args.serial:
+        return {}
+    if args.serial:
+        return {'serials': args.serial}
+    if args.action == 'lock' and args.policy:
+        try:
+            policy = SerialPolicy(args.policy)
+        except PolicyError as e:
+            out.emit({'success': False, 'message': 'policy_unreadable', 'details': [str(e)]})
+            return None
+        return {'allow': sorted(policy.allowed), 'deny': sorted(policy.denied)}
+    out.emit({'success': False, 'message': 'no_drives_given', 'details': []})
+    return None
+
+
+def cmd_fleet(args, out):
+    import time
+    from usbLock_agent import read_token
+    from usbLock_fleet import load_hosts, run_fleet
+    try:
+        hosts = load_hosts(args.hosts)
+        token = read_token(args.token_file) if args.token_file else None
+    except (OSError, ValueError) as e:
+        out.emit({'success': False, 'message': 'fleet_unreadable', 'details': [str(e)]})
+        return EXIT_USAGE
+    params = _fleet_params(args, out)
+    if params is None:
+        return EXIT_USAGE
+    failed = []
+
+    def answered(r):
+        record = {'host': r.host, 'success': r.success, 'duration': round(r.duration, 4)}
+        if r.success:
+            record.update(r.result)
+            # A host whose call went through can still have failed on some of its drives
+            record['success'] = all(d['success'] for d in r.result.get('drives', ()))
+        else:
+            record.update(message='agent_failed', details=[r.error])
+        if not record['success']:
+            failed.append(r.host)
+        out.emit(record)
+
+    started = time.perf_counter()
+    run_fleet(hosts, args.action, params, answered, token=token, timeout=args.timeout,
+              concurrency=args.concurrency)
+    out.emit({'kind': 'summary', 'hosts': len(hosts), 'failed': len(failed),
+              'duration': round(time.perf_counter() - started, 4)})
+    return EXIT_OK if not failed else EXIT_FAILED
+
+
+def recovery_to_dict(recovery):
+    record = recovery._asdict()
+    record['kind'] = 'recovery'
+    return record
+
+
+def cmd_recover(args, out):
+    # main() has already run the recovery pass; this only reports what is left open
+    from usbLock_core import BACKUP_DIR
+    from usbLock_journal import get_journal
+    for intent in get_journal(BACKUP_DIR).open_intents():
+        out.emit({'kind': 'open_intent', 'id': intent.id, 'op': intent.op, 'drive': intent.drive,
+                  'serial': intent.serial, 'backup': intent.backup, 'created': intent.created})
+    return EXIT_OK
+
+
+def cmd_audit(args, out):
+    from usbLock_audit import query, parse_time
+    try:
+        since = None if args.since is None else parse_time(args.since)
+        until = None if args.until is None else parse_time(args.until)
+    except ValueError:
+        out.emit({'success': False, 'message': 'invalid_time', 'details': [args.since or '', args.until or '']})
+        return EXIT_USAGE
+    for count, event in enumerate(query(args.log_dir, args.serial, since, until, args.event), 1):
+        out.emit(event)
+        if args.limit and count >= args.limit:
+            break
+    return EXIT_OK
+
+
+def build_parser():
+    from usbLock_device import parse_drive_number
+    parser = argparse.ArgumentParser(prog='usblock', description="Disable and enable USB drives from scripts.")
+    parser.add_argument('--ndjson', action='store_true', help="write one JSON object per line as results arrive")
+    parser.add_argument('--image-dir', help="use drive<N>.img files in this directory instead of real disks")
+    parser.add_argument('--metrics', action='store_true',
+                        help="time device I/O, subprocess calls and operations; report p50/p95 at the end")
+    parser.add_argument('--metrics-file', help="also write the timings as a Prometheus textfile (*.prom) or JSON")
+    parser.add_argument('--log-dir', help="where usblock.log and audit.jsonl are written (default: USBLOCK_LOG_DIR or logs/)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('list', help="list USB volumes and removable physical drives")
+    p.add_argument('--kind', choices=('all', 'volumes', 'physical'), default='all')
+    p.set_defaults(func=cmd_list)
+
+    p = commands.add_parser('backups', help="list partition table backups")
+    p.add_argument('--drive', type=parse_drive_number, help="only backups taken from this drive")
+    p.add_argument('--serial', help="only backups of the disk with this serial")
+    p.add_argument('--rescan', action='store_true', help="adopt backup files copied into the folder by hand")
+    p.set_defaults(func=cmd_backups)
+
+    p = commands.add_parser('store', help="maintain the deduplicated backup store")
+    p.add_argument('action', choices=('gc', 'scrub'), help="gc: delete unreferenced blobs; scrub: verify every blob")
+    p.set_defaults(func=cmd_store)
+
+    p = commands.add_parser('match', help="rank backups by how well they fit a drive")
+    p.add_argument('drive', type=parse_drive_number)
+    p.add_argument('--limit', type=int, default=5)
+    p.set_defaults(func=cmd_match)
+
+    p = commands.add_parser('wipe', help="irreversibly overwrite whole drives")
+    p.add_argument('drives', nargs='*', type=parse_drive_number, help="physical drive numbers or device paths")
+    p.add_argument('--serial', action='append', help="select a drive by disk serial (repeatable)")
+    p.add_argument('--workers', type=int, default=8, help="drives processed concurrently")
+    p.add_argument('--pass', dest='passes', action='append', choices=('zero', 'random'),
+                   help="pattern of one overwrite pass, in order (repeatable; default: one zero pass)")
+    p.add_argument('--verify', choices=('none', 'sample', 'full'), default='sample',
+                   help="read back sampled chunks or the whole drive after the last pass")
+    p.add_argument('--yes', action='store_true', help="confirm that all data on the drives is destroyed")
+    p.set_defaults(func=cmd_wipe)
+
+    p = commands.add_parser('daemon', help="lock every drive whose serial the policy file does not allow, as it arrives")
+    p.add_argument('--policy', required=True, help="serials to allow, one per line ('deny SERIAL' always locks)")
+    p.add_argument('--workers', type=int, default=4, help="drives checked and locked concurrently")
+    p.add_argument('--sweep', action='store_true', help="also check drives attached before the daemon started")
+    p.add_argument('--no-verify', dest='verify', action='store_false',
+                   help="skip syncing and reading back the written sectors")
+    p.set_defaults(func=cmd_daemon)
+
+    p = commands.add_parser('agent', help="serve list, lock, unlock and backups to fleet controllers over HTTP")
+    p.add_argument('--bind', default='127.0.0.1', help="address to listen on (anything but loopback needs --token-file)")
+    p.add_argument('--port', type=int, default=8765, help="port to listen on (0 picks a free one)")
+    p.add_argument('--token-file', help="file holding the secret controllers must send as a bearer token")
+    p.add_argument('--workers', type=int, default=8, help="drives processed concurrently")
+    p.add_argument('--no-verify', dest='verify', action='store_false',
+                   help="skip syncing and reading back the written sectors")
+    p.set_defaults(func=cmd_agent)
+
+    p = commands.add_parser('fleet', help="run list, lock, unlock or backups on many agents at once")
+    p.add_argument('action', choices=('list', 'backups', 'lock', 'unlock'))
+    p.add_argument('--hosts', required=True, help="file with one host[:port] per line, or host[:port],host[:port]...")
+    p.add_argument('--policy', help="lock: every drive whose serial this policy file does not allow")
+    p.add_argument('--serial', action='append', help="the drive with this serial, on whichever host it is (repeatable)")
+    p.add_argument('--kind', choices=('all', 'volumes', 'physical'), default='all', help="list: what to list")
+    p.add_argument('--token-file', help="file holding the agents' bearer token")
+    p.add_argument('--timeout', type=float, default=30.0, help="seconds each agent gets to answer")
+    p.add_argument('--concurrency', type=int, default=64, help="agents called at once")
+    p.set_defaults(func=cmd_fleet)
+
+    p = commands.add_parser('audit', help="query the structured audit log")
+    p.add_argument('--serial', help="only events for the disk with this serial")
+    p.add_argument('--event', choices=('enumerate', 'backup', 'disable', 'enable', 'delete', 'image', 'wipe'))
+    p.add_argument('--since', help="ISO date/time or epoch seconds")
+    p.add_argument('--until', help="ISO date/time or epoch seconds")
+    p.add_argument('--limit', type=int, help="stop after this many events")
+    p.set_defaults(func=cmd_audit)
+
+    p = commands.add_parser('recover', help="finish or roll back operations an earlier run left half done")
+    p.set_defaults(func=cmd_recover)
+
+    p = commands.add_parser('image', help="write a full sparse image of a drive (resumes an interrupted one)")
+    p.add_argument('drive', type=parse_drive_number)
+    p.add_argument('output', help="image file; an <output>.checkpoint next to it is resumed")
+    p.set_defaults(func=cmd_image)
+
+    for name, func, help_text in (
+        ('disable', cmd_disable, "back up and overwrite the partition table"),
+        ('enable', cmd_enable, "restore the partition table from a backup")
+    ):
+        p = commands.add_parser(name, help=help_text)
+        p.add_argument('drives', nargs='*', type=parse_drive_number, help="physical drive numbers or device paths")
+        p.add_argument('--serial', action='append', help="select a drive by disk serial (repeatable)")
+        p.add_argument('--workers', type=int, default=8, help="drives processed concurrently")
+        p.add_argument('--no-verify', dest='verify', action='store_false',
+                       help="skip syncing and reading back the written sectors")
+        p.set_defaults(func=func)
+        if name == 'enable':
+            p.add_argument('--backup', help="backup file to restore (single drive only)")
+            p.add_argument('--latest', action='store_true', help="restore each drive's newest backup instead of the one that best matches the disk")
+            p.add_argument('--delete-backup', action='store_true', help="delete the backup after a successful restore")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    import usbLock_metrics as metrics
+    from usbLock_audit import setup_logging
+    setup_logging(args.log_dir)
+    if args.image_dir:
+        os.environ['USBLOCK_IMAGE_DIR'] = args.image_dir
+
+    if args.metrics or args.metrics_file:
+        metrics.enable()
+
+    out = Output(args.ndjson)
+    writes = args.command in ('disable', 'enable', 'image', 'wipe', 'recover', 'daemon', 'agent')
+    if writes and os.name == 'nt' and not os.environ.get('USBLOCK_IMAGE_DIR'):
+        from usbLock_core import is_admin
+        if not is_admin():
+            out.emit({'success': False, 'message': 'admin_required', 'details': []})
+            out.close()
+            return EXIT_USAGE
+    try:
+        if writes:
+            # Settle what an interrupted run left behind before touching any disk again
+            from usbLock_core import recover_operations
+            for recovery in recover_operations():
+                out.emit(recovery_to_dict(recovery))
+        code = args.func(args, out)
+        if args.metrics_file:
+            metrics.export(args.metrics_file)
+        if args.metrics:
+            out.emit(metrics_to_dict())
+    finally:
+        out.close()
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
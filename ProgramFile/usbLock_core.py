@@ -0,0 +1,440 @@
+import os
+import time
+import logging
+from pathlib import Path
+from usbLock_enum import enumerate_drives
+from usbLock_topology import get_topology
+from usbLock_device import get_device_backend, drive_tag
+from usbLock_catalog import get_catalog
+from usbLock_partition import disk_identity
+from usbLock_match import suggest_backup
+from usbLock_store import BackupStore, StoreError, is_reference, load_backup
+from usbLock_metadata import (
+    MetadataError, VerifyError, RawDisk, capture_metadata, restore_metadata, clear_boot_sector
+)
+from usbLock_image import ImagingError, create_image
+from usbLock_audit import annotate, audited
+from usbLock_journal import DONE, ABORTED, Recovery, digest, get_journal
+from usbLock_wipe import WipeError, wipe_drive
+from usbLock_scheduler import METADATA, BULK, scheduled
+from usbLock_admin import is_admin, run_as_admin
+
+BACKUP_DIR = Path("USBLock_Backups")
+
+
+@audited('enumerate')
+def get_usb_drives(backend=None):
+    """Returns a list of mounted USB drives with size and label"""
+    annotate(kind='volumes')
+    try:
+        return enumerate_drives(backend)
+    except Exception as e:
+        logging.error(f"Error enumerating USB drives: {e}")
+        annotate(outcome='failed', error=str(e))
+        return []
+
+
+@audited('enumerate')
+def get_all_physical_drives(devices=None, signatures=False):
+    """Returns a list of all removable physical drive numbers with serial numbers.
+
+    With signatures, each drive's disk_signature() is read as well.
+    """
+    annotate(kind='physical')
+    try:
+        devices = devices or get_device_backend()
+        drives = devices.physical_drives()
+        if signatures:
+            for drive in drives:
+                drive['signature'] = disk_signature(drive['index'], devices)
+        return drives
+    except Exception as e:
+        logging.error(f"Error retrieving physical drives: {e}")
+        annotate(outcome='failed', error=str(e))
+        return []
+
+
+def disk_signature(drive_number, devices=None):
+    """Returns the drive's 'gpt:<disk guid>' or 'mbr:<signature>', or None if it has no partition table"""
+    devices = devices or get_device_backend()
+    try:
+        with RawDisk.open(devices, drive_number) as disk:
+            logical = disk.geometry.logical
+            return disk_identity(disk.read(0, 2 * logical), logical)
+    except OSError as e:
+        logging.warning(f"Could not read the partition table of drive {drive_number}: {e}")
+        return None
+
+
+def get_physical_drive_number(mountpoint):
+    """Looks up the physical drive number for a mountpoint in the topology index"""
+    try:
+        return get_topology().lookup(mountpoint).disk
+    except Exception as e:
+        logging.error(f"Error retrieving drive number: {e}")
+        return None
+
+
+def _serial_or_none(drive_number, devices):
+    try:
+        return devices.serial(drive_number)
+    except Exception as e:
+        logging.warning(f"Could not read serial of drive {drive_number}: {e}")
+        return None
+
+
+@audited('backup')
+@scheduled(METADATA)
+def backup_partition_table(drive_number, devices=None, serial=None):
+    """Backs up the partition metadata of the drive into the content-addressed store.
+
+    LBA 0 is always captured; GPT disks also keep the primary entry array and
+    the backup GPT at the end of the disk. Returns the path of the backup's
+    reference file, which is recorded in the catalog.
+    """
+    devices = devices or get_device_backend()
+    backup_dir = BACKUP_DIR
+    backup_dir.mkdir(exist_ok=True)
+    try:
+        capture = capture_metadata(drive_number, devices)
+        data = capture.data
+        disk_size = capture.disk_size
+        if serial is None:
+            serial = _serial_or_none(drive_number, devices)
+        annotate(drive=drive_tag(drive_number), serial=serial)
+        created = time.time()
+        disk_id = disk_identity(capture.head, capture.geometry.logical)
+        backup_file = BackupStore(backup_dir).write_reference(
+            f"usb_backup_drive{drive_tag(drive_number)}_{int(created)}", data,
+            drive=drive_tag(drive_number), serial=serial, disk_size=disk_size or None,
+            disk_id=disk_id, created=created, layout=capture.layout
+        )
+        logging.info(f"Backup created: {backup_file} ({len(data)} bytes in {capture.syscalls} I/O calls)")
+        annotate(backup=str(backup_file), bytes=len(data))
+    except (PermissionError, OSError, ValueError) as e:
+        logging.error(f"Backup failed for drive {drive_number}: {e}")
+        annotate(drive=drive_tag(drive_number), error=str(e))
+        return None
+
+    # The backup itself is what matters; a catalog failure is logged, not fatal
+    try:
+        get_catalog(backup_dir).record(
+            backup_file, data, drive=drive_tag(drive_number), serial=serial,
+            disk_size=disk_size or None, disk_id=disk_id, created=created
+        )
+    except Exception as e:
+        logging.error(f"Could not catalog backup {backup_file}: {e}")
+    return str(backup_file)
+
+
+def _journaled(op, drive_number, serial, backup_file, intents):
+    """Returns a before_write hook that journals the pre- and post-image of the planned writes.
+
+    The intent is synced before the hook returns, so it is on disk before any sector is.
+    """
+    def before_write(disk, writes):
+        regions = [(offset, len(data)) for offset, data in writes]
+        before = [disk.read(offset, length) for offset, length in regions]
+        pre, post = digest(before), digest(data for _, data in writes)
+        intents.append(get_journal(BACKUP_DIR).begin(
+            op, drive_number, serial, regions, pre, post, backup_file,
+            [digest([chunk]) for chunk in before], [digest([data]) for _, data in writes]
+        ))
+    return before_write
+
+
+def is_drive_disabled(drive_number, devices=None):
+    """Returns True if LBA 0 is blank, as disable_usb_drive() leaves it"""
+    devices = devices or get_device_backend()
+    with RawDisk.open(devices, drive_number) as disk:
+        return not disk.read(0, disk.geometry.logical).strip(b'\0')
+
+
+@audited('disable')
+@scheduled(METADATA)
+def disable_usb_drive(drive_number, devices=None, verify=True, serial=None):
+    """Disables the USB drive by overwriting the partition table.
+
+    With verify, the zeroed sector is synced and read back before success is reported.
+    The write is journaled so recover_operations() can undo it if the process dies.
+    Pass the serial when it is already known to save a lookup.
+    """
+    devices = devices or get_device_backend()
+    try:
+        if serial is None:
+            serial = _serial_or_none(drive_number, devices)
+        annotate(drive=drive_tag(drive_number), serial=serial, verify=verify)
+        backup_file = backup_partition_table(drive_number, devices, serial)
+        annotate(backup=backup_file)
+        if not backup_file:
+            return False, "backup_failed"
+
+        intents = []
+        try:
+            clear_boot_sector(drive_number, devices, verify,
+                              _journaled('disable', drive_number, serial, backup_file, intents))
+        except VerifyError as e:
+            # The intent stays open: the drive is in an unknown state until recovery looks at it
+            logging.error(f"Drive {drive_number} did not keep the disable write: {e}")
+            return False, ("verify_failed", str(e))
+        get_journal(BACKUP_DIR).end(intents[0])
+        logging.info(f"Drive {drive_number} disabled, backup: {backup_file}")
+        return True, ("disable_success", drive_number, backup_file)
+    except (PermissionError, OSError) as e:
+        logging.error(f"Error disabling drive {drive_number}: {e}")
+        return False, ("error_disable", str(e))
+
+
+@audited('enable')
+@scheduled(METADATA)
+def enable_usb_drive(drive_number, backup_file, devices=None, verify=True):
+    """Enables the USB drive by restoring the partition metadata from a backup reference or file.
+
+    With verify, every restored region is synced and read back before success is reported.
+    The writes are journaled so recover_operations() can finish them if the process dies.
+    """
+    devices = devices or get_device_backend()
+    annotate(drive=drive_tag(drive_number), backup=str(backup_file), verify=verify)
+    try:
+        if not os.path.exists(backup_file):
+            return False, ("backup_not_found", backup_file)
+
+        try:
+            sector, ref = load_backup(backup_file)
+        except StoreError as e:
+            logging.error(f"Cannot restore from {backup_file}: {e}")
+            return False, ("invalid_backup",)
+        layout = ref.get('layout')
+        if layout is None and len(sector) != 512:
+            return False, ("invalid_backup",)
+
+        serial = _serial_or_none(drive_number, devices)
+        annotate(serial=serial)
+        intents = []
+        try:
+            restore_metadata(drive_number, sector, layout, devices, verify,
+                             _journaled('enable', drive_number, serial, backup_file, intents))
+        except VerifyError as e:
+            logging.error(f"Drive {drive_number} did not keep the restored metadata: {e}")
+            return False, ("verify_failed", str(e))
+        except MetadataError as e:
+            logging.error(f"Cannot restore {backup_file} onto drive {drive_number}: {e}")
+            return False, ("backup_mismatch", str(e))
+        get_journal(BACKUP_DIR).end(intents[0])
+        logging.info(f"Drive {drive_number} enabled with backup: {backup_file}")
+        return True, ("enable_success", drive_number, backup_file)
+    except (PermissionError, OSError) as e:
+        logging.error(f"Error enabling drive {drive_number}: {e}")
+        return False, ("error_enable", str(e))
+
+
+def _has_serial(intent):
+    return bool(intent.serial) and intent.serial != "Unknown"
+
+
+def _find_journaled_drive(intent, devices):
+    """Returns the attached drive an intent was written for: by serial if it has one, else by number.
+
+    A number alone is only a candidate; the caller must check the disk's content.
+    """
+    drives = devices.physical_drives()
+    if _has_serial(intent):
+        for drive in drives:
+            if drive['serial'] == intent.serial:
+                return drive['index']
+        return None
+    for drive in drives:
+        if drive_tag(drive['index']) == drive_tag(intent.drive):
+            return drive['index']
+    return None
+
+
+def _torn(intent, chunks):
+    """True if every region holds either its pre- or its post-image, i.e. the write stopped part way"""
+    if not intent.pre_regions or not intent.post_regions:
+        return False
+    return all(digest([chunk]) in (pre, post)
+               for chunk, pre, post in zip(chunks, intent.pre_regions, intent.post_regions))
+
+
+def _part_written(chunk, pre, post):
+    """True if every byte of `chunk` is the pre- or the post-image byte, as a write torn inside a sector leaves it"""
+    return len(chunk) == len(pre) == len(post) and all(c in (a, b) for c, a, b in zip(chunk, pre, post))
+
+
+def _recover_one(intent, devices):
+    """Brings one interrupted operation to an end; returns (state, detail), state None if it stays open"""
+    drive_number = _find_journaled_drive(intent, devices)
+    if drive_number is None:
+        return None, "drive_missing"
+    geometry = devices.sector_sizes(drive_number)
+    with RawDisk.open(devices, drive_number, geometry) as disk:
+        chunks = [disk.read(offset, length) for offset, length in intent.regions]
+    current = digest(chunks)
+    if current == intent.post:
+        return DONE, "completed"
+    if not _has_serial(intent) and current != intent.pre:
+        # Drive numbers change between boots: without a serial, only the content proves it is the same disk
+        return None, "drive_unverified"
+    if not intent.backup or not os.path.exists(intent.backup):
+        return None, "backup_missing"
+
+    if intent.op == 'enable':
+        if current != intent.pre and not _torn(intent, chunks):
+            # Neither the old nor the half-restored table: the disk was rewritten since
+            return None, "changed_externally"
+        data, ref = load_backup(intent.backup)
+        # Restoring is idempotent, so the operation is simply finished
+        restore_metadata(drive_number, data, ref.get('layout'), devices)
+        return DONE, "rolled_forward"
+    if current == intent.pre:
+        return ABORTED, "not_started"
+    data, ref = load_backup(intent.backup)
+    (offset, length), = intent.regions
+    if offset != 0 or len(data) < length or \
+            (intent.pre_regions and digest([data[:length]]) != intent.pre_regions[0]):
+        return None, "backup_mismatch"
+    if not _torn(intent, chunks) and not _part_written(chunks[0], data[:length], bytes(length)):
+        # Not a half-done zeroing of this sector: the disk was repartitioned since, leave it be
+        return None, "changed_externally"
+    # A torn disable: put back the first sector from the backup taken just before it
+    with RawDisk.open(devices, drive_number, geometry, writable=True) as disk:
+        disk.write_verified(0, data[:length])
+    return ABORTED, "rolled_back"
+
+
+def recover_operations(devices=None):
+    """Finishes or rolls back disk writes that a previous run left half done.
+
+    Meant to run at startup. Every open journal intent is matched to its disk
+    by serial, since drive numbers change between boots, and the written
+    regions are hashed: the post-image means the write completed; an enable
+    that had not started or was torn part way is finished from its backup; a
+    disable that never wrote is closed and one whose sector holds only bytes
+    of the backed-up and the zeroed sector is rolled back to the backup.
+    Intents whose drive is not plugged in, whose disk was
+    rewritten since, or that have no serial and whose drive holds neither
+    image stay open for the next run. Returns a list of Recovery records.
+    """
+    devices = devices or get_device_backend()
+    try:
+        journal = get_journal(BACKUP_DIR)
+        intents = journal.open_intents()
+    except OSError as e:
+        logging.error(f"Cannot read the operation journal: {e}")
+        return []
+    results = []
+    for intent in intents:
+        try:
+            state, detail = _recover_one(intent, devices)
+        except (OSError, ValueError, StoreError) as e:
+            state, detail = None, str(e)
+        if state is not None:
+            journal.end(intent, state, recovered=detail)
+        level = logging.INFO if state is not None else logging.WARNING
+        logging.log(level, f"Recovery of {intent.op} on drive {intent.drive} ({intent.serial}): {detail}")
+        results.append(Recovery(intent.id, intent.op, intent.drive, intent.serial, state, detail))
+    if intents:
+        try:
+            journal.compact()
+        except OSError as e:
+            logging.error(f"Could not compact the operation journal: {e}")
+    return results
+
+
+@audited('image')
+@scheduled(BULK)
+def image_usb_drive(drive_number, image_path, devices=None, on_progress=None, cancel=None):
+    """Writes a full sparse image of the drive, resuming an interrupted one from its checkpoint"""
+    annotate(drive=drive_tag(drive_number), image=str(image_path))
+    try:
+        result = create_image(drive_number, image_path, devices, on_progress, cancel)
+    except (PermissionError, OSError, ImagingError) as e:
+        logging.error(f"Error imaging drive {drive_number}: {e}")
+        return False, ("error_image", str(e))
+    if not result.complete:
+        return False, ("image_incomplete", image_path)
+    return True, ("image_success", drive_number, result.path, result.sha256)
+
+
+@audited('wipe')
+@scheduled(BULK)
+def wipe_usb_drive(drive_number, passes=('zero',), verify='sample', devices=None, on_progress=None, cancel=None):
+    """Irreversibly overwrites the whole drive and verifies the result"""
+    annotate(drive=drive_tag(drive_number), passes='+'.join(passes), verify=verify)
+    try:
+        result = wipe_drive(drive_number, passes, verify, devices, on_progress, cancel)
+    except (PermissionError, OSError, WipeError) as e:
+        logging.error(f"Error wiping drive {drive_number}: {e}")
+        return False, ("error_wipe", str(e))
+    if not result.complete:
+        return False, ("wipe_incomplete", drive_number)
+    if result.verified is False:
+        return False, ("wipe_verify_failed", result.sha256)
+    return True, ("wipe_success", drive_number, result.sha256)
+
+
+def list_backups(drive_number=None, serial=None):
+    """Returns catalogued backups, newest first, optionally for one drive or serial"""
+    try:
+        catalog = get_catalog(BACKUP_DIR)
+    except Exception as e:
+        logging.error(f"Backup catalog unavailable: {e}")
+        return []
+    drive = None if drive_number is None else drive_tag(drive_number)
+    return catalog.entries(serial=serial, drive=drive)
+
+
+def latest_backup_for_drive(drive_number, serial=None):
+    """Returns the newest backup path for a disk serial, falling back to the drive number"""
+    if serial and serial != "Unknown":
+        backups = list_backups(serial=serial)
+        if backups:
+            return backups[0].path
+    backups = list_backups(drive_number)
+    return backups[0].path if backups else None
+
+
+@audited('delete')
+def delete_backup(backup_file):
+    """Deletes a backup reference (or legacy file) and its catalog entry.
+
+    The stored blob stays until collect_garbage() finds it unreferenced.
+    """
+    annotate(backup=str(backup_file))
+    if is_reference(backup_file):
+        try:
+            ref = BackupStore(Path(backup_file).parent).read_reference(backup_file)
+            annotate(drive=ref.get('drive'), serial=ref.get('serial'))
+        except StoreError:
+            pass
+    try:
+        os.remove(backup_file)
+        logging.info(f"Backup file deleted: {backup_file}")
+    except Exception as e:
+        logging.error(f"Error deleting backup: {backup_file} - {e}")
+        return False
+    try:
+        get_catalog(BACKUP_DIR).forget(backup_file)
+    except Exception as e:
+        logging.error(f"Could not remove {backup_file} from the backup catalog: {e}")
+    return True
+
+
+def best_backup_for_drive(drive_number, serial=None, devices=None):
+    """Returns the backup that best matches the drive's surviving metadata, else the latest one"""
+    match = suggest_backup(drive_number, list_backups(), devices, serial)
+    if match is not None:
+        logging.info(f"Backup {match.entry.path} matched drive {drive_number} (score {match.score})")
+        return match.entry.path
+    return latest_backup_for_drive(drive_number, serial)
+
+
+def collect_garbage():
+    """Removes stored blobs that no backup reference points to"""
+    return BackupStore(BACKUP_DIR).gc()
+
+
+def scrub_backups():
+    """Verifies every stored blob's hash in parallel; returns a ScrubResult"""
+    return BackupStore(BACKUP_DIR).scrub()
@@ -0,0 +1,372 @@
+import os
+import re
+import sys
+import errno
+import contextlib
+import subprocess
+import logging
+from collections import namedtuple
+from pathlib import Path
+from usbLock_metrics import span
+
+SectorGeometry = namedtuple('SectorGeometry', ['logical', 'physical'])
+DEFAULT_GEOMETRY = SectorGeometry(512, 512)
+
+
+def drive_tag(drive_number):
+    """Returns the short form of a drive identifier used in backup file names"""
+    if isinstance(drive_number, int):
+        return str(drive_number)
+    return os.path.basename(str(drive_number).rstrip('/\\'))
+
+
+def parse_drive_number(text):
+    """Parses a drive given on the command line: 1 -> 1, /dev/sdb stays a path"""
+    text = str(text).strip()
+    return int(text) if text.isdigit() else text
+
+
+class DeviceBackend:
+    """Base class for raw disk access.
+
+    path() maps a physical drive identifier to something open() accepts;
+    physical_drives() lists removable disks as {'index', 'serial'} dicts.
+    """
+    name = 'base'
+
+    def path(self, drive_number):
+        raise NotImplementedError
+
+    def open(self, drive_number, mode="rb"):
+        return open(self.path(drive_number), mode)
+
+    def open_raw(self, drive_number, writable=False):
+        """Opens the drive for sector-aligned I/O and returns an fd, bypassing the page cache where possible"""
+        flags = (os.O_RDWR if writable else os.O_RDONLY) | getattr(os, 'O_BINARY', 0)
+        path = self.path(drive_number)
+        direct = getattr(os, 'O_DIRECT', 0)
+        if direct:
+            try:
+                return os.open(path, flags | direct)
+            except OSError as e:
+                # tmpfs and some other filesystems refuse O_DIRECT for image files
+                if e.errno != errno.EINVAL:
+                    raise
+        return os.open(path, flags)
+
+    def sector_sizes(self, drive_number):
+        """Returns the drive's SectorGeometry (logical and physical sector size in bytes)"""
+        return DEFAULT_GEOMETRY
+
+    def disk_size(self, drive_number):
+        """Returns the drive's length in bytes"""
+        fd = os.open(self.path(drive_number), os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            return os.lseek(fd, 0, os.SEEK_END)
+        finally:
+            os.close(fd)
+
+    def exclusive(self, drive_number):
+        """Context manager held while writing over the drive's volumes, not just LBA 0"""
+        return contextlib.nullcontext()
+
+    def physical_drives(self):
+        raise NotImplementedError
+
+    def serial(self, drive_number):
+        """Returns the disk serial for a drive, or None if it is not listed"""
+        for drive in self.physical_drives():
+            if drive['index'] == drive_number:
+                return drive['serial']
+        return None
+
+    def disk_for_device(self, name):
+        """Maps a hotplug event's device name to a removable physical drive, or None"""
+        return None
+
+    def hotplug_name(self, drive_number):
+        """The device name hotplug events carry for the whole disk, the inverse of disk_for_device()"""
+        return drive_tag(drive_number)
+
+
+class WindowsDevices(DeviceBackend):
+    name = 'windows'
+
+    def path(self, drive_number):
+        return f"\\\\.\\PhysicalDrive{drive_number}"
+
+    def physical_drives(self):
+        with span('subprocess.wmic_diskdrive'):
+            result = subprocess.run(
+                'wmic diskdrive where "MediaType=\'Removable Media\'" get index,serialnumber',
+                capture_output=True,
+                text=True,
+                shell=True
+            )
+        lines = result.stdout.splitlines()
+        drives = []
+        for line in lines[1:]:
+            if line.strip():
+                parts = line.split()
+                if len(parts) >= 1:
+                    try:
+                        index = int(parts[0])
+                        serial = parts[1] if len(parts) > 1 else "Unknown"
+                        drives.append({'index': index, 'serial': serial})
+                    except ValueError:
+                        continue
+        return drives
+
+    def disk_for_device(self, name):
+        from usbLock_topology import TopologyError, get_topology
+        disk = re.match(r'^PhysicalDrive(\d+)$', name)
+        if disk:
+            index = int(disk.group(1))
+            return index if any(d['index'] == index for d in self.physical_drives()) else None
+        if not re.match(r'^[A-Za-z]:', name):
+            return None
+        try:
+            return get_topology().lookup(name).disk
+        except TopologyError:
+            return None
+
+    def hotplug_name(self, drive_number):
+        return f"PhysicalDrive{drive_number}"
+
+    def sector_sizes(self, drive_number):
+        # Raw PhysicalDrive handles are not cached by the cache manager, so open_raw()
+        # needs no extra flags here; only the sector sizes have to be queried.
+        import ctypes
+        from ctypes import wintypes
+        kernel32 = ctypes.windll.kernel32
+        kernel32.CreateFileW.restype = wintypes.HANDLE
+        # No access rights are needed for queries: share read/write, OPEN_EXISTING
+        handle = kernel32.CreateFileW(self.path(drive_number), 0, 3, None, 3, 0, None)
+        if handle in (None, wintypes.HANDLE(-1).value):
+            return DEFAULT_GEOMETRY
+        try:
+            returned = wintypes.DWORD()
+            # IOCTL_STORAGE_QUERY_PROPERTY, StorageAccessAlignmentProperty, PropertyStandardQuery
+            query = (wintypes.DWORD * 3)(6, 0, 0)
+            alignment = (wintypes.DWORD * 7)()
+            if kernel32.DeviceIoControl(handle, 0x2D1400, ctypes.byref(query), ctypes.sizeof(query),
+                                        ctypes.byref(alignment), ctypes.sizeof(alignment),
+                                        ctypes.byref(returned), None) and returned.value >= 24:
+                return SectorGeometry(alignment[4], max(alignment[5], alignment[4]))
+            # Older USB bridges only answer IOCTL_DISK_GET_DRIVE_GEOMETRY
+            geometry = (wintypes.DWORD * 6)()
+            if kernel32.DeviceIoControl(handle, 0x70000, None, 0, ctypes.byref(geometry),
+                                        ctypes.sizeof(geometry), ctypes.byref(returned), None):
+                return SectorGeometry(geometry[5], geometry[5])
+        finally:
+            kernel32.CloseHandle(handle)
+        return DEFAULT_GEOMETRY
+
+    def disk_size(self, drive_number):
+        # Seeking to the end of a PhysicalDrive handle does not give its length; the disk driver does
+        import ctypes
+        from ctypes import wintypes
+        kernel32 = ctypes.windll.kernel32
+        kernel32.CreateFileW.restype = wintypes.HANDLE
+        # GENERIC_READ, share read/write, OPEN_EXISTING
+        handle = kernel32.CreateFileW(self.path(drive_number), 0x80000000, 3, None, 3, 0, None)
+        if handle in (None, wintypes.HANDLE(-1).value):
+            raise OSError(f"Cannot open drive {drive_number}: {ctypes.WinError()}")
+        try:
+            length = ctypes.c_longlong()
+            returned = wintypes.DWORD()
+            # IOCTL_DISK_GET_LENGTH_INFO
+            if not kernel32.DeviceIoControl(handle, 0x7405C, None, 0, ctypes.byref(length),
+                                            ctypes.sizeof(length), ctypes.byref(returned), None):
+                raise OSError(f"Cannot read the length of drive {drive_number}: {ctypes.WinError()}")
+            return length.value
+        finally:
+            kernel32.CloseHandle(handle)
+
+    @contextlib.contextmanager
+    def exclusive(self, drive_number):
+        # Windows refuses raw writes inside a mounted volume until it is locked and dismounted
+        import ctypes
+        from ctypes import wintypes
+        from usbLock_topology import get_topology
+        kernel32 = ctypes.windll.kernel32
+        kernel32.CreateFileW.restype = wintypes.HANDLE
+        handles = []
+        try:
+            for location in get_topology().locations():
+                if location.disk != drive_number:
+                    continue
+                # GENERIC_READ | GENERIC_WRITE, share read/write, OPEN_EXISTING
+                handle = kernel32.CreateFileW(f"\\\\.\\{location.mountpoint[:2]}", 0xC0000000, 3, None, 3, 0, None)
+                if handle in (None, wintypes.HANDLE(-1).value):
+                    raise OSError(f"Cannot open volume {location.mountpoint}: {ctypes.WinError()}")
+                handles.append(handle)
+                returned = wintypes.DWORD()
+                # FSCTL_LOCK_VOLUME, then FSCTL_DISMOUNT_VOLUME
+                for code, action in ((0x90018, "lock"), (0x90020, "dismount")):
+                    if not kernel32.DeviceIoControl(handle, code, None, 0, None, 0, ctypes.byref(returned), None):
+                        raise OSError(f"Cannot {action} volume {location.mountpoint}: {ctypes.WinError()}")
+            yield
+        finally:
+            for handle in handles:
+                kernel32.CloseHandle(handle)
+
+
+class LinuxDevices(DeviceBackend):
+    """Block devices under /dev; drives are identified by path (/dev/sdb) or name (sdb)"""
+    name = 'linux'
+
+    def __init__(self, root='/'):
+        self.root = root
+
+    def path(self, drive_number):
+        name = drive_tag(drive_number)
+        return os.path.join(self.root, 'dev', name)
+
+    def physical_drives(self):
+        from usbLock_enum import LinuxBackend
+        from usbLock_topology import LinuxTopologySource
+        enum = LinuxBackend(self.root)
+        topology = LinuxTopologySource(self.root)
+        drives = []
+        try:
+            disks = sorted(os.listdir(os.path.join(self.root, 'sys', 'block')))
+        except OSError:
+            return drives
+        for disk in disks:
+            if enum.is_removable(disk):
+                drives.append({'index': f"/dev/{disk}", 'serial': topology.disk_serial(disk)})
+        return drives
+
+    def serial(self, drive_number):
+        from usbLock_topology import LinuxTopologySource
+        return LinuxTopologySource(self.root).disk_serial(drive_tag(drive_number))
+
+    def disk_for_device(self, name):
+        from usbLock_enum import LinuxBackend
+        block = os.path.join(self.root, 'sys', 'class', 'block', name)
+        if not os.path.exists(block):
+            return None
+        disk = name
+        # A partition's sysfs directory sits inside its parent disk's
+        if os.path.exists(os.path.join(block, 'partition')):
+            disk = os.path.basename(os.path.dirname(os.path.realpath(block)))
+        return f"/dev/{disk}" if LinuxBackend(self.root).is_removable(disk) else None
+
+    def disk_size(self, drive_number):
+        # sysfs counts 512-byte units whatever the logical sector size
+        try:
+            with open(os.path.join(self.root, 'sys', 'block', drive_tag(drive_number), 'size')) as f:
+                return int(f.read()) * 512
+        except (OSError, ValueError):
+            return super().disk_size(drive_number)
+
+    def sector_sizes(self, drive_number):
+        queue = os.path.join(self.root, 'sys', 'block', drive_tag(drive_number), 'queue')
+        try:
+            with open(os.path.join(queue, 'logical_block_size')) as f:
+                logical = int(f.read())
+            with open(os.path.join(queue, 'physical_block_size')) as f:
+                physical = int(f.read())
+        except (OSError, ValueError):
+            return DEFAULT_GEOMETRY
+        return SectorGeometry(logical, max(physical, logical))
+
+    @contextlib.contextmanager
+    def exclusive(self, drive_number):
+        from usbLock_topology import LinuxTopologySource
+        disk = f"/dev/{drive_tag(drive_number)}"
+        mounted = [l.mountpoint for l in LinuxTopologySource(self.root).build() if l.disk == disk]
+        if mounted:
+            raise OSError(errno.EBUSY, f"{disk} is mounted at {', '.join(mounted)}; unmount it first")
+        yield
+
+
+class ImageDevices(DeviceBackend):
+    """Disk image files standing in for physical drives: <directory>/drive<N>.img.
+
+    A drive<N>.serial file next to the image supplies its serial number and a
+    drive<N>.sectors file ("4096" or "512 4096") its logical and physical sector size.
+    """
+    name = 'image'
+    _IMAGE = re.compile(r'^drive(.+)\.img$')
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def path(self, drive_number):
+        return str(self.directory / f"drive{drive_tag(drive_number)}.img")
+
+    def physical_drives(self):
+        drives = []
+        if not self.directory.is_dir():
+            return drives
+        for entry in sorted(self.directory.iterdir()):
+            match = self._IMAGE.match(entry.name)
+            if not match:
+                continue
+            serial_file = entry.with_suffix('.serial')
+            try:
+                serial = serial_file.read_text().strip()
+            except OSError:
+                serial = f"IMAGE{match.group(1)}"
+            drives.append({'index': parse_drive_number(match.group(1)), 'serial': serial})
+        drives.sort(key=lambda d: (isinstance(d['index'], str), d['index']))
+        return drives
+
+    def disk_for_device(self, name):
+        match = self._IMAGE.match(f"{name}.img")
+        if not match or not os.path.exists(self.path(match.group(1))):
+            return None
+        return parse_drive_number(match.group(1))
+
+    def hotplug_name(self, drive_number):
+        return f"drive{drive_tag(drive_number)}"
+
+    def serial(self, drive_number):
+        tag = drive_tag(drive_number)
+        try:
+            return (self.directory / f"drive{tag}.serial").read_text().strip()
+        except OSError:
+            return f"IMAGE{tag}"
+
+    def disk_size(self, drive_number):
+        return os.stat(self.path(drive_number)).st_size
+
+    def sector_sizes(self, drive_number):
+        try:
+            sizes = [int(n) for n in (self.directory / f"drive{drive_tag(drive_number)}.sectors").read_text().split()]
+        except (OSError, ValueError):
+            return DEFAULT_GEOMETRY
+        if not sizes:
+            return DEFAULT_GEOMETRY
+        return SectorGeometry(sizes[0], max(sizes[-1], sizes[0]))
+
+
+_default = None
+
+
+def get_device_backend():
+    """Returns the process-wide device backend.
+
+    Set USBLOCK_IMAGE_DIR to operate on image files instead of real disks.
+    """
+    global _default
+    if _default is None:
+        image_dir = os.environ.get('USBLOCK_IMAGE_DIR')
+        if image_dir:
+            _default = ImageDevices(image_dir)
+        elif os.name == 'nt':
+            _default = WindowsDevices()
+        elif sys.platform.startswith('linux'):
+            _default = LinuxDevices()
+        else:
+            raise RuntimeError(f"No device backend for platform {sys.platform}")
+        logging.info(f"Using {_default.name} device backend")
+    return _default
+
+
+def set_device_backend(backend):
+    """Replaces the process-wide device backend, e.g. with ImageDevices in tests"""
+    global _default
+    _default = backend
@@ -0,0 +1,369 @@
+import os
+import sys
+import time
+import subprocess
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from usbLock_metrics import span
+
+# Seconds a single leftover probe (label/size lookup) may take before it is given up
+PROBE_TIMEOUT = 2.0
+PROBE_WORKERS = 32
+
+UNKNOWN_SIZE = "Unknown"
+NO_LABEL = "No Label"
+
+
+def format_size(nbytes):
+    """Formats a byte count the way the drive list shows it"""
+    if nbytes is None:
+        return UNKNOWN_SIZE
+    return f"{nbytes / (1024**3):.2f} GB"
+
+
+def make_drive(device, mountpoint, fstype='', size_bytes=None, label=None):
+    """Builds a drive record; fields left as None are resolved by a probe"""
+    return {
+        'device': device,
+        'mountpoint': mountpoint,
+        'fstype': fstype,
+        'size_bytes': size_bytes,
+        'label': label
+    }
+
+
+class EnumerationBackend:
+    """Base class for drive enumeration backends.
+
+    query() must return every removable drive in one bulk pass. Fields it
+    could not fill in are left as None and handed to probe(), which the
+    engine runs concurrently with a timeout.
+    """
+    name = 'base'
+
+    def query(self):
+        raise NotImplementedError
+
+    def probe(self, drive):
+        """Returns a dict with the missing fields for a single drive"""
+        return {}
+
+    def query_device(self, name):
+        """Returns the drives on one device; backends override this to avoid a full query"""
+        return [drive for drive in self.query() if device_key(drive['device']) == name]
+
+
+class WindowsBackend(EnumerationBackend):
+    """One wmic query for all removable volumes instead of one `vol` per drive"""
+    name = 'windows'
+
+    def query(self):
+        try:
+            with span('subprocess.wmic_logicaldisk'):
+                result = subprocess.run(
+                    'wmic logicaldisk where "DriveType=2" get DeviceID,FileSystem,Size,VolumeName /format:csv',
+                    capture_output=True,
+                    text=True,
+                    shell=True
+                )
+        except OSError as e:
+            logging.error(f"Bulk drive query failed: {e}")
+            return self._query_fallback()
+        if result.returncode != 0:
+            return self._query_fallback()
+        return parse_wmic_logicaldisk_csv(result.stdout)
+
+    def query_device(self, name):
+        # Volumes are only ever looked up by drive letter; PhysicalDrive<N> events carry none
+        if name[1:2] != ':':
+            return []
+        return super().query_device(name)
+
+    def _query_fallback(self):
+        """Lists partitions with psutil and leaves label/size to the probes"""
+        import psutil
+        drives = []
+        with span('psutil.disk_partitions'):
+            partitions = psutil.disk_partitions()
+        for disk in partitions:
+            if 'removable' in disk.opts.lower() or 'usb' in disk.device.lower():
+                drives.append(make_drive(disk.device, disk.mountpoint, disk.fstype))
+        return drives
+
+    def probe(self, drive):
+        import ctypes
+        import psutil
+        info = {}
+        if drive['size_bytes'] is None:
+            with span('psutil.disk_usage'):
+                info['size_bytes'] = psutil.disk_usage(drive['mountpoint']).total
+        if drive['label'] is None:
+            buf = ctypes.create_unicode_buffer(261)
+            with span('win32.GetVolumeInformationW'):
+                ok = ctypes.windll.kernel32.GetVolumeInformationW(
+                    ctypes.c_wchar_p(drive['mountpoint']), buf, len(buf),
+                    None, None, None, None, 0
+                )
+            info['label'] = buf.value if ok and buf.value else NO_LABEL
+        return info
+
+
+def parse_wmic_logicaldisk_csv(output):
+    """Parses `wmic logicaldisk ... /format:csv` output into drive records"""
+    drives = []
+    header = None
+    for line in output.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        fields = line.split(',')
+        if header is None:
+            header = fields
+            continue
+        row = dict(zip(header, fields))
+        device_id = row.get('DeviceID', '')
+        if not device_id:
+            continue
+        size = row.get('Size', '')
+        drives.append(make_drive(
+            f"{device_id}\\",
+            f"{device_id}\\",
+            row.get('FileSystem', ''),
+            int(size) if size.isdigit() else None,
+            row.get('VolumeName') or NO_LABEL
+        ))
+    return drives
+
+
+def device_key(device):
+    """Returns the short name a device is known by in hotplug events (sdb1, E:)"""
+    if device[1:2] == ':':
+        return device[:2].upper()
+    return device.rstrip('/').rsplit('/', 1)[-1]
+
+
+def _unescape_udev(name):
+    """Decodes the \\xNN escapes udev uses in /dev/disk/by-label names"""
+    if '\\x' not in name:
+        return name
+    return name.encode('latin-1').decode('unicode_escape').encode('latin-1').decode('utf-8', 'replace')
+
+
+class LinuxBackend(EnumerationBackend):
+    """Reads sysfs, /proc/mounts and the udev database directly.
+
+    `root` lets the whole tree be redirected to a fixture directory.
+    """
+    name = 'linux'
+
+    def __init__(self, root='/'):
+        self.root = root
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def _read(self, *parts):
+        try:
+            with open(self._path(*parts)) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def _mounts(self):
+        mounts = {}
+        text = self._read('proc', 'mounts') or ''
+        for line in text.splitlines():
+            fields = line.split()
+            if len(fields) >= 3 and fields[0].startswith('/dev/'):
+                name = os.path.basename(fields[0])
+                # /proc/mounts escapes spaces as \040
+                mountpoint = fields[1].replace('\\040', ' ')
+                mounts.setdefault(name, (mountpoint, fields[2]))
+        return mounts
+
+    def _labels(self):
+        labels = {}
+        by_label = self._path('dev', 'disk', 'by-label')
+        try:
+            entries = os.listdir(by_label)
+        except OSError:
+            return labels
+        for entry in entries:
+            try:
+                target = os.readlink(os.path.join(by_label, entry))
+            except OSError:
+                continue
+            labels[os.path.basename(target)] = _unescape_udev(entry)
+        return labels
+
+    def _udev_props(self, dev_numbers):
+        props = {}
+        text = self._read('run', 'udev', 'data', f"b{dev_numbers}")
+        if not text:
+            return props
+        for line in text.splitlines():
+            if line.startswith('E:') and '=' in line:
+                key, value = line[2:].split('=', 1)
+                props[key] = value
+        return props
+
+    def is_removable(self, disk):
+        if self._read('sys', 'block', disk, 'removable') == '1':
+            return True
+        # USB hard disks report removable=0, but their device path runs through a USB bus
+        try:
+            return '/usb' in os.readlink(self._path('sys', 'block', disk))
+        except OSError:
+            return False
+
+    def _query_disk(self, disk, mounts, labels):
+        drives = []
+        names = [disk]
+        try:
+            names += sorted(
+                entry for entry in os.listdir(self._path('sys', 'block', disk))
+                if os.path.exists(self._path('sys', 'block', disk, entry, 'partition'))
+            )
+        except OSError:
+            pass
+        for name in names:
+            if name not in mounts:
+                continue
+            mountpoint, fstype = mounts[name]
+            sys_dir = ('sys', 'block', disk) if name == disk else ('sys', 'block', disk, name)
+            sectors = self._read(*sys_dir, 'size')
+            props = self._udev_props(self._read(*sys_dir, 'dev') or '')
+            label = labels.get(name) or props.get('ID_FS_LABEL') or NO_LABEL
+            drives.append(make_drive(
+                f"/dev/{name}",
+                mountpoint,
+                fstype or props.get('ID_FS_TYPE', ''),
+                # sysfs always reports sizes in 512-byte units
+                int(sectors) * 512 if sectors and sectors.isdigit() else None,
+                label
+            ))
+        return drives
+
+    def query(self):
+        mounts = self._mounts()
+        labels = self._labels()
+        drives = []
+        try:
+            disks = sorted(os.listdir(self._path('sys', 'block')))
+        except OSError:
+            return drives
+        for disk in disks:
+            if self.is_removable(disk):
+                drives += self._query_disk(disk, mounts, labels)
+        return drives
+
+    def query_device(self, name):
+        block = self._path('sys', 'class', 'block', name)
+        if not os.path.exists(block):
+            return []
+        # A partition's sysfs directory sits inside its parent disk's
+        disk = name
+        if os.path.exists(os.path.join(block, 'partition')):
+            disk = os.path.basename(os.path.dirname(os.path.realpath(block)))
+        if not self.is_removable(disk):
+            return []
+        drives = self._query_disk(disk, self._mounts(), self._labels())
+        if name != disk:
+            drives = [drive for drive in drives if device_key(drive['device']) == name]
+        return drives
+
+    def probe(self, drive):
+        st = os.statvfs(drive['mountpoint'])
+        return {'size_bytes': st.f_blocks * st.f_frsize}
+
+
+class FakeBackend(EnumerationBackend):
+    """In-memory backend for tests and benchmarks.
+
+    Drives whose device is listed in `unresolved` come back from query()
+    without label and size, and each probe for them sleeps `probe_latency`.
+    """
+    name = 'fake'
+
+    def __init__(self, drives, probe_latency=0.0, unresolved=()):
+        self.drives = [dict(drive) for drive in drives]
+        self.probe_latency = probe_latency
+        self.unresolved = set(unresolved)
+        self.probe_count = 0
+
+    def query(self):
+        drives = []
+        for drive in self.drives:
+            drive = dict(drive)
+            if drive['device'] in self.unresolved:
+                drive['label'] = None
+                drive['size_bytes'] = None
+            drives.append(drive)
+        return drives
+
+    def probe(self, drive):
+        self.probe_count += 1
+        if self.probe_latency:
+            time.sleep(self.probe_latency)
+        for original in self.drives:
+            if original['device'] == drive['device']:
+                return {'label': original['label'], 'size_bytes': original['size_bytes']}
+        return {}
+
+
+def get_default_backend():
+    """Picks the enumeration backend for the running platform"""
+    if os.environ.get('USBLOCK_IMAGE_DIR'):
+        # Image files have no mounted volumes
+        return FakeBackend([])
+    if os.name == 'nt':
+        return WindowsBackend()
+    if sys.platform.startswith('linux'):
+        return LinuxBackend()
+    raise RuntimeError(f"No drive enumeration backend for platform {sys.platform}")
+
+
+def _probe_pending(backend, pending, timeout):
+    """Runs backend.probe for every pending drive concurrently, bounded by timeout"""
+    executor = ThreadPoolExecutor(max_workers=min(PROBE_WORKERS, len(pending)))
+    try:
+        futures = {executor.submit(backend.probe, drive): drive for drive in pending}
+        done, not_done = wait(futures, timeout=timeout)
+        for future in done:
+            drive = futures[future]
+            try:
+                drive.update(future.result())
+            except Exception as e:
+                logging.warning(f"Probe failed for {drive['device']}: {e}")
+        for future in not_done:
+            logging.warning(f"Probe timed out for {futures[future]['device']}")
+    finally:
+        # Do not wait for probes stuck on a hung device
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _complete(backend, drives, timeout):
+    """Fills in fields the bulk query left empty and formats sizes"""
+    pending = [d for d in drives if d['label'] is None or d['size_bytes'] is None]
+    if pending:
+        _probe_pending(backend, pending, timeout)
+    for drive in drives:
+        if drive['label'] is None:
+            drive['label'] = NO_LABEL
+        drive['size'] = format_size(drive['size_bytes'])
+    return drives
+
+
+def enumerate_drives(backend=None, timeout=PROBE_TIMEOUT):
+    """Returns all removable drives using one bulk query plus concurrent probes"""
+    backend = backend or get_default_backend()
+    with span('enum.query'):
+        drives = backend.query()
+    with span('enum.complete'):
+        return _complete(backend, drives, timeout)
+
+
+def enumerate_device(name, backend=None, timeout=PROBE_TIMEOUT):
+    """Returns the drives on a single device, for incremental hotplug updates"""
+    backend = backend or get_default_backend()
+    return _complete(backend, backend.query_device(name), timeout)
@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import itertools
+from collections import namedtuple
+from usbLock_agent import AGENT_PORT, RPC_PATH
+
+# Agents called at once; the rest wait for a free slot
+FLEET_CONCURRENCY = 64
+# Seconds one agent gets to connect and answer a call
+FLEET_TIMEOUT = 30.0
+
+# One agent's answer: result is the JSON-RPC result, error a message when the call failed
+HostResult = namedtuple('HostResult', ['host', 'success', 'result', 'error', 'duration'])
+
+
+class FleetError(Exception):
+    """Raised when an agent cannot be reached or answers with an error"""
+
+
+def parse_host(text):
+    """Parses host[:port] (or [v6addr]:port) into a (host, port) pair"""
+    text = text.strip()
+    if text.startswith('['):
+        host, _, rest = text[1:].partition(']')
+        port = rest[1:] if rest.startswith(':') else ''
+    elif text.count(':') == 1:
+        host, _, port = text.partition(':')
+    else:
+        host, port = text, ''
+    if not host:
+        raise ValueError(f"No host in {text!r}")
+    return host, int(port) if port else AGENT_PORT
+
+
+def load_hosts(spec):
+    """Reads agents from a file with one host[:port] per line (# comments) or a comma-separated list"""
+    if os.path.isfile(spec):
+        with open(spec, encoding='utf-8') as f:
+            lines = [line.split('#', 1)[0] for line in f]
+    else:
+        lines = spec.split(',')
+    hosts = [parse_host(line) for line in lines if line.strip()]
+    # The same agent listed twice would be called twice
+    return list(dict.fromkeys(hosts))
+
+
+def host_label(host):
+    name, port = host
+    return f"[{name}]:{port}" if ':' in name else f"{name}:{port}"
+
+
+class AgentClient:
+    """A kept-alive HTTP/1.1 connection to one agent, carrying one JSON-RPC call at a time.
+
+    The connection is opened on the first call and reused by the next ones;
+    if the agent closed it while idle, the call is retried once on a new one.
+    """
+
+    def __init__(self, host, port=AGENT_PORT, token=None):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.connects = 0
+        self._ids = itertools.count(1)
+        self._lock = asyncio.Lock()
+        self._reader = None
+        self._writer = None
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self.connects += 1
+
+    def _request(self, method, params):
+        body = json.dumps({'jsonrpc': '2.0', 'id': next(self._ids), 'method': method, 'params': params})
+        body = body.encode('utf-8')
+        headers = [f"POST {RPC_PATH} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                   "Content-Type: application/json", f"Content-Length: {len(body)}"]
+        if self.token:
+            headers.append(f"Authorization: Bearer {self.token}")
+        return ('\r\n'.join(headers) + '\r\n\r\n').encode('ascii') + body
+
+    async def _exchange(self, request):
+        self._writer.write(request)
+        await self._writer.drain()
+        status = await self._reader.readline()
+        if not status:
+            raise ConnectionResetError("agent closed the connection")
+        parts = status.decode('latin-1').split(None, 2)
+        if len(parts) < 2 or not parts[1].isdigit():
+            raise FleetError(f"not an HTTP response: {status[:80]!r}")
+        headers = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        body = await self._reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return int(parts[1]), body
+
+    async def call(self, method, params=None):
+        """Returns the result of one call; raises FleetError or OSError"""
+        request = self._request(method, params or {})
+        async with self._lock:
+            reused = self._writer is not None
+            if not reused:
+                await self._connect()
+            try:
+                status, body = await self._exchange(request)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if not reused:
+                    raise
+                # The agent dropped the idle connection before reading the request
+                await self._connect()
+                try:
+                    status, body = await self._exchange(request)
+                except BaseException:
+                    self.close()
+                    raise
+            except BaseException:
+                # Timed out or cancelled mid-call: the stream is out of step, start over next time
+                self.close()
+                raise
+        if status != 200:
+            raise FleetError(f"HTTP {status}: {body[:200].decode('utf-8', 'replace')}")
+        try:
+            response = json.loads(body)
+        except ValueError as e:
+            raise FleetError(f"unreadable response: {e}")
+        if response.get('error'):
+            raise FleetError(response['error'].get('message', 'agent error'))
+        return response.get('result')
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+class FleetController:
+    """Calls the same method on many agents at once and yields their answers as they arrive.
+
+    At most `concurrency` calls are in flight; each gets `timeout` seconds.
+    Connections stay open between calls, so a second operation on the same
+    fleet skips the TCP handshakes.
+    """
+
+    def __init__(self, hosts, token=None, timeout=FLEET_TIMEOUT, concurrency=FLEET_CONCURRENCY):
+        self.clients = {host: AgentClient(host[0], host[1], token) for host in hosts}
+        self.timeout = timeout
+        self.concurrency = concurrency
+
+    async def _call(self, host, client, method, params, gate):
+        async with gate:
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(client.call(method, params), self.timeout)
+            except asyncio.TimeoutError:
+                error = f"no answer within {self.timeout:g}s"
+            except (OSError, FleetError) as e:
+                error = str(e) or type(e).__name__
+            else:
+                return HostResult(host_label(host), True, result, None, time.perf_counter() - started)
+        logging.warning(f"Agent {host_label(host)} {method} failed: {error}")
+        return HostResult(host_label(host), False, None, error, time.perf_counter() - started)
+
+    async def stream(self, method, params=None):
+        """Async iterator of HostResult, in completion order"""
+        gate = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.ensure_future(self._call(host, client, method, params, gate))
+                 for host, client in self.clients.items()]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+
+def run_fleet(hosts, method, params=None, on_result=None, **options):
+    """Blocking helper: calls method on every agent, passes each HostResult to on_result, returns all.
+
+    Keyword arguments go to FleetController (token, timeout, concurrency).
+    """
+    async def main():
+        results = []
+        async with FleetController(hosts, **options) as fleet:
+            async for result in fleet.stream(method, params):
+                results.append(result)
+                if on_result:
+                    on_result(result)
+        return results
+
+    started = time.perf_counter()
+    results = asyncio.run(main())
+    failed = sum(1 for r in results if not r.success)
+    logging.info(f"Fleet {method}: {len(results) - failed} agents answered, {failed} failed "
+                 f"in {time.perf_counter() - started:.2f}s")
+    return results
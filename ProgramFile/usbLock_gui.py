@@ -1,20 +1,28 @@
-import psutil
-import subprocess
+import time
+_STARTED = time.perf_counter()
 import os
-import ctypes
 import sys
-import time
+import json
+import threading
+import logging
+from collections import deque
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
+_TK_IMPORTED = time.perf_counter()
 import ttkbootstrap as ttkb
 from ttkbootstrap.constants import *
-import threading
-import logging
-from pathlib import Path
+_TTKB_IMPORTED = time.perf_counter()
+import usbLock_metrics as metrics
+from usbLock_views import (
+    PLACEHOLDER, DRIVE_COLUMNS, BACKUP_COLUMNS, BackupListModel, diff_rows, volume_rows, drive_rows, drive_key
+)
+from usbLock_admin import is_admin, run_as_admin
 
-# Setup logging
-logging.basicConfig(filename='usblock.log', level=logging.INFO, 
-                   format='%(asctime)s - %(levelname)s - %(message)s')
+# Imported in the background once the window is on screen; nothing here is needed to draw it
+BACKEND_MODULES = ('usbLock_audit', 'usbLock_core', 'usbLock_inventory', 'usbLock_hotplug', 'usbLock_batch')
+GUI_STATE_NAME = "gui_state.json"
+DEFAULT_THEME = "superhero"
+FALLBACK_THEME = "darkly"
 
 # Language texts
 TEXTS = {
@@ -34,6 +42,8 @@ TEXTS = {
     'enable_success': 'Drive {drive} enabled successfully. Remove and reinsert the USB.',
     'backup_not_found': 'Backup file {backup} not found.',
     'invalid_backup': 'Backup file is invalid (must be 512 bytes).',
+    'backup_mismatch': 'Backup does not fit this drive: {error}',
+    'verify_failed': 'The drive did not keep the written data; it may be faulty or write-protected: {error}',
     'error_disable': 'Error disabling drive: {error}',
     'error_enable': 'Error enabling drive: {error}',
     'error_drive_number': 'Could not find physical drive number.',
@@ -43,203 +53,298 @@ TEXTS = {
     'help_text': '''USBLock allows you to disable or enable USB drives.
 - Disable: Makes the drive unrecognizable by overwriting its partition table (data is preserved).
 - Enable: Restores the drive using a backup file.
+- Image: Saves a full copy of the drive to an image file; an interrupted image resumes where it stopped.
+- Wipe: Permanently erases retired drives by overwriting every sector, then verifies the result.
 - Backup files are saved in the USBLock_Backups folder.
 - Always run as administrator.
 - Safely remove and reinsert the USB after operations.''',
     'select_backup': 'Select Backup File',
     'backup_label': 'Available Backups:',
-    'delete_backup': 'Delete backup file after enabling?'
+    'search': 'Search:',
+    'page': 'Page {page} of {pages} ({count} backups)',
+    'no_backups': 'No backups found.',
+    'drive_columns': {'drive': 'Drive', 'label': 'Label', 'size': 'Size', 'fstype': 'Type', 'serial': 'Serial'},
+    'backup_columns': {'created': 'Created', 'serial': 'Serial', 'drive': 'Drive', 'name': 'File'},
+    'delete_backup': 'Delete backup file after enabling?',
+    'scanning': 'Scanning for drives...',
+    'starting': 'Starting...',
+    'confirm_disable_batch': 'Are you sure you want to disable {count} drives ({drives})? They will become unrecognizable.',
+    'confirm_enable_batch': 'Are you sure you want to enable {count} drives using the best matching backup of each?',
+    'no_backup_for_drive': 'No backup found for drive {drive}.',
+    'batch_title': 'Batch Operation',
+    'batch_summary': '{ok} of {total} drive(s) succeeded, {failed} failed.',
+    'backup_suggested': 'Suggested backup: {backup} (score {score}).',
+    'no_backup_match': 'No backup clearly matches this drive; please choose one.',
+    'image': 'Image Selected',
+    'save_image': 'Save Drive Image',
+    'image_one_drive': 'Select a single drive to image; each image needs its own file.',
+    'confirm_image': 'Write a full image of drive {drive} to {backup}? This reads the whole drive and can take a long time.',
+    'resume_image': 'An interrupted image of this drive exists at {backup}. Resume it?',
+    'imaging': 'Imaging drive {drive}: {percent:.0f}% at {rate:.1f} MB/s',
+    'image_success': 'Drive {drive} imaged to {backup}.',
+    'image_incomplete': 'Imaging was interrupted; image the drive to {error} again to resume.',
+    'error_image': 'Error imaging drive: {error}',
+    'wipe': 'Wipe Selected',
+    'confirm_wipe': 'Wipe {count} drive(s) ({drives})? Every sector will be overwritten with zeros and all data will be lost.',
+    'confirm_wipe_again': 'This cannot be undone and no backup is kept. Wipe now?',
+    'wipe_success': 'Drive {drive} wiped and verified. Verification hash: {backup}',
+    'wipe_incomplete': 'Wipe of drive {error} was interrupted; the drive is only partly overwritten.',
+    'wipe_verify_failed': 'Wipe verification failed (hash {error}); the drive may be faulty.',
+    'error_wipe': 'Error wiping drive: {error}',
+    'metrics_title': 'Timings',
+    'metrics_enabled': 'Timing instrumentation is now on. Timings appear here as drives are scanned and written.',
+    'export_metrics': 'Export Timings',
+    'reset': 'Reset',
+    'recovery_title': 'Interrupted Operations',
+    'recovered': 'USBLock was stopped in the middle of {count} operation(s) last time:\n{details}',
+    'recovery_line': '- {op} of drive {drive}: {detail}',
+    'recovery_outcomes': {
+        'completed': 'had completed',
+        'rolled_forward': 'finished from its backup',
+        'not_started': 'had not started; nothing changed',
+        'rolled_back': 'undone from its backup',
+        'drive_missing': 'drive not connected; will be checked next time',
+        'backup_missing': 'backup is missing; check the drive by hand',
+        'backup_mismatch': 'backup does not fit the drive; check it by hand',
+        'changed_externally': 'drive was rewritten since; left as it is',
+        'drive_unverified': 'a different disk may now have this number; will be checked next time'
+    }
 }
 
-def is_admin():
-    """Check if the script is running with admin privileges"""
-    try:
-        return ctypes.windll.shell32.IsUserAnAdmin()
-    except:
-        return False
+class StartupProfile:
+    """Timings of the startup phases for --profile-startup, from the start of this module's import.
 
-def run_as_admin():
-    """Restart the script with admin privileges"""
-    try:
-        ctypes.windll.shell32.ShellExecuteW(
-            None, 
-            "runas", 
-            sys.executable, 
-            " ".join(sys.argv), 
-            None, 
-            1
-        )
-    except Exception as e:
-        logging.error(f"Failed to run as admin: {e}")
-    sys.exit()
+    Phases on the background loader thread overlap the Tk thread's, so each
+    is kept with its own start offset rather than as a running total.
+    """
+    def __init__(self, started):
+        self.started = started
+        self.phases = []
+        self._lock = threading.Lock()
+    
+    def record(self, name, began, ended=None):
+        ended = time.perf_counter() if ended is None else ended
+        with self._lock:
+            self.phases.append((name, began - self.started, ended - began))
+    
+    def since(self, name, began):
+        """Records a phase that started at `began` and ends now; returns now"""
+        now = time.perf_counter()
+        self.record(name, began, now)
+        return now
+    
+    def report(self):
+        with self._lock:
+            phases = sorted(self.phases, key=lambda p: p[1])
+        lines = [f"{'phase':<32} {'start ms':>9} {'took ms':>9}"]
+        lines += [f"{name:<32} {start * 1000:>9.1f} {took * 1000:>9.1f}" for name, start, took in phases]
+        return "\n".join(lines)
+    
+    def to_dict(self):
+        with self._lock:
+            return {name: {'start_ms': round(start * 1000, 3), 'took_ms': round(took * 1000, 3)}
+                    for name, start, took in self.phases}
 
-def get_usb_drives():
-    """Returns a list of mounted USB drives with size and label"""
-    usb_drives = []
-    for disk in psutil.disk_partitions():
-        if 'removable' in disk.opts.lower() or 'usb' in disk.device.lower():
-            try:
-                usage = psutil.disk_usage(disk.mountpoint)
-                total_size = f"{usage.total / (1024**3):.2f} GB"
-                # Get volume label
-                try:
-                    result = subprocess.run(
-                        f'vol {disk.device}', 
-                        capture_output=True, 
-                        text=True, 
-                        shell=True
-                    )
-                    label = "No Label"
-                    if result.returncode == 0:
-                        lines = result.stdout.splitlines()
-                        for line in lines:
-                            if 'is' in line and disk.device[0] in line:
-                                parts = line.split(' is ')
-                                if len(parts) > 1:
-                                    label = parts[1].strip()
-                                break
-                except:
-                    label = "No Label"
-            except:
-                total_size = "Unknown"
-                label = "No Label"
-            usb_drives.append({
-                'device': disk.device,
-                'mountpoint': disk.mountpoint,
-                'fstype': disk.fstype,
-                'size': total_size,
-                'label': label
-            })
-    return usb_drives
+STARTUP = StartupProfile(_STARTED)
+STARTUP.record('import tkinter', _STARTED, _TK_IMPORTED)
+STARTUP.record('import ttkbootstrap', _TK_IMPORTED, _TTKB_IMPORTED)
+STARTUP.record('import usbLock_gui', _TTKB_IMPORTED)
+
+def state_path():
+    """gui_state.json next to the program, like the logs folder"""
+    base = os.path.dirname(sys.executable) if getattr(sys, 'frozen', False) else os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base, GUI_STATE_NAME)
 
-def get_all_physical_drives():
-    """Returns a list of all removable physical drive numbers with serial numbers"""
+def load_state():
+    """Theme, window geometry and list layout saved by the last run; {} on first start"""
     try:
-        result = subprocess.run(
-            'wmic diskdrive where "MediaType=\'Removable Media\'" get index,serialnumber', 
-            capture_output=True, 
-            text=True, 
-            shell=True
-        )
-        lines = result.stdout.splitlines()
-        drives = []
-        for line in lines[1:]:
-            if line.strip():
-                parts = line.split()
-                if len(parts) >= 1:
-                    try:
-                        index = int(parts[0])
-                        serial = parts[1] if len(parts) > 1 else "Unknown"
-                        drives.append({'index': index, 'serial': serial})
-                    except ValueError:
-                        continue
-        return drives
-    except Exception as e:
-        logging.error(f"Error retrieving physical drives: {e}")
-        return []
+        with open(state_path(), encoding='utf-8') as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except (OSError, ValueError):
+        return {}
 
-def get_physical_drive_number(mountpoint):
-    """Extracts the physical drive number from the mountpoint"""
+def save_state(state):
+    path = state_path()
     try:
-        # Get the drive letter
-        drive_letter = mountpoint[0]
-        
-        # Find the physical drive number for this drive letter
-        result = subprocess.run(
-            f'wmic partition where "DriveLetter=\'{drive_letter}:\'" get DiskIndex', 
-            capture_output=True, 
-            text=True, 
-            shell=True
-        )
+        with open(f"{path}.tmp", "w", encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(f"{path}.tmp", path)
+    except OSError as e:
+        logging.warning(f"Could not save window state to {path}: {e}")
+
+def apply_rows(tree, shown, rows):
+    """Brings a Treeview from `shown` ({iid: values} in order) to `rows`; returns the new `shown`.
+
+    Only rows that were added, removed or changed are touched, so the
+    selection and scroll position of the others survive the update.
+    """
+    diff = diff_rows(shown, rows)
+    if diff.removed:
+        tree.delete(*diff.removed)
+    for key, values in diff.changed:
+        tree.item(key, values=values)
+    if diff.reordered:
+        for index, (key, _) in enumerate(rows):
+            if key in shown:
+                tree.move(key, '', index)
+    for index, key, values in diff.added:
+        tree.insert('', index, iid=key, values=values, tags=('placeholder',) if key == PLACEHOLDER else ())
+    return dict(rows)
+
+def placeholder_row(text):
+    return [(PLACEHOLDER, (text,) + ('',) * (len(DRIVE_COLUMNS) - 1))]
+
+def format_message(success, message, drive):
+    """Turns an operation's (key, *args) message into display text"""
+    if isinstance(message, str) and message in TEXTS:
+        message = (message,)
+    if not isinstance(message, tuple):
+        return str(message)
+    key, *args = message
+    if key not in TEXTS:
+        return str(message)
+    if success:
+        if len(args) >= 2:
+            return TEXTS[key].format(drive=drive, backup=os.path.basename(args[1]))
+        return TEXTS[key].format(drive=drive)
+    return TEXTS[key].format(drive=drive, error=args[0] if args else "Unknown error")
+
+class BatchWindow:
+    """Live per-drive progress and result table for a batch operation"""
+    def __init__(self, root, title, jobs):
+        self.window = tk.Toplevel(root)
+        self.window.title(title)
+        self.window.geometry("560x360")
         
-        lines = result.stdout.splitlines()
-        for line in lines[1:]:
-            if line.strip() and line.strip().isdigit():
-                return int(line.strip())
-        
-        # Alternative method
-        result = subprocess.run(
-            'wmic diskdrive get index,size', 
-            capture_output=True, 
-            text=True, 
-            shell=True
-        )
-        # This is a simplified approach - in production you'd need more robust mapping
-        return 1  # Default for first removable drive
+        frame = ttk.Frame(self.window, padding=10)
+        frame.pack(fill=BOTH, expand=True)
         
-    except Exception as e:
-        logging.error(f"Error retrieving drive number: {e}")
-        return None
+        self.tree = ttk.Treeview(frame, columns=('drive', 'status', 'time'), show='headings', height=10)
+        self.tree.heading('drive', text='Drive')
+        self.tree.heading('status', text='Status')
+        self.tree.heading('time', text='Time')
+        self.tree.column('drive', width=150)
+        self.tree.column('status', width=300)
+        self.tree.column('time', width=70, anchor=E)
+        self.tree.pack(fill=BOTH, expand=True)
+        
+        self.rows = {job.key: self.tree.insert('', END, values=(job.label, 'Queued', '')) for job in jobs}
+        
+        self.progress = ttkb.Progressbar(frame, bootstyle="info-striped", mode='determinate', maximum=len(jobs))
+        self.progress.pack(fill=X, pady=(10, 0))
+        self.summary_var = tk.StringVar(value=f"0 of {len(jobs)} drive(s) done.")
+        ttk.Label(frame, textvariable=self.summary_var).pack(fill=X, pady=(5, 0))
+        self.total = len(jobs)
+        self.done = 0
+    
+    def started(self, job):
+        self.tree.set(self.rows[job.key], 'status', 'Running...')
+    
+    def finished(self, result):
+        status = ('OK: ' if result.success else 'Failed: ') + format_message(result.success, result.message, result.key)
+        self.tree.set(self.rows[result.key], 'status', status)
+        self.tree.set(self.rows[result.key], 'time', f"{result.duration:.2f}s")
+        self.done += 1
+        self.progress.configure(value=self.done)
+        self.summary_var.set(f"{self.done} of {self.total} drive(s) done.")
 
-def backup_partition_table(drive_number):
-    """Backs up the first sector (MBR/GPT) of the drive"""
-    backup_dir = Path("USBLock_Backups")
-    backup_dir.mkdir(exist_ok=True)
-    try:
-        with open(f"\\\\.\\PhysicalDrive{drive_number}", "rb") as disk:
-            disk.seek(0)
-            sector = disk.read(512)
-            if len(sector) != 512:
-                raise ValueError("Invalid sector size")
-        backup_file = backup_dir / f"usb_backup_drive{drive_number}_{int(time.time())}.bin"
-        with open(backup_file, "wb") as f:
-            f.write(sector)
-        logging.info(f"Backup created: {backup_file}")
-        return str(backup_file)
-    except (PermissionError, OSError, ValueError) as e:
-        logging.error(f"Backup failed for drive {drive_number}: {e}")
-        return None
+class MetricsWindow:
+    """Hidden panel (Ctrl+Shift+M) with p50/p95 per instrumented operation"""
+    
+    def __init__(self, root):
+        self.window = tk.Toplevel(root)
+        self.window.title(TEXTS['metrics_title'])
+        self.window.geometry("640x400")
+        
+        frame = ttk.Frame(self.window, padding=10)
+        frame.pack(fill=BOTH, expand=True)
+        
+        columns = ('op', 'count', 'p50', 'p95', 'max')
+        self.tree = ttk.Treeview(frame, columns=columns, show='headings', height=14)
+        for column, title, width in zip(columns, ('Operation', 'Count', 'p50 ms', 'p95 ms', 'Max ms'),
+                                        (250, 70, 90, 90, 90)):
+            self.tree.heading(column, text=title)
+            self.tree.column(column, width=width, anchor=W if column == 'op' else E)
+        self.tree.pack(fill=BOTH, expand=True)
+        
+        buttons = ttk.Frame(frame)
+        buttons.pack(fill=X, pady=(10, 0))
+        ttkb.Button(buttons, text=TEXTS['refresh'], command=self.update, bootstyle="info-outline").pack(side=LEFT, padx=5)
+        ttkb.Button(buttons, text=TEXTS['export_metrics'], command=self.export, bootstyle="secondary-outline").pack(side=LEFT, padx=5)
+        ttkb.Button(buttons, text=TEXTS['reset'], command=self.reset, bootstyle="secondary-outline").pack(side=LEFT, padx=5)
+        self.update()
+    
+    def update(self):
+        self.tree.delete(*self.tree.get_children())
+        for name, op in metrics.snapshot()['operations'].items():
+            self.tree.insert('', END, values=(
+                name, op['count'], f"{op['p50'] * 1000:.2f}", f"{op['p95'] * 1000:.2f}", f"{op['max'] * 1000:.2f}"
+            ))
+    
+    def export(self):
+        path = filedialog.asksaveasfilename(
+            parent=self.window, title=TEXTS['export_metrics'], defaultextension=".prom",
+            filetypes=[("Prometheus textfile", "*.prom"), ("JSON", "*.json")]
+        )
+        if path:
+            metrics.export(path)
+    
+    def reset(self):
+        metrics.reset()
+        self.update()
 
-def disable_usb_drive(drive_number):
-    """Disables the USB drive by overwriting the partition table"""
-    try:
-        backup_file = backup_partition_table(drive_number)
-        if not backup_file:
-            return False, "backup_failed"
-        
-        with open(f"\\\\.\\PhysicalDrive{drive_number}", "r+b") as disk:
-            disk.seek(0)
-            disk.write(b'\x00' * 512)
-            disk.flush()
-        logging.info(f"Drive {drive_number} disabled, backup: {backup_file}")
-        return True, ("disable_success", drive_number, backup_file)
-    except (PermissionError, OSError) as e:
-        logging.error(f"Error disabling drive {drive_number}: {e}")
-        return False, ("error_disable", str(e))
+class StallMonitor:
+    """Measures the longest Tk main-loop block while refreshes are in flight.
 
-def enable_usb_drive(drive_number, backup_file):
-    """Enables the USB drive by restoring the partition table"""
-    try:
-        if not os.path.exists(backup_file):
-            return False, ("backup_not_found", backup_file)
-        
-        with open(backup_file, "rb") as f:
-            sector = f.read()
-            if len(sector) != 512:
-                return False, ("invalid_backup",)
-        
-        with open(f"\\\\.\\PhysicalDrive{drive_number}", "r+b") as disk:
-            disk.seek(0)
-            disk.write(sector)
-            disk.flush()
-        logging.info(f"Drive {drive_number} enabled with backup: {backup_file}")
-        return True, ("enable_success", drive_number, backup_file)
-    except (PermissionError, OSError) as e:
-        logging.error(f"Error enabling drive {drive_number}: {e}")
-        return False, ("error_enable", str(e))
+    A heartbeat is scheduled every `interval` ms; any lateness beyond that is
+    time the event loop could not paint or handle input.
+    """
+    def __init__(self, root, interval=10):
+        self.root = root
+        self.interval = interval
+        self.active = False
+        self.worst = 0.0
+        self.history = deque(maxlen=100)
+        self._last = None
+    
+    def start(self):
+        if not self.active:
+            self.active = True
+            self.worst = 0.0
+            self._last = time.perf_counter()
+            self.root.after(self.interval, self._tick)
+    
+    def _tick(self):
+        if not self.active:
+            return
+        now = time.perf_counter()
+        self.worst = max(self.worst, now - self._last - self.interval / 1000)
+        self._last = now
+        self.root.after(self.interval, self._tick)
+    
+    def record(self, blocked):
+        """Account for a known synchronous block, such as rendering the results"""
+        self.worst = max(self.worst, blocked)
+    
+    def stop(self):
+        if self.active:
+            self.active = False
+            self.history.append(self.worst)
+            logging.info(f"Refresh finished; longest main-loop block {self.worst * 1000:.1f} ms")
 
 class USBLockApp:
-    def __init__(self, root):
+    def __init__(self, root, state=None, profile_exit=False):
+        self._built_from = time.perf_counter()
         self.root = root
         self.root.title(TEXTS['title'])
-        self.root.geometry("700x600")
+        self.root.geometry("820x600")
         self.root.resizable(True, True)
+        self.state = state or {}
+        self.profile_exit = profile_exit
         
-        # Apply modern theme
-        try:
-            self.style = ttkb.Style(theme="superhero")
-        except:
-            self.style = ttkb.Style(theme="darkly")
+        # The theme was chosen when the window was created (main); this only fetches it
+        self.style = ttkb.Style()
         
         # Main frame
         self.main_frame = ttk.Frame(self.root, padding=10)
@@ -257,43 +362,78 @@ class USBLockApp:
         self.drive_list_frame = ttk.Frame(self.drive_frame)
         self.drive_list_frame.pack(fill=BOTH, expand=True)
         
-        # Drive listbox with scrollbar
-        self.drive_listbox = tk.Listbox(
-            self.drive_list_frame, 
-            height=8, 
-            font=("Consolas", 10),
-            bg="#2b3e50",
-            fg="white",
-            selectbackground="#3498db",
-            selectforeground="white"
+        # Drive list with scrollbar; rows are keyed by device (volumes) or serial (physical drives)
+        self.drive_tree = ttk.Treeview(
+            self.drive_list_frame,
+            columns=DRIVE_COLUMNS,
+            show='headings',
+            height=8,
+            selectmode='extended'
         )
+        widths = self.state.get('drive_columns', {})
+        for column, width in zip(DRIVE_COLUMNS, (220, 200, 100, 80, 260)):
+            self.drive_tree.heading(column, text=TEXTS['drive_columns'][column], anchor=W)
+            self.drive_tree.column(column, width=widths.get(column, width), anchor=W)
+        self.drive_tree.tag_configure('placeholder', foreground='gray')
         self.drive_scrollbar = ttk.Scrollbar(self.drive_list_frame, orient=VERTICAL)
-        self.drive_listbox.config(yscrollcommand=self.drive_scrollbar.set)
-        self.drive_scrollbar.config(command=self.drive_listbox.yview)
+        self.drive_tree.config(yscrollcommand=self.drive_scrollbar.set)
+        self.drive_scrollbar.config(command=self.drive_tree.yview)
         
-        self.drive_listbox.pack(side=LEFT, fill=BOTH, expand=True)
+        self.drive_tree.pack(side=LEFT, fill=BOTH, expand=True)
         self.drive_scrollbar.pack(side=RIGHT, fill=Y)
         
-        # Backup list for enable mode
+        # Backup list for enable mode: one page of the searchable, sortable backup model
         self.backup_label = ttk.Label(self.drive_frame, text=TEXTS['backup_label'])
         self.backup_list_frame = ttk.Frame(self.drive_frame)
         
-        self.backup_listbox = tk.Listbox(
-            self.backup_list_frame, 
+        search_frame = ttk.Frame(self.backup_list_frame)
+        search_frame.pack(side=TOP, fill=X, pady=(0, 5))
+        ttk.Label(search_frame, text=TEXTS['search']).pack(side=LEFT)
+        self.backup_search = tk.StringVar()
+        ttk.Entry(search_frame, textvariable=self.backup_search).pack(side=LEFT, fill=X, expand=True, padx=5)
+        self.backup_search.trace_add('write', lambda *args: self._schedule_backup_search())
+        self.next_page_btn = ttkb.Button(search_frame, text=">", width=3, bootstyle="secondary-outline",
+                                         command=lambda: self._turn_backup_page(1))
+        self.next_page_btn.pack(side=RIGHT)
+        self.page_var = tk.StringVar()
+        ttk.Label(search_frame, textvariable=self.page_var).pack(side=RIGHT, padx=5)
+        self.prev_page_btn = ttkb.Button(search_frame, text="<", width=3, bootstyle="secondary-outline",
+                                         command=lambda: self._turn_backup_page(-1))
+        self.prev_page_btn.pack(side=RIGHT)
+        
+        self.backup_tree = ttk.Treeview(
+            self.backup_list_frame,
+            columns=BACKUP_COLUMNS,
+            show='headings',
             height=5,
-            font=("Consolas", 9),
-            bg="#34495e",
-            fg="white",
-            selectbackground="#e74c3c",
-            selectforeground="white"
+            selectmode='browse'
         )
+        widths = self.state.get('backup_columns', {})
+        for column, width in zip(BACKUP_COLUMNS, (150, 200, 80, 330)):
+            self.backup_tree.heading(column, text=TEXTS['backup_columns'][column], anchor=W,
+                                     command=lambda c=column: self._sort_backups(c))
+            self.backup_tree.column(column, width=widths.get(column, width), anchor=W)
+        self.backup_tree.tag_configure('placeholder', foreground='gray')
         self.backup_scrollbar = ttk.Scrollbar(self.backup_list_frame, orient=VERTICAL)
-        self.backup_listbox.config(yscrollcommand=self.backup_scrollbar.set)
-        self.backup_scrollbar.config(command=self.backup_listbox.yview)
+        self.backup_tree.config(yscrollcommand=self.backup_scrollbar.set)
+        self.backup_scrollbar.config(command=self.backup_tree.yview)
         
-        self.backup_listbox.bind('<<ListboxSelect>>', self.select_backup)
+        self.backup_tree.bind('<<TreeviewSelect>>', self.select_backup)
+        self.drive_tree.bind('<<TreeviewSelect>>', self._on_drive_select)
         self.selected_backup = tk.StringVar()
         
+        # What each list shows, so updates only touch rows that changed
+        self.shown_drives = {}
+        self.drive_records = {}
+        self.shown_backups = {}
+        self.backup_model = BackupListModel()
+        sort = self.state.get('backup_sort')
+        if sort in [[c, d] for c in BACKUP_COLUMNS for d in (True, False)]:
+            self.backup_model.sort_column, self.backup_model.descending = sort
+        self.selected_backup_key = None
+        self._suggested_for = None
+        self._search_job = None
+        
         # Buttons frame
         self.button_frame = ttk.Frame(self.main_frame)
         self.button_frame.pack(fill=X, pady=10)
@@ -302,7 +442,7 @@ class USBLockApp:
         self.refresh_btn = ttkb.Button(
             self.button_frame,
             text=TEXTS['refresh'], 
-            command=self.refresh_drives, 
+            command=self.force_refresh, 
             bootstyle="info-outline"
         )
         self.refresh_btn.pack(side=LEFT, padx=5)
@@ -323,6 +463,22 @@ class USBLockApp:
         )
         self.enable_btn.pack(side=LEFT, padx=5)
         
+        self.image_btn = ttkb.Button(
+            self.button_frame, 
+            text=TEXTS['image'], 
+            command=self.image_drive, 
+            bootstyle="primary-outline"
+        )
+        self.image_btn.pack(side=LEFT, padx=5)
+        
+        self.wipe_btn = ttkb.Button(
+            self.button_frame, 
+            text=TEXTS['wipe'], 
+            command=self.wipe_drive, 
+            bootstyle="danger-outline"
+        )
+        self.wipe_btn.pack(side=LEFT, padx=5)
+        
         self.help_btn = ttkb.Button(
             self.button_frame, 
             text=TEXTS['help'], 
@@ -347,9 +503,96 @@ class USBLockApp:
         )
         status_label.pack(fill=X, pady=(5, 0))
         
+        # Drive inventory and the snapshot currently shown in the list; set up by _backend_ready
+        self.inventory = None
+        self.displayed = None
+        self.watcher = None
+        self.hotplug_latencies = deque(maxlen=256)
+        
+        # Background refresh state; only the newest request is ever rendered
+        self._refresh_lock = threading.Lock()
+        self._refresh_seq = 0
+        self._refresh_request = None
+        self._refresh_running = False
+        self._hotplug_pending = deque()
+        self.stall_monitor = StallMonitor(self.root)
+        
         # Mode (disable/enable)
         self.mode = "disable"
+        self._first_scan_shown = False
+        
+        self.root.bind('<Control-Shift-M>', self.show_metrics)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        
+        # Nothing touches the disks until the window has been drawn
+        self._disable_buttons()
+        self.status_var.set(TEXTS['starting'])
+        STARTUP.since('build window', self._built_from)
+        self.root.after_idle(self.root.after, 0, self._window_shown)
+    
+    def _window_shown(self):
+        """First idle moment after the window was drawn: load the disk modules in the background"""
+        STARTUP.since('first paint', _STARTED)
+        threading.Thread(target=self._load_backend, daemon=True).start()
+    
+    def _load_backend(self):
+        import importlib
+        for name in BACKEND_MODULES:
+            began = time.perf_counter()
+            importlib.import_module(name)
+            STARTUP.since(f"import {name}", began)
+        began = time.perf_counter()
+        from usbLock_audit import setup_logging
+        setup_logging()
+        STARTUP.since('setup logging', began)
+        self.root.after(0, self._backend_ready)
+    
+    def _backend_ready(self):
+        """Create the inventory and hotplug watcher, then scan for the first time"""
+        from usbLock_core import get_usb_drives, get_all_physical_drives
+        from usbLock_enum import enumerate_device
+        from usbLock_inventory import Inventory
+        from usbLock_hotplug import HotplugWatcher
+        began = time.perf_counter()
+        # Signatures tell apart sticks that report the same serial, or none
+        self.inventory = Inventory(get_usb_drives, lambda: get_all_physical_drives(signatures=True),
+                                   load_device=enumerate_device)
+        
+        # Push drive arrivals and removals into the list instead of waiting for Refresh
+        try:
+            self.watcher = HotplugWatcher()
+            self.watcher.subscribe(self._on_hotplug)
+            self.watcher.start()
+        except Exception as e:
+            logging.error(f"Hotplug watcher unavailable: {e}")
+            self.watcher = None
+        STARTUP.since('start hotplug watcher', began)
+        
         self.refresh_drives()
+        
+        # Finish or undo whatever a previous run left half written. Recovery writes to
+        # drives outside the I/O scheduler, so the actions stay off until it is done.
+        threading.Thread(target=self._recover_worker, daemon=True).start()
+    
+    def close(self):
+        """Remember theme, geometry and list layout for a faster, identical next start"""
+        save_state({
+            'theme': self.style.theme_use(),
+            'geometry': self.root.geometry(),
+            'drive_columns': {c: self.drive_tree.column(c, 'width') for c in DRIVE_COLUMNS},
+            'backup_columns': {c: self.backup_tree.column(c, 'width') for c in BACKUP_COLUMNS},
+            'backup_sort': [self.backup_model.sort_column, self.backup_model.descending]
+        })
+        if self.watcher is not None:
+            self.watcher.stop()
+        self.root.destroy()
+    
+    def show_metrics(self, event=None):
+        """Opens the timing panel, switching instrumentation on the first time"""
+        if not metrics.enabled():
+            metrics.enable()
+            messagebox.showinfo(TEXTS['metrics_title'], TEXTS['metrics_enabled'])
+        MetricsWindow(self.root)
     
     def show_help(self):
         """Show help dialog"""
@@ -357,113 +600,334 @@ class USBLockApp:
     
     def select_backup(self, event):
         """Update selected backup file"""
-        selection = self.backup_listbox.curselection()
-        if selection:
-            self.selected_backup.set(self.backup_listbox.get(selection[0]))
+        selection = [key for key in self.backup_tree.selection() if key != PLACEHOLDER]
+        entry = self.backup_model.get(selection[0]) if selection else None
+        if entry is not None:
+            self.selected_backup_key = selection[0]
+            self.selected_backup.set(entry.path)
+    
+    def _schedule_backup_search(self):
+        """Filter the backup list once typing pauses"""
+        if self._search_job is not None:
+            self.root.after_cancel(self._search_job)
+        self._search_job = self.root.after(150, self._search_backups)
+    
+    def _search_backups(self):
+        self._search_job = None
+        self.backup_model.search(self.backup_search.get())
+        self._render_backups()
+    
+    def _sort_backups(self, column):
+        self.backup_model.sort_by(column)
+        self._render_backups()
+    
+    def _turn_backup_page(self, step):
+        self.backup_model.set_page(self.backup_model.page + step)
+        self._render_backups()
+    
+    def _render_backups(self):
+        """Show the backup model's current page, keeping the chosen backup selected"""
+        model = self.backup_model
+        rows = model.rows()
+        if not model.entries:
+            rows = [(PLACEHOLDER, (TEXTS['no_backups'],) + ('',) * (len(BACKUP_COLUMNS) - 1))]
+        self.shown_backups = apply_rows(self.backup_tree, self.shown_backups, rows)
+        if self.selected_backup_key in self.shown_backups:
+            if self.backup_tree.selection() != (self.selected_backup_key,):
+                self.backup_tree.selection_set(self.selected_backup_key)
+        self.page_var.set(TEXTS['page'].format(page=model.page + 1, pages=model.page_count(), count=len(model.view())))
+        self.prev_page_btn.configure(state='normal' if model.page > 0 else 'disabled')
+        self.next_page_btn.configure(state='normal' if model.page < model.page_count() - 1 else 'disabled')
+    
+    def _selected_keys(self):
+        return [key for key in self.drive_tree.selection() if key in self.drive_records]
+    
+    def _on_drive_select(self, event):
+        """In enable mode, match the selected drive against the backups in the background"""
+        selection = self._selected_keys()
+        if self.mode != "enable" or len(selection) != 1 or self.displayed is None or self.displayed.kind != 'physical':
+            self._suggested_for = None
+            return
+        # Refreshes re-fire the event for an unchanged selection; match each drive once
+        if selection[0] == self._suggested_for:
+            return
+        self._suggested_for = selection[0]
+        record = self.drive_records[selection[0]]
+        
+        def worker():
+            from usbLock_core import list_backups
+            from usbLock_match import suggest_backup
+            try:
+                match = suggest_backup(record.index, list_backups(), serial=record.serial)
+            except Exception as e:
+                logging.error(f"Backup matching failed for drive {record.index}: {e}")
+                match = None
+            self.root.after(0, self._show_suggestion, record, match)
+        
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def _show_suggestion(self, record, match):
+        """Select the suggested backup if the same drive is still selected"""
+        if self.mode != "enable" or self._selected_keys() != [drive_key(record)]:
+            return
+        if match is None:
+            self.status_var.set(TEXTS['no_backup_match'])
+            return
+        key = next((k for k, entry in self.backup_model.entries.items() if entry.path == match.entry.path), None)
+        if key is not None:
+            if self.backup_model.page_of(key) is None:
+                # The search hides the suggestion; show everything again
+                self.backup_search.set('')
+                self.backup_model.search('')
+            self.backup_model.set_page(self.backup_model.page_of(key))
+            self.selected_backup_key = key
+            self._render_backups()
+            self.backup_tree.see(key)
+        self.selected_backup.set(match.entry.path)
+        self.status_var.set(TEXTS['backup_suggested'].format(
+            backup=os.path.basename(match.entry.path),
+            score=match.score
+        ))
     
-    def refresh_drives(self):
-        """Refresh the list of drives and backups"""
-        self.drive_listbox.delete(0, tk.END)
+    def force_refresh(self):
+        """Drop cached listings and refresh"""
+        self.inventory.invalidate()
+        self.refresh_drives()
+    
+    def _on_hotplug(self, event):
+        """Runs on the watcher thread: update the inventory, then redraw on the Tk thread"""
+        self.inventory.apply_event(event)
+        self.root.after(0, self._hotplug_applied, event)
+    
+    def _hotplug_applied(self, event):
+        """Redraw the list from the incrementally updated inventory"""
+        self._hotplug_pending.append(event)
+        self.refresh_drives(max_age=float('inf'))
+    
+    def refresh_drives(self, max_age=None):
+        """Refresh the list of drives and backups on a background worker"""
+        if self.inventory is None:
+            return
+        self.status_var.set(TEXTS['scanning'])
+        if self.displayed is None or self.displayed.kind != self._mode_kind():
+            self._render_drives(None, placeholder_row(TEXTS['scanning']))
         
-        # Hide backup components first
-        self.backup_label.pack_forget()
-        self.backup_list_frame.pack_forget()
+        # A newer request replaces any that has not started; a running scan's result is dropped
+        with self._refresh_lock:
+            self._refresh_seq += 1
+            self._refresh_request = (self._refresh_seq, self.mode, max_age)
+            if self._refresh_running:
+                return
+            self._refresh_running = True
+        self.stall_monitor.start()
+        threading.Thread(target=self._refresh_worker, daemon=True).start()
+    
+    def _mode_kind(self):
+        return 'volumes' if self.mode == "disable" else 'physical'
+    
+    def _recover_worker(self):
+        from usbLock_core import recover_operations
+        try:
+            results = recover_operations()
+        except Exception as e:
+            logging.error(f"Recovery of interrupted operations failed: {e}")
+            results = []
+        self.root.after(0, self._recovery_done, results)
+    
+    def _recovery_done(self, results):
+        self._enable_buttons()
+        if results:
+            self._show_recovery(results)
+    
+    def _show_recovery(self, results):
+        outcomes = TEXTS['recovery_outcomes']
+        details = "\n".join(
+            TEXTS['recovery_line'].format(op=r.op.capitalize(), drive=r.drive, detail=outcomes.get(r.detail, r.detail))
+            for r in results
+        )
+        messagebox.showinfo(TEXTS['recovery_title'], TEXTS['recovered'].format(count=len(results), details=details))
+        self.refresh_drives()
+    
+    def _refresh_worker(self):
+        """Enumerate drives and backups off the Tk thread, coalescing queued requests"""
+        while True:
+            with self._refresh_lock:
+                request = self._refresh_request
+                self._refresh_request = None
+                if request is None:
+                    self._refresh_running = False
+                    return
+            seq, mode, max_age = request
+            try:
+                with metrics.span(f'gui.refresh_{mode}'):
+                    result = self._scan(mode, max_age)
+            except Exception as e:
+                logging.error(f"Drive refresh failed: {e}")
+                result = None
+            self.root.after(0, self._show_refresh, seq, mode, result)
+    
+    def _scan(self, mode, max_age):
+        from usbLock_core import list_backups
+        if mode == "disable":
+            return self.inventory.volumes(max_age), None
+        return self.inventory.physical_drives(max_age), list_backups()
+    
+    def _show_refresh(self, seq, mode, result):
+        """Render a finished scan on the Tk thread unless a newer one superseded it"""
+        if seq != self._refresh_seq or mode != self.mode:
+            return
+        started = time.perf_counter()
+        
+        if mode == "disable":
+            # Hide backup components
+            self.backup_label.pack_forget()
+            self.backup_list_frame.pack_forget()
         
-        if self.mode == "disable":
-            usb_drives = get_usb_drives()
+        if result is None:
+            self.displayed = None
+            self._render_drives(None, placeholder_row(TEXTS['no_drives']))
+            self.status_var.set(TEXTS['no_drives'])
+        elif mode == "disable":
+            self.displayed = result[0]
+            usb_drives = self.displayed.records
             if not usb_drives:
-                self.drive_listbox.insert(tk.END, TEXTS['no_drives'])
+                self._render_drives(None, placeholder_row(TEXTS['no_drives']))
                 self.status_var.set(TEXTS['no_drives'])
             else:
-                for i, drive in enumerate(usb_drives, 1):
-                    drive_info = f"{i}. Drive: {drive['device']} ({drive['label']})"
-                    drive_info += f", Size: {drive['size']}, Type: {drive['fstype']}"
-                    self.drive_listbox.insert(tk.END, drive_info)
+                self._render_drives(usb_drives, volume_rows(usb_drives))
                 self.status_var.set(f"Found {len(usb_drives)} USB drive(s).")
         else:
             # Show backup components for enable mode
-            self.backup_label.pack(fill=X, pady=(5, 0))
-            self.backup_list_frame.pack(fill=X, pady=(5, 10))
-            self.backup_listbox.pack(side=LEFT, fill=BOTH, expand=True)
-            self.backup_scrollbar.pack(side=RIGHT, fill=Y)
+            if not self.backup_list_frame.winfo_ismapped():
+                self.backup_label.pack(fill=X, pady=(5, 0))
+                self.backup_list_frame.pack(fill=X, pady=(5, 10))
+                self.backup_scrollbar.pack(side=RIGHT, fill=Y)
+                self.backup_tree.pack(side=LEFT, fill=BOTH, expand=True)
             
-            self.backup_listbox.delete(0, tk.END)
-            drive_numbers = get_all_physical_drives()
+            self.displayed, backups = result
+            drive_numbers = self.displayed.records
             if not drive_numbers:
-                self.drive_listbox.insert(tk.END, TEXTS['no_removable'])
+                self._render_drives(None, placeholder_row(TEXTS['no_removable']))
                 self.status_var.set(TEXTS['no_removable'])
             else:
-                for i, drive in enumerate(drive_numbers, 1):
-                    serial = drive['serial'][:15] + "..." if len(drive['serial']) > 15 else drive['serial']
-                    drive_info = f"{i}. Physical Drive {drive['index']} (Serial: {serial})"
-                    self.drive_listbox.insert(tk.END, drive_info)
+                self._render_drives(drive_numbers, drive_rows(drive_numbers))
                 self.status_var.set(f"Found {len(drive_numbers)} removable drive(s).")
             
-            # List backup files
-            backup_dir = Path("USBLock_Backups")
-            backups = list(backup_dir.glob("usb_backup_drive*.bin")) if backup_dir.exists() else []
-            if backups:
-                for backup in backups:
-                    self.backup_listbox.insert(tk.END, str(backup))
-            else:
-                self.backup_listbox.insert(tk.END, "No backups found.")
+            self.backup_model.set_entries(backups)
+            if self.selected_backup_key not in self.backup_model.entries:
+                self.selected_backup_key = None
+                self.selected_backup.set('')
+            self._render_backups()
+        
+        # This was the newest request, so nothing else is in flight
+        metrics.observe('gui.render', time.perf_counter() - started)
+        self.stall_monitor.record(time.perf_counter() - started)
+        self.stall_monitor.stop()
+        while self._hotplug_pending:
+            event = self._hotplug_pending.popleft()
+            latency = time.monotonic() - event.timestamp
+            self.hotplug_latencies.append(latency)
+            metrics.observe('gui.hotplug', latency)
+            logging.info(f"Hotplug {event.action} {event.device} shown in {latency * 1000:.1f} ms")
+        if not self._first_scan_shown:
+            self._first_scan_shown = True
+            self._first_scan_done()
     
-    def disable_drive(self):
-        """Disable the selected USB drive in a separate thread"""
-        selection = self.drive_listbox.curselection()
+    def _first_scan_done(self):
+        STARTUP.since('first scan shown', _STARTED)
+        logging.info(f"Startup: window drawn and drives listed in {(time.perf_counter() - _STARTED) * 1000:.0f} ms")
+        if self.profile_exit:
+            report = STARTUP.report()
+            logging.info(f"Startup profile:\n{report}")
+            # A windowed build has no console
+            if sys.stdout is not None:
+                print(report)
+            if isinstance(self.profile_exit, str):
+                with open(self.profile_exit, "w") as f:
+                    json.dump(STARTUP.to_dict(), f, indent=2)
+            self.root.after(0, self.close)
+    
+    def _render_drives(self, records, rows):
+        """Show drive rows, touching only those that changed; records maps the keys back"""
+        mode_columns = ('drive', 'label', 'size', 'fstype') if self.mode == "disable" else ('drive', 'serial')
+        if tuple(self.drive_tree['displaycolumns']) != mode_columns:
+            self.drive_tree.configure(displaycolumns=mode_columns)
+        self.shown_drives = apply_rows(self.drive_tree, self.shown_drives, rows)
+        self.drive_records = {} if records is None else dict(zip((key for key, _ in rows), records))
+    
+    def _selected_records(self, kind):
+        """Returns the records the user selected from the displayed snapshot"""
+        selection = self._selected_keys()
         if not selection:
             messagebox.showwarning("Warning", TEXTS['select_drive'])
-            return
+            return None
         
-        index = selection[0]
-        usb_drives = get_usb_drives()
-        if not usb_drives or index >= len(usb_drives):
+        if self.displayed is None or self.displayed.kind != kind:
             messagebox.showerror("Error", TEXTS['invalid_selection'])
+            return None
+        return [self.drive_records[key] for key in selection]
+    
+    def disable_drive(self):
+        """Disable the selected USB drive(s) in the background"""
+        from usbLock_core import get_physical_drive_number, disable_usb_drive
+        from usbLock_batch import BatchJob, dedupe_jobs
+        records = self._selected_records('volumes')
+        if records is None:
             return
         
-        selected_drive = usb_drives[index]
-        drive_number = get_physical_drive_number(selected_drive['mountpoint'])
-        if drive_number is None:
-            messagebox.showerror("Error", TEXTS['error_drive_number'])
-            self.status_var.set(TEXTS['error_drive_number'])
+        jobs = []
+        for record in records:
+            drive_number = get_physical_drive_number(record.mountpoint)
+            if drive_number is None:
+                messagebox.showerror("Error", TEXTS['error_drive_number'])
+                self.status_var.set(TEXTS['error_drive_number'])
+                return
+            jobs.append(BatchJob(drive_number, record.device, disable_usb_drive, (drive_number,)))
+        jobs = dedupe_jobs(jobs)
+        
+        if len(jobs) > 1:
+            confirm_msg = TEXTS['confirm_disable_batch'].format(
+                count=len(jobs),
+                drives=", ".join(job.label for job in jobs)
+            )
+            if messagebox.askyesno("Confirm", confirm_msg):
+                self._start_batch(jobs)
             return
         
-        confirm_msg = TEXTS['confirm_disable'].format(drive=selected_drive['device'])
+        drive_number, drive_name = jobs[0].key, jobs[0].label
+        confirm_msg = TEXTS['confirm_disable'].format(drive=drive_name)
         if messagebox.askyesno("Confirm", confirm_msg):
             self.progress.pack(fill=X, pady=(10, 0))
             self.progress.start(10)
             self._disable_buttons()
             threading.Thread(
                 target=self._disable_thread, 
-                args=(drive_number, selected_drive['device']), 
+                args=(drive_number, drive_name), 
                 daemon=True
             ).start()
     
     def enable_drive(self):
-        """Enable the selected USB drive in a separate thread"""
+        """Enable the selected USB drive(s) in the background"""
         if self.mode != "enable":
             self.mode = "enable"
             self.refresh_drives()
             return
         
-        selection = self.drive_listbox.curselection()
-        if not selection:
-            messagebox.showwarning("Warning", TEXTS['select_drive'])
+        records = self._selected_records('physical')
+        if records is None:
             return
         
-        index = selection[0]
-        drive_numbers = get_all_physical_drives()
-        if not drive_numbers or index >= len(drive_numbers):
-            messagebox.showerror("Error", TEXTS['invalid_selection'])
+        if len(records) > 1:
+            self._enable_batch(records)
             return
         
-        selected_drive = drive_numbers[index]['index']
+        selected_drive = records[0].index
         backup_file = self.selected_backup.get()
         
-        if not backup_file or "No backups found" in backup_file:
+        if not backup_file:
             backup_file = filedialog.askopenfilename(
                 title=TEXTS['select_backup'],
-                filetypes=[("Backup files", "*.bin"), ("All files", "*.*")]
+                filetypes=[("Backup files", "*.ref *.bin"), ("All files", "*.*")]
             )
             if not backup_file:
                 self.status_var.set("No backup file selected.")
@@ -474,30 +938,188 @@ class USBLockApp:
             backup=os.path.basename(backup_file)
         )
         if messagebox.askyesno("Confirm", confirm_msg):
-            delete_backup = messagebox.askyesno("Confirm", TEXTS['delete_backup'])
+            delete_after = messagebox.askyesno("Confirm", TEXTS['delete_backup'])
             self.progress.pack(fill=X, pady=(10, 0))
             self.progress.start(10)
             self._disable_buttons()
             threading.Thread(
                 target=self._enable_thread, 
-                args=(selected_drive, backup_file, delete_backup), 
+                args=(selected_drive, backup_file, delete_after), 
                 daemon=True
             ).start()
     
+    def _selected_drives(self):
+        """Returns (drive number, label) for each selected volume or physical drive, or None"""
+        from usbLock_core import get_physical_drive_number
+        records = self._selected_records(self._mode_kind())
+        if records is None:
+            return None
+        if self._mode_kind() == 'physical':
+            return [(record.index, f"Physical Drive {record.index}") for record in records]
+        drives = []
+        for record in records:
+            drive_number = get_physical_drive_number(record.mountpoint)
+            if drive_number is None:
+                messagebox.showerror("Error", TEXTS['error_drive_number'])
+                self.status_var.set(TEXTS['error_drive_number'])
+                return None
+            drives.append((drive_number, record.device))
+        return drives
+    
+    def image_drive(self):
+        """Write a full image of the selected drive in the background"""
+        from usbLock_core import image_usb_drive
+        from usbLock_image import read_checkpoint
+        drives = self._selected_drives()
+        if drives is None:
+            return
+        # Several volumes of one disk are still one drive
+        if len({drive_number for drive_number, _ in drives}) > 1:
+            messagebox.showwarning("Warning", TEXTS['image_one_drive'])
+            self.status_var.set(TEXTS['image_one_drive'])
+            return
+        drive_number = drives[0][0]
+        
+        image_path = filedialog.asksaveasfilename(
+            title=TEXTS['save_image'],
+            defaultextension=".img",
+            initialfile=f"drive{drive_number}_{time.strftime('%Y%m%d')}.img",
+            filetypes=[("Disk images", "*.img"), ("All files", "*.*")]
+        )
+        if not image_path:
+            return
+        if read_checkpoint(image_path):
+            if not messagebox.askyesno("Confirm", TEXTS['resume_image'].format(backup=os.path.basename(image_path))):
+                return
+        elif not messagebox.askyesno("Confirm", TEXTS['confirm_image'].format(
+                drive=drive_number, backup=os.path.basename(image_path))):
+            return
+        
+        self.progress.configure(mode='determinate', maximum=100, value=0)
+        self.progress.pack(fill=X, pady=(10, 0))
+        self._disable_buttons()
+        
+        def progress(p):
+            percent = p.done * 100 / p.total if p.total else 100
+            self.root.after(0, self._show_image_progress, drive_number, percent, p.rate)
+        
+        def worker():
+            try:
+                success, message = image_usb_drive(drive_number, image_path, on_progress=progress)
+            except Exception as e:
+                success, message = False, f"Unexpected error: {str(e)}"
+            self.root.after(0, lambda: self._post_operation(success, message, drive_number))
+        
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def wipe_drive(self):
+        """Overwrite the selected drive(s) completely, for retired sticks"""
+        from usbLock_core import wipe_usb_drive
+        from usbLock_batch import BatchJob, dedupe_jobs
+        drives = self._selected_drives()
+        if drives is None:
+            return
+        jobs = dedupe_jobs([
+            BatchJob(drive_number, label, wipe_usb_drive, (drive_number, ('zero',), 'sample'))
+            for drive_number, label in drives
+        ])
+        confirm_msg = TEXTS['confirm_wipe'].format(count=len(jobs), drives=", ".join(job.label for job in jobs))
+        if messagebox.askyesno("Confirm", confirm_msg, icon='warning') and \
+                messagebox.askyesno("Confirm", TEXTS['confirm_wipe_again'], icon='warning'):
+            self._start_batch(jobs)
+    
+    def _show_image_progress(self, drive_number, percent, rate):
+        self.progress.configure(value=percent)
+        self.status_var.set(TEXTS['imaging'].format(drive=drive_number, percent=percent, rate=rate))
+    
+    def _enable_batch(self, records):
+        """Enable several drives, each from the backup that best matches it"""
+        from usbLock_batch import BatchJob, dedupe_jobs
+        confirm_msg = TEXTS['confirm_enable_batch'].format(count=len(records))
+        if not messagebox.askyesno("Confirm", confirm_msg):
+            return
+        delete_after = messagebox.askyesno("Confirm", TEXTS['delete_backup'])
+        jobs = [
+            BatchJob(
+                record.index,
+                f"Physical Drive {record.index}",
+                self._enable_job,
+                (record.index, record.serial, delete_after)
+            )
+            for record in records
+        ]
+        self._start_batch(dedupe_jobs(jobs))
+    
+    @staticmethod
+    def _enable_job(drive_number, serial, delete_after):
+        """Batch worker for enabling one drive"""
+        from usbLock_core import best_backup_for_drive, enable_usb_drive, delete_backup
+        backup_file = best_backup_for_drive(drive_number, serial)
+        if backup_file is None:
+            return False, ("no_backup_for_drive",)
+        success, message = enable_usb_drive(drive_number, backup_file)
+        if success and delete_after:
+            delete_backup(backup_file)
+        return success, message
+    
+    def _start_batch(self, jobs):
+        """Run jobs on the batch worker pool with a live result table"""
+        from usbLock_batch import run_batch
+        window = BatchWindow(self.root, TEXTS['batch_title'], jobs)
+        self._disable_buttons()
+        self.status_var.set(f"Processing {len(jobs)} drive(s)...")
+        
+        def worker():
+            try:
+                results = run_batch(
+                    jobs,
+                    on_start=lambda job: self.root.after(0, window.started, job),
+                    on_result=lambda result: self.root.after(0, window.finished, result)
+                )
+            except Exception as e:
+                logging.error(f"Batch operation failed: {e}")
+                results = []
+            self.root.after(0, self._post_batch, window, results, len(jobs))
+        
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def _post_batch(self, window, results, total):
+        """Summarize a finished batch and refresh the lists"""
+        from usbLock_batch import summarize
+        self._enable_buttons()
+        succeeded, failed = summarize(results)
+        summary = TEXTS['batch_summary'].format(ok=len(succeeded), total=total, failed=total - len(succeeded))
+        window.summary_var.set(summary)
+        self.status_var.set(summary)
+        if failed or len(succeeded) < total:
+            messagebox.showwarning("Batch Result", summary, parent=window.window)
+        else:
+            messagebox.showinfo("Batch Result", summary, parent=window.window)
+        
+        self.inventory.invalidate()
+        if self.mode == "enable":
+            self.mode = "disable"
+        self.refresh_drives()
+    
     def _disable_buttons(self):
         """Disable all buttons during operation"""
         self.refresh_btn.configure(state='disabled')
         self.disable_btn.configure(state='disabled')
         self.enable_btn.configure(state='disabled')
+        self.image_btn.configure(state='disabled')
+        self.wipe_btn.configure(state='disabled')
     
     def _enable_buttons(self):
         """Enable all buttons after operation"""
         self.refresh_btn.configure(state='normal')
         self.disable_btn.configure(state='normal')
         self.enable_btn.configure(state='normal')
+        self.image_btn.configure(state='normal')
+        self.wipe_btn.configure(state='normal')
     
     def _disable_thread(self, drive_number, drive_name):
         """Thread for disabling drive"""
+        from usbLock_core import disable_usb_drive
         try:
             success, message = disable_usb_drive(drive_number)
             self.root.after(0, lambda: self._post_operation(success, message, drive_name))
@@ -505,16 +1127,13 @@ class USBLockApp:
             error_msg = f"Unexpected error: {str(e)}"
             self.root.after(0, lambda: self._post_operation(False, error_msg, drive_name))
     
-    def _enable_thread(self, drive_number, backup_file, delete_backup):
+    def _enable_thread(self, drive_number, backup_file, delete_after):
         """Thread for enabling drive"""
+        from usbLock_core import enable_usb_drive, delete_backup
         try:
             success, message = enable_usb_drive(drive_number, backup_file)
-            if success and delete_backup:
-                try:
-                    os.remove(backup_file)
-                    logging.info(f"Backup file deleted: {backup_file}")
-                except Exception as e:
-                    logging.error(f"Error deleting backup: {backup_file} - {e}")
+            if success and delete_after:
+                delete_backup(backup_file)
             self.root.after(0, lambda: self._post_operation(success, message, drive_number))
         except Exception as e:
             error_msg = f"Unexpected error: {str(e)}"
@@ -524,46 +1143,38 @@ class USBLockApp:
         """Handle post-operation tasks"""
         self.progress.stop()
         self.progress.pack_forget()
+        self.progress.configure(mode='indeterminate', value=0)
         self._enable_buttons()
         
+        formatted_msg = format_message(success, message, drive)
         if success:
-            if isinstance(message, tuple):
-                key, *args = message
-                if key in TEXTS:
-                    if len(args) >= 2:
-                        formatted_msg = TEXTS[key].format(
-                            drive=drive, 
-                            backup=os.path.basename(args[1])
-                        )
-                    else:
-                        formatted_msg = TEXTS[key].format(drive=drive)
-                else:
-                    formatted_msg = str(message)
-            else:
-                formatted_msg = str(message)
             messagebox.showinfo("Success", formatted_msg)
             self.status_var.set("Operation completed successfully.")
         else:
-            if isinstance(message, tuple):
-                key, *args = message
-                if key in TEXTS:
-                    formatted_msg = TEXTS[key].format(
-                        error=args[0] if args else "Unknown error"
-                    )
-                else:
-                    formatted_msg = str(message)
-            else:
-                formatted_msg = str(message)
             messagebox.showerror("Error", formatted_msg)
             self.status_var.set("Operation failed.")
         
+        # The operation changed the drives, so cached listings are stale
+        self.inventory.invalidate()
+        
         # Reset mode
         if self.mode == "enable":
             self.mode = "disable"
         self.refresh_drives()
 
-def main():
+def parse_args(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description=TEXTS['title'])
+    parser.add_argument('--profile-startup', nargs='?', const=True, default=False, metavar='JSON',
+                        help="print how long each startup phase took once the drives are listed, then exit; "
+                             "with a file name, also save the timings there as JSON")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Main function with automatic admin privilege handling"""
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv) if argv else None
+    
     # Check if running on Windows
     if os.name != 'nt':
         messagebox.showerror("Error", TEXTS['windows_only'])
@@ -579,8 +1190,14 @@ def main():
         return
     
     try:
-        # Create the main window
-        root = ttkb.Window()
+        # Create the main window with the theme that worked last time, so only one theme is built
+        began = time.perf_counter()
+        state = load_state()
+        try:
+            root = ttkb.Window(themename=state.get('theme', DEFAULT_THEME), iconphoto=None)
+        except Exception:
+            root = ttkb.Window(themename=FALLBACK_THEME, iconphoto=None)
+        STARTUP.since('create window and theme', began)
         
         # Set window icon (optional)
         try:
@@ -589,15 +1206,18 @@ def main():
             pass
         
         # Create the application
-        app = USBLockApp(root)
-        
-        # Center the window
-        root.update_idletasks()
-        width = root.winfo_width()
-        height = root.winfo_height()
-        x = (root.winfo_screenwidth() // 2) - (width // 2)
-        y = (root.winfo_screenheight() // 2) - (height // 2)
-        root.geometry(f"{width}x{height}+{x}+{y}")
+        app = USBLockApp(root, state, profile_exit=args.profile_startup if args else False)
+        
+        if state.get('geometry'):
+            root.geometry(state['geometry'])
+        else:
+            # Center the window
+            root.update_idletasks()
+            width = root.winfo_width()
+            height = root.winfo_height()
+            x = (root.winfo_screenwidth() // 2) - (width // 2)
+            y = (root.winfo_screenheight() // 2) - (height // 2)
+            root.geometry(f"{width}x{height}+{x}+{y}")
         
         # Start the GUI
         root.mainloop()
@@ -0,0 +1,275 @@
+import os
+import sys
+import time
+import select
+import socket
+import struct
+import threading
+import logging
+from collections import namedtuple, deque
+
+# action is add/remove for block devices and mount/unmount for volumes;
+# timestamp is time.monotonic() when the event was received
+HotplugEvent = namedtuple('HotplugEvent', ['action', 'device', 'timestamp'])
+
+NETLINK_KOBJECT_UEVENT = 15
+POLL_INTERVAL = 0.05
+# PhysicalDrive numbers probed when polling for disks on Windows
+WINDOWS_MAX_DRIVES = 32
+
+
+def parse_uevent(data):
+    """Parses a kernel uevent datagram into a dict of its KEY=value fields"""
+    props = {}
+    for field in data.split(b'\0')[1:]:
+        if b'=' in field:
+            key, value = field.split(b'=', 1)
+            props[key.decode('ascii', 'replace')] = value.decode('utf-8', 'replace')
+    return props
+
+
+def read_mounted_devices(root='/'):
+    """Returns the set of /dev names currently in /proc/mounts"""
+    try:
+        with open(os.path.join(root, 'proc', 'mounts')) as f:
+            return {line.split()[0][5:] for line in f if line.startswith('/dev/')}
+    except OSError:
+        return set()
+
+
+def _diff(before, after, added, removed):
+    return [(removed, name) for name in sorted(before - after)] + \
+        [(added, name) for name in sorted(after - before)]
+
+
+class HotplugSource:
+    """Base class for event sources; run() blocks until stop is set"""
+    name = 'base'
+
+    def run(self, emit, stop):
+        raise NotImplementedError
+
+
+class _LinuxSource(HotplugSource):
+    """Shared /proc/mounts watching; the kernel flags the file with POLLPRI on every change"""
+
+    def __init__(self, root='/'):
+        self.root = root
+
+    def _open(self):
+        """Returns (fd, on_readable) for the device event channel"""
+        raise NotImplementedError
+
+    def run(self, emit, stop):
+        fd, on_readable = self._open()
+        poller = select.poll()
+        poller.register(fd, select.POLLIN)
+        mounts_file = open(os.path.join(self.root, 'proc', 'mounts'))
+        poller.register(mounts_file.fileno(), select.POLLPRI | select.POLLERR)
+        mounted = read_mounted_devices(self.root)
+        try:
+            while not stop.is_set():
+                for ready_fd, _ in poller.poll(200):
+                    if ready_fd == fd:
+                        on_readable(emit)
+                    else:
+                        mounts_file.seek(0)
+                        mounts_file.read()
+                        current = read_mounted_devices(self.root)
+                        for action, name in _diff(mounted, current, 'mount', 'unmount'):
+                            emit(action, name)
+                        mounted = current
+        finally:
+            mounts_file.close()
+            os.close(fd)
+
+
+class NetlinkSource(_LinuxSource):
+    """Kernel uevents over NETLINK_KOBJECT_UEVENT; no udev daemon required"""
+    name = 'netlink'
+
+    def _open(self):
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+        sock.bind((0, 1))
+        fd = sock.detach()
+
+        def on_readable(emit):
+            props = parse_uevent(os.read(fd, 65536))
+            action = props.get('ACTION')
+            if props.get('SUBSYSTEM') == 'block' and action in ('add', 'remove') and 'DEVNAME' in props:
+                emit(action, os.path.basename(props['DEVNAME']))
+
+        return fd, on_readable
+
+
+class InotifySource(_LinuxSource):
+    """Watches /dev for block device nodes appearing and disappearing"""
+    name = 'inotify'
+
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    _EVENT = struct.Struct('iIII')
+
+    def _open(self):
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        dev = os.path.join(self.root, 'dev').encode()
+        if libc.inotify_add_watch(fd, dev, self.IN_CREATE | self.IN_DELETE) < 0:
+            os.close(fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+        sys_block = os.path.join(self.root, 'sys', 'class', 'block')
+        known = set(os.listdir(sys_block)) if os.path.isdir(sys_block) else set()
+
+        def on_readable(emit):
+            try:
+                data = os.read(fd, 65536)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = self._EVENT.unpack_from(data, offset)
+                name = data[offset + 16:offset + 16 + length].rstrip(b'\0').decode('utf-8', 'replace')
+                offset += 16 + length
+                if mask & self.IN_CREATE and os.path.exists(os.path.join(sys_block, name)):
+                    known.add(name)
+                    emit('add', name)
+                elif mask & self.IN_DELETE and name in known:
+                    known.discard(name)
+                    emit('remove', name)
+
+        return fd, on_readable
+
+
+class PollingSource(HotplugSource):
+    """Diffs cheap device listings every `interval` seconds.
+
+    `list_devices` and `list_mounted` return sets of device names.
+    """
+    name = 'polling'
+
+    def __init__(self, list_devices, list_mounted=None, interval=POLL_INTERVAL):
+        self.list_devices = list_devices
+        self.list_mounted = list_mounted or (lambda: set())
+        self.interval = interval
+
+    def run(self, emit, stop):
+        devices = self.list_devices()
+        mounted = self.list_mounted()
+        while not stop.wait(self.interval):
+            current = self.list_devices()
+            for action, name in _diff(devices, current, 'add', 'remove'):
+                emit(action, name)
+            devices = current
+            current = self.list_mounted()
+            for action, name in _diff(mounted, current, 'mount', 'unmount'):
+                emit(action, name)
+            mounted = current
+
+
+def windows_drive_letters():
+    """Returns the set of assigned drive letters from the GetLogicalDrives bitmask"""
+    import ctypes
+    mask = ctypes.windll.kernel32.GetLogicalDrives()
+    return {f"{chr(65 + bit)}:" for bit in range(26) if mask & (1 << bit)}
+
+
+def windows_physical_drives(limit=WINDOWS_MAX_DRIVES):
+    """Returns the set of PhysicalDrive<N> names that can be opened.
+
+    Opening with no access rights does no I/O and needs no administrator
+    rights, so this is cheap enough to poll. It also sees disks that have
+    no drive letter, such as a stick whose partition table was cleared.
+    """
+    import ctypes
+    from ctypes import wintypes
+    kernel32 = ctypes.windll.kernel32
+    kernel32.CreateFileW.restype = wintypes.HANDLE
+    invalid = wintypes.HANDLE(-1).value
+    names = set()
+    for index in range(limit):
+        # No access, share read/write, OPEN_EXISTING
+        handle = kernel32.CreateFileW(f"\\\\.\\PhysicalDrive{index}", 0, 3, None, 3, 0, None)
+        if handle not in (None, invalid):
+            kernel32.CloseHandle(handle)
+            names.add(f"PhysicalDrive{index}")
+    return names
+
+
+def linux_block_devices(root='/'):
+    try:
+        return set(os.listdir(os.path.join(root, 'sys', 'class', 'block')))
+    except OSError:
+        return set()
+
+
+def get_default_source():
+    """Prefers kernel uevents, then inotify on /dev, then polling"""
+    if os.name == 'nt':
+        # Disks come and go as PhysicalDrive<N> (add/remove); drive letters appear
+        # once a volume is mounted, so those are mount events
+        return PollingSource(windows_physical_drives, windows_drive_letters)
+    if sys.platform.startswith('linux'):
+        for source in (NetlinkSource(), InotifySource()):
+            try:
+                fd, _ = source._open()
+                os.close(fd)
+                return source
+            except OSError as e:
+                logging.info(f"Hotplug source {source.name} unavailable: {e}")
+        return PollingSource(linux_block_devices, read_mounted_devices)
+    raise RuntimeError(f"No hotplug source for platform {sys.platform}")
+
+
+class HotplugWatcher:
+    """Runs a hotplug source on a background thread and fans events out to subscribers.
+
+    Subscribers are called on the watcher thread; GUI code must marshal to
+    its own thread (e.g. with root.after). Works without any GUI.
+    """
+
+    def __init__(self, source=None):
+        self.source = source or get_default_source()
+        self._subscribers = []
+        self._stop = threading.Event()
+        self._thread = None
+        # Seconds from event receipt to the end of subscriber dispatch, most recent last
+        self.latencies = deque(maxlen=256)
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def _emit(self, action, device):
+        event = HotplugEvent(action, device, time.monotonic())
+        logging.info(f"Hotplug {action}: {device}")
+        for callback in list(self._subscribers):
+            try:
+                callback(event)
+            except Exception as e:
+                logging.error(f"Hotplug subscriber failed for {action} {device}: {e}")
+        self.latencies.append(time.monotonic() - event.timestamp)
+
+    def _run(self):
+        try:
+            self.source.run(self._emit, self._stop)
+        except Exception as e:
+            logging.error(f"Hotplug watcher ({self.source.name}) stopped: {e}")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='usblock-hotplug', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,268 @@
+import os
+import json
+import mmap
+import time
+import queue
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+from usbLock_device import get_device_backend, drive_tag
+from usbLock_metadata import RawDisk
+
+# Bytes read from the device per request; a multiple of every sector size
+IMAGE_CHUNK = 4 * 1024 * 1024
+# All-zero runs of this size are left as holes in the image instead of written
+ZERO_BLOCK = 64 * 1024
+# One buffer being read, one being hashed and written, one spare
+IMAGE_BUFFERS = 3
+# The image is synced and a checkpoint written after this many new bytes
+CHECKPOINT_INTERVAL = 256 * 1024 * 1024
+CHECKPOINT_SUFFIX = ".checkpoint"
+PROGRESS_INTERVAL = 0.5
+
+_ZEROS = bytes(ZERO_BLOCK)
+
+ImageProgress = namedtuple('ImageProgress', ['done', 'total', 'rate'])
+ImageResult = namedtuple('ImageResult', [
+    'path', 'size', 'sha256', 'zero_bytes', 'resumed_from', 'seconds', 'complete'
+])
+
+
+class ImagingError(Exception):
+    """Raised when a drive cannot be imaged"""
+
+
+def checkpoint_path(image_path):
+    return f"{image_path}{CHECKPOINT_SUFFIX}"
+
+
+def read_checkpoint(image_path):
+    """Returns the checkpoint of an interrupted image, or None"""
+    try:
+        with open(checkpoint_path(image_path), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_checkpoint(image_path, state):
+    path = checkpoint_path(image_path)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _pwrite(fd, data, offset):
+    if hasattr(os, 'pwrite'):
+        return os.pwrite(fd, data, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.write(fd, data)
+
+
+def _make_sparse(fd):
+    """Marks an NTFS file sparse so skipped ranges take no space; POSIX files already are"""
+    if os.name != 'nt':
+        return
+    try:
+        import ctypes
+        import msvcrt
+        returned = ctypes.c_ulong()
+        # FSCTL_SET_SPARSE
+        ctypes.windll.kernel32.DeviceIoControl(
+            ctypes.c_void_p(msvcrt.get_osfhandle(fd)), 0x900C4, None, 0, None, 0, ctypes.byref(returned), None
+        )
+    except Exception as e:
+        logging.warning(f"Could not mark image sparse: {e}")
+
+
+def _write_chunk(fd, buffer, offset, length):
+    """Writes a chunk, skipping all-zero blocks; returns the number of zero bytes skipped"""
+    skipped = 0
+    run_start = None
+    for pos in range(0, length, ZERO_BLOCK):
+        end = min(pos + ZERO_BLOCK, length)
+        # Slicing an mmap copies into bytes, which compares with memcmp
+        if buffer[pos:end] == _ZEROS[:end - pos]:
+            if run_start is not None:
+                _flush_run(fd, buffer, offset, run_start, pos)
+                run_start = None
+            skipped += end - pos
+        elif run_start is None:
+            run_start = pos
+    if run_start is not None:
+        _flush_run(fd, buffer, offset, run_start, length)
+    return skipped
+
+
+def _flush_run(fd, buffer, offset, start, end):
+    view = memoryview(buffer)[start:end]
+    try:
+        done = 0
+        while done < len(view):
+            done += _pwrite(fd, view[done:], offset + start + done)
+    finally:
+        view.release()
+
+
+def _hash_prefix(fd, length):
+    """Re-hashes the first `length` bytes already in an image file"""
+    hasher = hashlib.sha256()
+    offset = 0
+    while offset < length:
+        os.lseek(fd, offset, os.SEEK_SET)
+        data = os.read(fd, min(IMAGE_CHUNK, length - offset))
+        if not data:
+            break
+        hasher.update(data)
+        offset += len(data)
+    return hasher, offset
+
+
+def _reader(disk, free, filled, start, size, chunk, cancel):
+    """Reads the device into free buffers and queues them, in order, for the writer"""
+    offset = start
+    try:
+        while offset < size and not cancel.is_set():
+            buffer = free.get()
+            length = min(chunk, size - offset)
+            got = disk.read_into(buffer, offset, length)
+            if got != length:
+                raise ImagingError(f"Short read at offset {offset}: {got} of {length} bytes")
+            filled.put((offset, buffer, length))
+            offset += length
+        filled.put(None)
+    except BaseException as e:
+        filled.put(e)
+
+
+def create_image(drive_number, image_path, devices=None, on_progress=None, cancel=None, resume=True):
+    """Streams a whole drive into a sparse image file and returns an ImageResult.
+
+    A reader thread fills a small pool of reusable aligned buffers while
+    this thread hashes and writes the previous one. Every CHECKPOINT_INTERVAL
+    bytes the image is synced and <image>.checkpoint records how far it got,
+    so an interrupted run resumes there. Setting `cancel` stops after the
+    chunk in flight; the result then has complete=False.
+    """
+    devices = devices or get_device_backend()
+    cancel = cancel or threading.Event()
+    image_path = str(image_path)
+    try:
+        serial = devices.serial(drive_number)
+    except Exception:
+        serial = None
+
+    with RawDisk.open(devices, drive_number) as disk:
+        # RawDisk asks the backend: seeking to the end of a Windows PhysicalDrive handle gives 0
+        size = disk.size()
+        if size <= 0:
+            raise ImagingError(f"Drive {drive_number} reports a size of {size} bytes; nothing to image")
+        checkpoint = read_checkpoint(image_path) if resume else None
+        if checkpoint and (checkpoint.get('size') != size or checkpoint.get('serial') != serial):
+            logging.warning(f"Checkpoint for {image_path} is from another disk; starting over")
+            checkpoint = None
+
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+        if checkpoint is None:
+            flags |= os.O_TRUNC
+        fd = os.open(image_path, flags, 0o644)
+        buffers = []
+        try:
+            _make_sparse(fd)
+            hasher = hashlib.sha256()
+            start = zero_bytes = 0
+            if checkpoint:
+                hasher, hashed = _hash_prefix(fd, checkpoint['offset'])
+                if hashed == checkpoint['offset'] and hasher.hexdigest() == checkpoint['sha256']:
+                    start, zero_bytes = checkpoint['offset'], checkpoint['zero_bytes']
+                    logging.info(f"Resuming image of drive {drive_number} at {start} bytes")
+                else:
+                    logging.warning(f"Partial image {image_path} does not match its checkpoint; starting over")
+                    hasher = hashlib.sha256()
+                    os.ftruncate(fd, 0)
+
+            state = {'drive': drive_tag(drive_number), 'serial': serial, 'size': size, 'offset': start,
+                     'sha256': hasher.hexdigest(), 'zero_bytes': zero_bytes}
+            free = queue.Queue()
+            filled = queue.Queue()
+            for _ in range(IMAGE_BUFFERS):
+                buffers.append(mmap.mmap(-1, IMAGE_CHUNK))
+                free.put(buffers[-1])
+            reader = threading.Thread(
+                target=_reader, args=(disk, free, filled, start, size, IMAGE_CHUNK, cancel), daemon=True
+            )
+            began = time.perf_counter()
+            last_progress = 0.0
+            done = last_checkpoint = start
+            reader.start()
+            try:
+                while True:
+                    item = filled.get()
+                    if item is None:
+                        break
+                    if isinstance(item, BaseException):
+                        raise item
+                    offset, buffer, length = item
+                    with memoryview(buffer)[:length] as view:
+                        hasher.update(view)
+                    zero_bytes += _write_chunk(fd, buffer, offset, length)
+                    free.put(buffer)
+                    done = offset + length
+
+                    if done - last_checkpoint >= CHECKPOINT_INTERVAL:
+                        # Extend over trailing holes so the file is as long as the checkpoint says
+                        os.ftruncate(fd, done)
+                        os.fsync(fd)
+                        state.update(offset=done, sha256=hasher.hexdigest(), zero_bytes=zero_bytes)
+                        _write_checkpoint(image_path, state)
+                        last_checkpoint = done
+                    now = time.perf_counter()
+                    if on_progress and now - last_progress >= PROGRESS_INTERVAL:
+                        last_progress = now
+                        on_progress(ImageProgress(done, size, (done - start) / (now - began) / 1e6))
+            except BaseException:
+                cancel.set()
+                while reader.is_alive():
+                    # Hand buffers back so a reader blocked on the pool can see `cancel`
+                    try:
+                        item = filled.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    if isinstance(item, tuple):
+                        free.put(item[1])
+                raise
+            finally:
+                reader.join()
+
+            complete = done == size
+            os.ftruncate(fd, done)
+            os.fsync(fd)
+            seconds = time.perf_counter() - began
+            digest = hasher.hexdigest()
+            state.update(offset=done, sha256=digest, zero_bytes=zero_bytes)
+            if on_progress:
+                on_progress(ImageProgress(done, size, (done - start) / max(seconds, 1e-9) / 1e6))
+        finally:
+            os.close(fd)
+            for buffer in buffers:
+                buffer.close()
+
+    if complete:
+        with open(f"{image_path}.sha256", "w") as f:
+            f.write(f"{digest} *{os.path.basename(image_path)}\n")
+        try:
+            os.remove(checkpoint_path(image_path))
+        except FileNotFoundError:
+            pass
+        logging.info(
+            f"Imaged drive {drive_number} to {image_path}: {size} bytes, {zero_bytes} zero bytes skipped, "
+            f"{(size - start) / max(seconds, 1e-9) / 1e6:.1f} MB/s"
+        )
+    else:
+        _write_checkpoint(image_path, state)
+        logging.info(f"Imaging of drive {drive_number} stopped at {done} of {size} bytes")
+    return ImageResult(image_path, size, digest if complete else None, zero_bytes, start, seconds, complete)
@@ -0,0 +1,179 @@
+import re
+import time
+import threading
+import logging
+from collections import namedtuple
+from usbLock_enum import device_key
+from usbLock_device import get_device_backend
+from usbLock_records import VolumeRecord, PhysicalDriveRecord
+
+# Seconds a drive listing stays valid before it is enumerated again
+INVENTORY_TTL = 5.0
+
+# An immutable listing; the GUI keeps the one it displayed so a click maps to what the user saw
+Snapshot = namedtuple('Snapshot', ['kind', 'generation', 'taken_at', 'records'])
+# Records that appeared, disappeared, or kept their identity but changed, between two listings
+RecordDiff = namedtuple('RecordDiff', ['added', 'removed', 'changed'])
+
+
+def diff_records(old, new):
+    """Compares two listings by record identity"""
+    before = {r.identity: r for r in old}
+    after = {r.identity: r for r in new}
+    added = [r for key, r in after.items() if key not in before]
+    removed = [r for key, r in before.items() if key not in after]
+    changed = [r for key, r in after.items() if key in before and before[key] != r]
+    return RecordDiff(added, removed, changed)
+
+
+def volume_order(record):
+    """Sort key for volume listings: by device name, with numbers compared as numbers (sdb2 < sdb10)"""
+    return tuple(int(part) if part.isdigit() else part for part in re.split(r'(\d+)', device_key(record.device)))
+
+
+def _reuse(records, previous):
+    """Swaps in the previous listing's equal records, which already hold their display strings"""
+    if previous is None:
+        return tuple(records)
+    known = {r: r for r in previous.records}
+    return tuple(known.get(r, r) for r in records)
+
+
+class Inventory:
+    """Caches drive listings with a TTL and explicit invalidation.
+
+    Loaders are plain callables returning lists of dicts, e.g. the
+    existing get_usb_drives and get_all_physical_drives.
+    """
+    KINDS = {'volumes': VolumeRecord, 'physical': PhysicalDriveRecord}
+
+    def __init__(self, load_volumes, load_physical, ttl=INVENTORY_TTL, clock=time.monotonic,
+                 load_device=None, devices=None):
+        self.loaders = {'volumes': load_volumes, 'physical': load_physical}
+        # Called with a device name to list just that device's volumes on hotplug
+        self.load_device = load_device
+        # Tells which disk a volume is on, so a disk's removal drops its volumes
+        self.devices = devices
+        # device_key -> disk for the listed volumes, resolved while they still exist
+        self._volume_disks = {}
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        # The last listing of each kind, kept through invalidation to diff against
+        self._last = {}
+        self._generation = 0
+        self._epoch = 0
+
+    def invalidate(self, kind=None):
+        """Drops cached listings so the next read enumerates again"""
+        with self._lock:
+            # Listings already being loaded must not be cached once they finish
+            self._epoch += 1
+            if kind is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(kind, None)
+
+    def snapshot(self, kind, max_age=None):
+        """Returns a cached Snapshot of `kind`, loading it if stale or invalidated"""
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            cached = self._snapshots.get(kind)
+            if cached is not None and self.clock() - cached.taken_at <= max_age:
+                return cached
+            generation = self._generation = self._generation + 1
+            epoch = self._epoch
+        # Enumerate outside the lock so concurrent readers are not serialized behind it
+        record_type = self.KINDS[kind]
+        records = [record_type.from_dict(item) for item in self.loaders[kind]()]
+        if kind == 'volumes':
+            # The order incremental updates keep, so both agree whatever order the backend lists in
+            records.sort(key=volume_order)
+            disks = self._resolve_disks(records)
+        with self._lock:
+            previous = self._last.get(kind)
+        records = _reuse(records, previous)
+        snapshot = Snapshot(kind, generation, self.clock(), records)
+        with self._lock:
+            current = self._snapshots.get(kind)
+            if epoch == self._epoch and (current is None or current.generation < generation):
+                self._snapshots[kind] = snapshot
+            last = self._last.get(kind)
+            if last is None or last.generation < generation:
+                self._last[kind] = snapshot
+                if kind == 'volumes':
+                    self._volume_disks = disks
+        if previous is None:
+            logging.info(f"Inventory refreshed: {len(records)} {kind} record(s)")
+        else:
+            diff = diff_records(previous.records, records)
+            logging.info(f"Inventory refreshed: {len(records)} {kind} record(s), {len(diff.added)} added, "
+                         f"{len(diff.removed)} removed, {len(diff.changed)} changed")
+        return snapshot
+
+    def _resolve_disks(self, records):
+        devices = self.devices or get_device_backend()
+        disks = {}
+        for record in records:
+            key = device_key(record.device)
+            try:
+                disk = devices.disk_for_device(key)
+            except Exception as e:
+                logging.debug(f"Cannot tell the disk of {key}: {e}")
+                continue
+            if disk is not None:
+                disks[key] = disk
+        return disks
+
+    def _owned_by(self, record, device):
+        """True if a volume is the event's device or sits on the disk the event names"""
+        key = device_key(record.device)
+        if key == device:
+            return True
+        disk = self._volume_disks.get(key)
+        return disk is not None and (self.devices or get_device_backend()).hotplug_name(disk) == device
+
+    def volumes(self, max_age=None):
+        return self.snapshot('volumes', max_age)
+
+    def physical_drives(self, max_age=None):
+        return self.snapshot('physical', max_age)
+
+    def apply_event(self, event):
+        """Updates the cached volume listing for one hotplug event.
+
+        Removals drop the device and, for a whole disk, the volumes the
+        backend placed on it; arrivals enumerate only the new device. Without
+        a cached listing or a device loader the volume listing is simply
+        invalidated.
+        """
+        if event.action in ('add', 'remove'):
+            self.invalidate('physical')
+        with self._lock:
+            cached = self._snapshots.get('volumes')
+        if cached is None or self.load_device is None:
+            self.invalidate('volumes')
+            return None
+
+        device = device_key(event.device)
+        records = [r for r in cached.records if not self._owned_by(r, device)]
+        added = []
+        if event.action in ('add', 'mount'):
+            added = _reuse((VolumeRecord.from_dict(item) for item in self.load_device(event.device)), cached)
+            records += added
+            records.sort(key=volume_order)
+        disks = self._resolve_disks(added)
+
+        with self._lock:
+            if self._snapshots.get('volumes') is not cached:
+                # Another refresh won the race; it already reflects this event
+                return self._snapshots.get('volumes')
+            self._generation += 1
+            snapshot = Snapshot('volumes', self._generation, cached.taken_at, tuple(records))
+            self._snapshots['volumes'] = self._last['volumes'] = snapshot
+            kept = {device_key(r.device) for r in records}
+            self._volume_disks = {k: d for k, d in self._volume_disks.items() if k in kept}
+            self._volume_disks.update(disks)
+        logging.info(f"Inventory updated for {event.action} {event.device}: {len(records)} volume(s)")
+        return snapshot
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import uuid
+import zlib
+import atexit
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+
+JOURNAL_NAME = "journal.jsonl"
+
+# An intent is appended (and synced) before the first sector write of an
+# operation; a done/aborted record closes it. Intents still open at startup
+# belong to operations the process did not live to finish.
+INTENT = 'intent'
+DONE = 'done'
+ABORTED = 'aborted'
+
+# pre_regions/post_regions hold one digest per region, so recovery can tell a torn write
+# (every region is either its pre- or its post-image) from a disk changed by someone else;
+# intents written before they were recorded have None there
+Intent = namedtuple('Intent', ['id', 'op', 'drive', 'serial', 'regions', 'pre', 'post', 'backup', 'created',
+                               'pre_regions', 'post_regions'])
+Recovery = namedtuple('Recovery', ['id', 'op', 'drive', 'serial', 'outcome', 'detail'])
+
+
+def digest(chunks):
+    """sha256 over the concatenation of byte chunks, as recorded for pre- and post-images"""
+    hasher = hashlib.sha256()
+    for chunk in chunks:
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _encode(record):
+    body = json.dumps(record, sort_keys=True, separators=(',', ':'))
+    # The CRC tells a complete record from the torn tail of an interrupted append
+    return f"{zlib.crc32(body.encode()):08x} {body}\n".encode()
+
+
+def _decode(line):
+    try:
+        crc, body = line.decode().rstrip("\n").split(" ", 1)
+        if int(crc, 16) != zlib.crc32(body.encode()):
+            return None
+        return json.loads(body)
+    except ValueError:
+        return None
+
+
+class Journal:
+    """Append-only, fsync'd write-ahead log of disk operations.
+
+    Appends that must be durable are group-committed: whichever caller finds
+    no sync in progress writes every pending record with one write() and one
+    fsync() while the others wait, so a batch of drives shares a handful of
+    syncs instead of paying one each.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._cond = threading.Condition()
+        self._pending = []
+        self._appended = 0
+        self._durable = 0
+        self._flushing = False
+        self._fd = None
+        self.fsyncs = 0
+        self.records = 0
+
+    def _open(self):
+        if self._fd is None:
+            created = not os.path.exists(self.path)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+            if created and os.name != 'nt':
+                # Make the new directory entry itself durable
+                dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+        return self._fd
+
+    def append(self, record, durable=True):
+        """Queues a record; with durable, returns only once it is synced to disk"""
+        with self._cond:
+            self._pending.append(_encode(record))
+            self._appended += 1
+            seq = self._appended
+            if durable:
+                self._wait_durable(seq)
+        return seq
+
+    def flush(self):
+        """Syncs every record appended so far"""
+        with self._cond:
+            self._wait_durable(self._appended)
+
+    def _wait_durable(self, seq):
+        while self._durable < seq:
+            if self._flushing:
+                self._cond.wait()
+                continue
+            batch, self._pending = self._pending, []
+            upto = self._appended
+            self._flushing = True
+            self._cond.release()
+            try:
+                fd = self._open()
+                data = b''.join(batch)
+                while data:
+                    data = data[os.write(fd, data):]
+                os.fsync(fd)
+            except BaseException:
+                self._cond.acquire()
+                # Leave the records for the next caller to retry
+                self._pending[:0] = batch
+                self._flushing = False
+                self._cond.notify_all()
+                raise
+            self._cond.acquire()
+            self.fsyncs += 1
+            self.records += len(batch)
+            self._durable = upto
+            self._flushing = False
+            self._cond.notify_all()
+
+    def begin(self, op, drive, serial, regions, pre, post, backup, pre_regions=None, post_regions=None):
+        """Durably records the intent to write `regions` of a drive; returns the Intent"""
+        intent = Intent(uuid.uuid4().hex, op, drive, serial, [list(r) for r in regions], pre, post,
+                        str(backup) if backup else None, time.time(), pre_regions, post_regions)
+        self.append(dict(intent._asdict(), type=INTENT))
+        return intent
+
+    def end(self, intent, state=DONE, **extra):
+        """Closes an intent. Not synced on its own: a lost end record only makes recovery re-check the disk"""
+        self.append(dict(extra, id=intent.id, type=state), durable=False)
+
+    def read(self):
+        """Returns every intact record in the journal file, oldest first"""
+        records = []
+        try:
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    record = _decode(line)
+                    if record is not None:
+                        records.append(record)
+        except FileNotFoundError:
+            pass
+        return records
+
+    def open_intents(self):
+        """Returns the Intents that have no done or aborted record"""
+        intents = {}
+        for record in self.read():
+            if record.get('type') == INTENT:
+                intents[record['id']] = Intent(**{f: record.get(f) for f in Intent._fields})
+            else:
+                intents.pop(record.get('id'), None)
+        return list(intents.values())
+
+    def compact(self):
+        """Rewrites the journal keeping only open intents"""
+        with self._cond:
+            self._wait_durable(self._appended)
+            keep = [_encode(dict(i._asdict(), type=INTENT)) for i in self.open_intents()]
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(b''.join(keep))
+                f.flush()
+                os.fsync(f.fileno())
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            os.replace(tmp, self.path)
+
+    def close(self):
+        with self._cond:
+            if self._pending:
+                self._wait_durable(self._appended)
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def get_journal(backup_dir):
+    """Returns the shared journal of a backup directory"""
+    key = os.path.abspath(str(backup_dir))
+    with _journals_lock:
+        journal = _journals.get(key)
+        if journal is None:
+            os.makedirs(key, exist_ok=True)
+            journal = _journals[key] = Journal(os.path.join(key, JOURNAL_NAME))
+        return journal
+
+
+@atexit.register
+def _close_journals():
+    for journal in list(_journals.values()):
+        try:
+            journal.close()
+        except OSError as e:
+            logging.error(f"Could not sync journal {journal.path}: {e}")
@@ -0,0 +1,139 @@
+import os
+import logging
+from collections import namedtuple
+from usbLock_partition import SECTOR_SIZE, parse_mbr, parse_gpt_header, looks_like_boot_sector
+from usbLock_device import get_device_backend
+from usbLock_metadata import RawDisk
+from usbLock_store import StoreError, read_backup, is_reference
+
+# Minimum score for a backup to be suggested without the operator choosing it
+MATCH_THRESHOLD = 50
+# Partition start sectors probed on the target; candidates mostly share a few (63, 2048, ...)
+MAX_PROBED_LBAS = 64
+
+Candidate = namedtuple('Candidate', ['entry', 'mbr'])
+Match = namedtuple('Match', ['score', 'entry', 'reasons'])
+TargetMetadata = namedtuple('TargetMetadata', [
+    'drive', 'serial', 'disk_size', 'sector_size', 'backup_gpt', 'boot_sectors'
+])
+
+
+def load_candidates(entries):
+    """Reads and parses the sector of every backup entry; unreadable or invalid ones are dropped"""
+    candidates = []
+    for entry in entries:
+        try:
+            if is_reference(entry.path):
+                data = read_backup(entry.path)
+            else:
+                fd = os.open(entry.path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+                try:
+                    data = os.read(fd, SECTOR_SIZE)
+                finally:
+                    os.close(fd)
+        except (OSError, StoreError):
+            continue
+        mbr = parse_mbr(data)
+        if mbr.valid:
+            candidates.append(Candidate(entry, mbr))
+    return candidates
+
+
+def read_target_metadata(drive_number, lbas=(), devices=None, serial=None):
+    """Reads what survives on a disabled disk: size, the backup GPT header and boot sectors"""
+    devices = devices or get_device_backend()
+    if serial is None:
+        try:
+            serial = devices.serial(drive_number)
+        except Exception:
+            serial = None
+    disk_size = None
+    backup_gpt = None
+    boot_sectors = set()
+    geometry = devices.sector_sizes(drive_number)
+    logical = geometry.logical
+    # Raw device handles on Windows cannot seek to their end; RawDisk asks the backend for the size
+    with RawDisk.open(devices, drive_number, geometry) as disk:
+        try:
+            disk_size = disk.size()
+        except OSError:
+            pass
+        if disk_size and disk_size >= logical:
+            # The backup GPT header lives in the last LBA and is untouched by disable
+            backup_gpt = parse_gpt_header(disk.read(disk_size - logical, logical))
+        for lba in sorted(lbas)[:MAX_PROBED_LBAS]:
+            offset = lba * logical
+            if disk_size and offset + SECTOR_SIZE > disk_size:
+                continue
+            if looks_like_boot_sector(disk.read(offset, SECTOR_SIZE)):
+                boot_sectors.add(lba)
+    return TargetMetadata(drive_number, serial, disk_size or None, logical, backup_gpt, frozenset(boot_sectors))
+
+
+def score_candidate(candidate, target):
+    """Scores how likely a backup belongs to the target disk; returns (score, reasons)"""
+    entry, mbr = candidate
+    score = 0
+    reasons = []
+    known_serial = target.serial and target.serial != "Unknown"
+    if known_serial and entry.serial:
+        if entry.serial == target.serial:
+            score += 40
+            reasons.append("serial matches")
+        else:
+            score -= 40
+            reasons.append("serial differs")
+    if target.disk_size and entry.disk_size:
+        if entry.disk_size == target.disk_size:
+            score += 20
+            reasons.append("disk size matches")
+        else:
+            score -= 20
+            reasons.append("disk size differs")
+    if mbr.protective and target.backup_gpt is not None and entry.disk_id:
+        if entry.disk_id == f"gpt:{target.backup_gpt.disk_guid}":
+            score += 50
+            reasons.append("GPT disk GUID matches backup header")
+        else:
+            score -= 30
+            reasons.append("GPT disk GUID differs")
+    if not mbr.protective:
+        disk_sectors = target.disk_size // target.sector_size if target.disk_size else None
+        booted = 0
+        for partition in mbr.partitions:
+            if disk_sectors and partition.lba_start + partition.sectors > disk_sectors:
+                score -= 50
+                reasons.append(f"partition at LBA {partition.lba_start} exceeds the disk")
+            elif partition.lba_start in target.boot_sectors:
+                booted += 1
+        if booted:
+            score += min(booted, 2) * 15
+            reasons.append(f"{booted} partition(s) start on a filesystem boot sector")
+    return score, reasons
+
+
+def rank_backups(drive_number, entries, devices=None, serial=None):
+    """Returns Matches for every usable backup, best first"""
+    candidates = load_candidates(entries)
+    if not candidates:
+        return []
+    lbas = {p.lba_start for c in candidates if not c.mbr.protective for p in c.mbr.partitions}
+    try:
+        target = read_target_metadata(drive_number, lbas, devices, serial)
+    except OSError as e:
+        logging.error(f"Cannot read drive {drive_number} for backup matching: {e}")
+        return []
+    matches = []
+    for candidate in candidates:
+        score, reasons = score_candidate(candidate, target)
+        matches.append(Match(score, candidate.entry, reasons))
+    matches.sort(key=lambda m: (m.score, m.entry.created), reverse=True)
+    return matches
+
+
+def suggest_backup(drive_number, entries, devices=None, serial=None, threshold=MATCH_THRESHOLD):
+    """Returns the best Match if it reaches the threshold, otherwise None"""
+    matches = rank_backups(drive_number, entries, devices, serial)
+    if matches and matches[0].score >= threshold:
+        return matches[0]
+    return None
@@ -0,0 +1,331 @@
+import os
+import io
+import mmap
+import time
+import hashlib
+import logging
+from collections import namedtuple, deque
+from usbLock_partition import parse_mbr, parse_gpt_header
+from usbLock_device import get_device_backend
+from usbLock_metrics import span, observe, count
+
+# Size of a standard GPT partition entry array: 128 entries of 128 bytes
+GPT_ENTRIES_BYTES = 128 * 128
+# Rewrites after a read-back mismatch, waiting VERIFY_BACKOFF, then twice as long, ...
+VERIFY_RETRIES = 3
+VERIFY_BACKOFF = 0.05
+
+VerifyResult = namedtuple('VerifyResult', ['bytes', 'attempts', 'seconds'])
+
+# Recent verification costs (seconds of sync + read-back per operation), newest last
+verify_latencies = deque(maxlen=256)
+
+
+class MetadataError(ValueError):
+    """Raised when captured metadata cannot be restored onto a drive"""
+
+
+class VerifyError(MetadataError):
+    """Raised when written sectors still read back wrong after every retry"""
+
+
+def align_down(value, alignment):
+    return value - value % alignment
+
+
+def align_up(value, alignment):
+    return -(-value // alignment) * alignment
+
+
+class RawDisk:
+    """Sector-aligned reads and writes on an fd from DeviceBackend.open_raw().
+
+    Buffers are anonymous mmaps, which are page aligned as O_DIRECT requires.
+    Reads are widened to whole physical sectors; `syscalls` counts the I/O
+    calls made so callers can see how many round trips a capture took.
+    """
+
+    def __init__(self, fd, geometry, writable=False, length=None):
+        self.file = io.FileIO(fd, 'r+' if writable else 'r')
+        self.geometry = geometry
+        self.syscalls = 0
+        # Returns the device size; seeking to the end is only right for files and Linux block devices
+        self._length = length
+        self._size = None
+
+    @classmethod
+    def open(cls, devices, drive_number, geometry=None, writable=False):
+        if geometry is None:
+            with span('device.sector_sizes'):
+                geometry = devices.sector_sizes(drive_number)
+        with span('device.open'):
+            fd = devices.open_raw(drive_number, writable)
+        return cls(fd, geometry, writable, lambda: devices.disk_size(drive_number))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def size(self):
+        """Returns the device size in bytes"""
+        if self._size is None:
+            self.syscalls += 1
+            if self._length is not None:
+                self._size = self._length()
+            else:
+                self._size = os.lseek(self.file.fileno(), 0, os.SEEK_END)
+        return self._size
+
+    def _transfer(self, buffer, offset, write):
+        with span('device.write' if write else 'device.read'):
+            done = self._transfer_all(buffer, offset, write)
+        count('device.bytes_written' if write else 'device.bytes_read', done)
+        return done
+
+    def _transfer_all(self, buffer, offset, write):
+        fd = self.file.fileno()
+        view = memoryview(buffer)
+        done = 0
+        while done < len(view):
+            chunk = view[done:]
+            if write and hasattr(os, 'pwritev'):
+                n = os.pwritev(fd, [chunk], offset + done)
+            elif not write and hasattr(os, 'preadv'):
+                n = os.preadv(fd, [chunk], offset + done)
+            else:
+                # Windows has no positional I/O in os; FileIO still uses our aligned buffer
+                self.syscalls += 1
+                os.lseek(fd, offset + done, os.SEEK_SET)
+                n = self.file.write(chunk) if write else self.file.readinto(chunk)
+            self.syscalls += 1
+            if not n:
+                break
+            done += n
+        view.release()
+        return done
+
+    def read_into(self, buffer, offset, length=None):
+        """Reads into a caller-owned aligned buffer (e.g. an mmap) at a sector-aligned offset; returns bytes read"""
+        view = memoryview(buffer)[:length]
+        try:
+            return self._transfer(view, offset, write=False)
+        finally:
+            view.release()
+
+    def read(self, offset, length):
+        """Reads `length` bytes at `offset` with one aligned read of whole physical sectors"""
+        physical = self.geometry.physical
+        start = align_down(offset, physical)
+        end = align_up(offset + length, physical)
+        if self._size is not None:
+            end = min(end, align_up(self._size, self.geometry.logical))
+        if end <= start:
+            return b''
+        buffer = mmap.mmap(-1, end - start)
+        try:
+            got = self._transfer(buffer, start, write=False)
+            return buffer[offset - start:min(got, offset - start + length)]
+        finally:
+            buffer.close()
+
+    def write_from(self, buffer, offset, length=None):
+        """Writes from a caller-owned aligned buffer at a sector-aligned offset; returns bytes written"""
+        view = memoryview(buffer)[:length]
+        try:
+            return self._transfer(view, offset, write=True)
+        finally:
+            view.release()
+
+    def sync(self):
+        """Forces written data through OS buffers and the device's write cache"""
+        self.syscalls += 1
+        with span('device.sync'):
+            os.fsync(self.file.fileno())
+
+    def _drop_cache(self, offset, length):
+        # Without O_DIRECT (e.g. image files on tmpfs) the re-read must not come from the page cache
+        if hasattr(os, 'posix_fadvise'):
+            self.syscalls += 1
+            os.posix_fadvise(self.file.fileno(), offset, length, os.POSIX_FADV_DONTNEED)
+
+    def write_verified(self, offset, data, retries=VERIFY_RETRIES, backoff=VERIFY_BACKOFF):
+        """Writes, syncs and re-reads a region until its hash matches; returns VerifyResult.
+
+        The time reported covers the sync, the read-back and any retries,
+        i.e. what verification adds on top of the plain write.
+        """
+        expected = hashlib.sha256(data).digest()
+        self.write(offset, data)
+        began = time.perf_counter()
+        for attempt in range(1, retries + 2):
+            self.sync()
+            self._drop_cache(offset, len(data))
+            if hashlib.sha256(self.read(offset, len(data))).digest() == expected:
+                seconds = time.perf_counter() - began
+                observe('device.verify', seconds)
+                return VerifyResult(len(data), attempt, seconds)
+            logging.warning(f"Read-back of {len(data)} bytes at offset {offset} does not match (attempt {attempt})")
+            if attempt > retries:
+                break
+            time.sleep(backoff * 2 ** (attempt - 1))
+            self.write(offset, data)
+        raise VerifyError(f"{len(data)} bytes at offset {offset} still read back wrong after {retries + 1} attempts")
+
+    def write(self, offset, data):
+        """Writes whole logical sectors at a logical-sector-aligned offset in one call"""
+        logical = self.geometry.logical
+        if offset % logical or len(data) % logical:
+            raise MetadataError(f"Write of {len(data)} bytes at {offset} is not aligned to {logical}-byte sectors")
+        buffer = mmap.mmap(-1, len(data))
+        try:
+            buffer.write(data)
+            if self._transfer(buffer, offset, write=True) != len(data):
+                raise OSError(f"Short write at offset {offset}")
+        finally:
+            buffer.close()
+
+
+_Capture = namedtuple('MetadataCapture', ['geometry', 'disk_size', 'head', 'tail_offset', 'tail', 'gpt', 'syscalls'])
+
+
+class MetadataCapture(_Capture):
+    """Partition metadata read from a drive: the head region and, for GPT, the backup GPT at the end"""
+    __slots__ = ()
+
+    @property
+    def data(self):
+        return self.head + self.tail
+
+    @property
+    def layout(self):
+        """Describes where data goes on restore; stored in the backup reference"""
+        layout = {'logical': self.geometry.logical, 'physical': self.geometry.physical, 'head': len(self.head)}
+        if self.tail:
+            layout['tail_offset'] = self.tail_offset
+        return layout
+
+
+def head_span(geometry):
+    """Bytes from LBA 0 through a standard GPT entry array (LBA 0-33 on 512-byte sectors)"""
+    return 2 * geometry.logical + align_up(GPT_ENTRIES_BYTES, geometry.logical)
+
+
+def capture_metadata(drive_number, devices=None):
+    """Reads the partition metadata of a drive in as few aligned reads as possible.
+
+    MBR disks keep only LBA 0, since everything after it may be data. GPT
+    disks keep LBA 0 through the primary entry array and the backup entry
+    array plus header at the end of the disk.
+    """
+    devices = devices or get_device_backend()
+    geometry = devices.sector_sizes(drive_number)
+    logical = geometry.logical
+    with RawDisk.open(devices, drive_number, geometry) as disk:
+        # The backend's length, not a seek to the end, so the GPT tail is found on Windows too
+        try:
+            disk_size = disk.size()
+        except OSError:
+            disk_size = None
+        head = disk.read(0, head_span(geometry))
+        if len(head) < logical:
+            raise MetadataError(f"Could not read LBA 0 of drive {drive_number}")
+        mbr = parse_mbr(head)
+        gpt = parse_gpt_header(head, logical) if mbr.protective else None
+        if gpt is None or not gpt.crc_valid:
+            return MetadataCapture(geometry, disk_size, head[:logical], None, b'', False, disk.syscalls)
+
+        entries_bytes = align_up(gpt.num_entries * gpt.entry_size, logical)
+        head_end = max(2 * logical, gpt.entries_lba * logical + entries_bytes)
+        if head_end > len(head):
+            # Non-standard entry arrays need a second read
+            head += disk.read(len(head), head_end - len(head))
+        head = head[:head_end]
+
+        tail_offset, tail = None, b''
+        if disk_size:
+            tail_end = min(disk_size, (gpt.backup_lba + 1) * logical)
+            tail_len = entries_bytes + logical
+            tail_offset = max(tail_end - tail_len, head_end)
+            tail = disk.read(tail_offset, tail_end - tail_offset)
+            backup = parse_gpt_header(tail, len(tail) - logical) if len(tail) >= logical else None
+            if backup is None or not backup.crc_valid:
+                logging.warning(f"Drive {drive_number} has no valid backup GPT header")
+            elif head_end <= backup.entries_lba * logical < tail_offset:
+                start = backup.entries_lba * logical
+                tail = disk.read(start, tail_offset - start) + tail
+                tail_offset = start
+        return MetadataCapture(geometry, disk_size, head, tail_offset, tail, True, disk.syscalls)
+
+
+def _combine(drive_number, results):
+    result = VerifyResult(sum(r.bytes for r in results), max(r.attempts for r in results),
+                          sum(r.seconds for r in results))
+    verify_latencies.append(result.seconds)
+    logging.info(
+        f"Verified {result.bytes} bytes on drive {drive_number} in {result.seconds * 1000:.1f} ms "
+        f"({result.attempts} attempt(s))"
+    )
+    return result
+
+
+def restore_metadata(drive_number, data, layout=None, devices=None, verify=True, before_write=None):
+    """Writes captured metadata back to a drive.
+
+    Backups without a layout are legacy 512-byte LBA 0 captures. On drives
+    with larger sectors they are merged into the drive's current first sector.
+    With verify, each region is synced and read back; returns a VerifyResult
+    (or None without verify) and raises VerifyError if it never matches.
+    before_write(disk, writes) is called with the planned (offset, data)
+    writes once they are known and before any of them is made.
+    """
+    devices = devices or get_device_backend()
+    geometry = devices.sector_sizes(drive_number)
+    logical = geometry.logical
+    layout = layout or {}
+    if layout.get('logical', logical) != logical:
+        raise MetadataError(f"backup was taken with {layout['logical']}-byte sectors, drive uses {logical}")
+    head_size = layout.get('head', len(data))
+    head, tail = data[:head_size], data[head_size:]
+    if not head or (tail and 'tail_offset' not in layout):
+        raise MetadataError("backup layout does not match its content")
+    with RawDisk.open(devices, drive_number, geometry, writable=True) as disk:
+        if tail:
+            disk_size = disk.size()
+            if layout['tail_offset'] + len(tail) != disk_size:
+                raise MetadataError(
+                    f"backup was taken from a {layout['tail_offset'] + len(tail)}-byte disk, drive has {disk_size} bytes"
+                )
+        if len(head) % logical:
+            current = disk.read(0, align_up(len(head), logical))
+            head = head + current[len(head):]
+        # The backup GPT goes first: until LBA 0 is written the drive stays disabled
+        writes = [(layout['tail_offset'], tail)] if tail else []
+        writes.append((0, head))
+        if before_write:
+            before_write(disk, writes)
+        write = disk.write_verified if verify else disk.write
+        results = [write(offset, region) for offset, region in writes]
+    return _combine(drive_number, results) if verify else None
+
+
+def clear_boot_sector(drive_number, devices=None, verify=True, before_write=None):
+    """Zeroes LBA 0 (one whole logical sector) so the drive's partitions are not recognized.
+
+    Returns a VerifyResult with verify, else None. before_write is called as
+    in restore_metadata().
+    """
+    devices = devices or get_device_backend()
+    geometry = devices.sector_sizes(drive_number)
+    with RawDisk.open(devices, drive_number, geometry, writable=True) as disk:
+        if before_write:
+            before_write(disk, [(0, bytes(geometry.logical))])
+        if not verify:
+            disk.write(0, bytes(geometry.logical))
+            return None
+        result = disk.write_verified(0, bytes(geometry.logical))
+    return _combine(drive_number, [result])
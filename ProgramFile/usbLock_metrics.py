@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import bisect
+import functools
+import threading
+
+# Upper bounds in seconds: 10 µs doubling every two buckets up to ~2.5 minutes
+BUCKETS = tuple(1e-5 * 2 ** (i / 2) for i in range(48))
+PROMETHEUS_PREFIX = "usblock"
+
+_enabled = os.environ.get('USBLOCK_METRICS', '') not in ('', '0')
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_gauges = {}
+
+
+class Histogram:
+    """Counts observations per bucket; quantiles are interpolated within a bucket"""
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = BUCKETS[index - 1] if index else 0.0
+                upper = BUCKETS[index] if index < len(BUCKETS) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'began')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.began = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self.began)
+        if exc_type is not None:
+            count(f"{self.name}.errors")
+        return False
+
+
+def enable(on=True):
+    """Turns instrumentation on or off for the whole process (USBLOCK_METRICS=1 turns it on at start)"""
+    global _enabled
+    _enabled = on
+
+
+def enabled():
+    return _enabled
+
+
+def span(name):
+    """Context manager timing a block into the histogram `name`; a shared no-op while disabled"""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def timed(name):
+    """Decorator form of span()"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def observe(name, seconds):
+    """Adds one duration to the histogram `name`"""
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+
+def count(name, n=1):
+    """Adds n to the counter `name`"""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def gauge(name, value):
+    """Sets the gauge `name` to its current value, e.g. a queue depth"""
+    if not _enabled:
+        return
+    with _lock:
+        _gauges[name] = value
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _gauges.clear()
+
+
+def snapshot():
+    """Returns {'operations': {name: count, sum, p50, p95, max}, 'counters': {...}, 'gauges': {...}} in seconds"""
+    with _lock:
+        operations = {
+            name: {'count': h.count, 'sum': h.sum, 'p50': h.quantile(0.5), 'p95': h.quantile(0.95), 'max': h.max}
+            for name, h in sorted(_histograms.items())
+        }
+        return {'operations': operations, 'counters': dict(sorted(_counters.items())),
+                'gauges': dict(sorted(_gauges.items()))}
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def to_prometheus(prefix=PROMETHEUS_PREFIX):
+    """Renders every histogram and counter in the Prometheus text exposition format"""
+    lines = [
+        f"# HELP {prefix}_operation_seconds Duration of instrumented operations.",
+        f"# TYPE {prefix}_operation_seconds histogram"
+    ]
+    with _lock:
+        for name, h in sorted(_histograms.items()):
+            op = _label(name)
+            cumulative = 0
+            for bound, n in zip(BUCKETS, h.counts):
+                cumulative += n
+                lines.append(f'{prefix}_operation_seconds_bucket{{op="{op}",le="{bound:.6g}"}} {cumulative}')
+            lines.append(f'{prefix}_operation_seconds_bucket{{op="{op}",le="+Inf"}} {h.count}')
+            lines.append(f'{prefix}_operation_seconds_sum{{op="{op}"}} {h.sum:.9g}')
+            lines.append(f'{prefix}_operation_seconds_count{{op="{op}"}} {h.count}')
+        lines.append(f"# HELP {prefix}_events_total Instrumented event counters.")
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for name, value in sorted(_counters.items()):
+            lines.append(f'{prefix}_events_total{{name="{_label(name)}"}} {value}')
+        lines.append(f"# HELP {prefix}_gauge Current values such as queue depths.")
+        lines.append(f"# TYPE {prefix}_gauge gauge")
+        for name, value in sorted(_gauges.items()):
+            lines.append(f'{prefix}_gauge{{name="{_label(name)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def export(path):
+    """Writes a Prometheus textfile (*.prom) or a JSON snapshot (anything else), replacing it atomically"""
+    path = str(path)
+    text = to_prometheus() if path.endswith('.prom') else json.dumps(snapshot(), indent=2)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+    return path
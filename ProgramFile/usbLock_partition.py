@@ -0,0 +1,99 @@
+import uuid
+import zlib
+import struct
+from collections import namedtuple
+
+SECTOR_SIZE = 512
+MBR_SIGNATURE = b'\x55\xaa'
+GPT_SIGNATURE = b'EFI PART'
+PROTECTIVE_TYPE = 0xEE
+
+# Whole MBR in one unpack: disk signature, then the four entries' type/lba/sectors
+_MBR = struct.Struct('<440xI2x' + 'B3xB3xII' * 4 + '2s')
+_GPT_HEADER = struct.Struct('<8sIII4xQQQQ16sQIII')
+_GPT_ENTRY = struct.Struct('<16s16sQQQ72s')
+
+MBRPartition = namedtuple('MBRPartition', ['status', 'type', 'lba_start', 'sectors'])
+MBRInfo = namedtuple('MBRInfo', ['valid', 'signature', 'partitions', 'protective'])
+GPTHeader = namedtuple('GPTHeader', [
+    'revision', 'header_size', 'header_crc', 'crc_valid', 'current_lba', 'backup_lba',
+    'first_usable_lba', 'last_usable_lba', 'disk_guid', 'entries_lba', 'num_entries',
+    'entry_size', 'entries_crc'
+])
+GPTPartition = namedtuple('GPTPartition', ['type_guid', 'guid', 'first_lba', 'last_lba', 'attributes', 'name'])
+
+EMPTY_MBR = MBRInfo(False, None, (), False)
+
+
+def parse_mbr(data):
+    """Parses the MBR in the first 512 bytes of `data`; invalid sectors give EMPTY_MBR"""
+    if len(data) < SECTOR_SIZE:
+        return EMPTY_MBR
+    fields = _MBR.unpack_from(data)
+    if fields[-1] != MBR_SIGNATURE:
+        return EMPTY_MBR
+    signature = fields[0]
+    partitions = []
+    for i in range(4):
+        status, ptype, lba_start, sectors = fields[1 + i * 4:5 + i * 4]
+        if ptype and sectors:
+            partitions.append(MBRPartition(status, ptype, lba_start, sectors))
+    protective = any(p.type == PROTECTIVE_TYPE for p in partitions)
+    return MBRInfo(True, signature, tuple(partitions), protective)
+
+
+def parse_gpt_header(data, offset=0):
+    """Parses a GPT header at `offset` in `data`, checking its CRC; returns None if absent"""
+    if len(data) < offset + _GPT_HEADER.size:
+        return None
+    (signature, revision, header_size, header_crc, current_lba, backup_lba,
+     first_usable, last_usable, guid, entries_lba, num_entries, entry_size,
+     entries_crc) = _GPT_HEADER.unpack_from(data, offset)
+    if signature != GPT_SIGNATURE or header_size < 92 or len(data) < offset + header_size:
+        return None
+    # The CRC covers the header with its own CRC field zeroed
+    header = bytearray(data[offset:offset + header_size])
+    header[16:20] = b'\0\0\0\0'
+    crc_valid = zlib.crc32(header) == header_crc
+    return GPTHeader(
+        revision, header_size, header_crc, crc_valid, current_lba, backup_lba,
+        first_usable, last_usable, uuid.UUID(bytes_le=guid), entries_lba, num_entries,
+        entry_size, entries_crc
+    )
+
+
+def parse_gpt_entries(data, header, offset=0):
+    """Parses the partition entry array described by `header`; returns (entries, crc_valid)"""
+    size = header.num_entries * header.entry_size
+    array = data[offset:offset + size]
+    crc_valid = len(array) == size and zlib.crc32(array) == header.entries_crc
+    entries = []
+    for pos in range(0, len(array) - header.entry_size + 1, header.entry_size):
+        type_guid, guid, first, last, attributes, name = _GPT_ENTRY.unpack_from(array, pos)
+        if type_guid == b'\0' * 16:
+            continue
+        entries.append(GPTPartition(
+            uuid.UUID(bytes_le=type_guid), uuid.UUID(bytes_le=guid), first, last, attributes,
+            name.decode('utf-16-le', 'replace').rstrip('\0')
+        ))
+    return entries, crc_valid
+
+
+def disk_identity(data, sector_size=SECTOR_SIZE):
+    """Returns 'gpt:<disk guid>' or 'mbr:<signature>' from the start of a disk, or None"""
+    mbr = parse_mbr(data)
+    if not mbr.valid:
+        return None
+    if mbr.protective:
+        header = parse_gpt_header(data, sector_size)
+        if header is not None:
+            return f"gpt:{header.disk_guid}"
+    return f"mbr:{mbr.signature:08x}"
+
+
+def looks_like_boot_sector(sector):
+    """True if a sector carries a filesystem boot record (FAT, NTFS, exFAT)"""
+    if len(sector) < SECTOR_SIZE or sector[510:512] != MBR_SIGNATURE:
+        return False
+    return sector[3:11] in (b'NTFS    ', b'EXFAT   ', b'MSDOS5.0', b'mkfs.fat', b'MSWIN4.1') or \
+        sector[82:87] == b'FAT32' or sector[54:59] in (b'FAT12', b'FAT16')
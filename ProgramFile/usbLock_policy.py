@@ -0,0 +1,235 @@
+import os
+import time
+import logging
+import threading
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
+from usbLock_device import get_device_backend, drive_tag
+from usbLock_hotplug import HotplugEvent, HotplugWatcher
+from usbLock_audit import audit
+from usbLock_metrics import observe
+from usbLock_core import disable_usb_drive, is_drive_disabled
+
+# Drives checked and locked concurrently; a burst beyond this waits in the queue
+POLICY_WORKERS = 4
+ALLOW = 'allow'
+LOCK = 'lock'
+ARRIVALS = ('add', 'mount')
+REMOVALS = ('remove', 'unmount')
+
+# outcome is allowed, locked, already_locked or lock_failed; latency is seconds from
+# the arrival event to the decision being carried out
+Decision = namedtuple('Decision', ['drive', 'serial', 'verdict', 'outcome', 'latency', 'message'])
+
+
+class PolicyError(Exception):
+    """Raised when the policy file cannot be read at startup"""
+
+
+def normalize_serial(serial):
+    return (serial or '').strip().upper()
+
+
+def parse_policy(text):
+    """Returns (allowed, denied) frozensets from policy file text.
+
+    One entry per line: a bare serial or `allow <serial>` allows it,
+    `deny <serial>` always locks it. Blank lines and # comments are ignored.
+    """
+    allowed, denied = set(), set()
+    for line in text.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        word, _, rest = line.partition(' ')
+        if word.lower() == 'deny' and rest.strip():
+            denied.add(normalize_serial(rest))
+        elif word.lower() == 'allow' and rest.strip():
+            allowed.add(normalize_serial(rest))
+        else:
+            allowed.add(normalize_serial(line))
+    return frozenset(allowed), frozenset(denied)
+
+
+def verdict(serial, allowed, denied):
+    """Returns ALLOW if the serial is in `allowed` and not in `denied`, else LOCK"""
+    serial = normalize_serial(serial)
+    if serial and serial != 'UNKNOWN' and serial in allowed and serial not in denied:
+        return ALLOW
+    return LOCK
+
+
+class SerialPolicy:
+    """Allow/deny sets of disk serials, reloaded when the policy file changes.
+
+    Drives are locked unless their serial is allowed and not denied; a drive
+    without a readable serial is locked. A file that becomes unreadable
+    keeps the last good lists in force.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._stamp = None
+        self.allowed = frozenset()
+        self.denied = frozenset()
+        self.reloads = 0
+        try:
+            self._reload(os.stat(self.path))
+        except OSError as e:
+            raise PolicyError(f"Cannot read policy file {self.path}: {e}")
+
+    def _reload(self, st):
+        with open(self.path, encoding='utf-8') as f:
+            self.allowed, self.denied = parse_policy(f.read())
+        self._stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        self.reloads += 1
+        logging.info(f"Policy {self.path} loaded: {len(self.allowed)} allowed, {len(self.denied)} denied")
+
+    def refresh(self):
+        """Reloads the lists if the file changed since the last load; one stat() otherwise"""
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+                if (st.st_mtime_ns, st.st_size, st.st_ino) != self._stamp:
+                    self._reload(st)
+            except OSError as e:
+                logging.warning(f"Policy file {self.path} unreadable, keeping the previous lists: {e}")
+
+    def check(self, serial):
+        """Returns ALLOW or LOCK for a disk serial"""
+        self.refresh()
+        return verdict(serial, self.allowed, self.denied)
+
+
+class PolicyDaemon:
+    """Locks drives the policy does not allow as soon as they arrive.
+
+    Arrival events are resolved to physical drives on a bounded worker pool.
+    Each device name is queued at most once at a time and each physical
+    drive is decided once while attached, so the several add/mount events a
+    stick produces, or a hub full of sticks, cause no duplicate work.
+    Locking is the regular backup-then-disable_usb_drive() path.
+    """
+
+    def __init__(self, policy, devices=None, workers=POLICY_WORKERS, watcher=None, on_decision=None, verify=True):
+        self.policy = policy
+        self.devices = devices or get_device_backend()
+        self.watcher = watcher
+        self.on_decision = on_decision
+        self.verify = verify
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='usblock-policy')
+        self._lock = threading.Lock()
+        self._queued = set()
+        self._device_disk = {}
+        self._decided = {}
+        self.decisions = deque(maxlen=1024)
+        # Seconds from arrival to lock for every drive locked, most recent last
+        self.latencies = deque(maxlen=1024)
+
+    def start(self, sweep=False):
+        """Starts watching for arrivals; with sweep, also checks drives already attached"""
+        if self.watcher is None:
+            self.watcher = HotplugWatcher()
+        self.watcher.subscribe(self.on_event)
+        self.watcher.start()
+        if sweep:
+            now = time.monotonic()
+            for drive in self.devices.physical_drives():
+                # Keyed by the name its removal event will carry, so pulling it clears the decision
+                name = self.devices.hotplug_name(drive['index'])
+                self._submit(name, HotplugEvent('add', name, now), drive['index'])
+        return self
+
+    def stop(self):
+        if self.watcher is not None:
+            self.watcher.unsubscribe(self.on_event)
+            self.watcher.stop()
+        self._pool.shutdown(wait=True)
+
+    def on_event(self, event):
+        """HotplugWatcher subscriber; returns immediately"""
+        if event.action in ARRIVALS:
+            self._submit(event.device, event)
+        elif event.action in REMOVALS:
+            with self._lock:
+                disk = self._device_disk.pop(event.device, None)
+                if disk is not None:
+                    # Forget the drive's other devices too, and decide again if it comes back
+                    for key in [k for k, d in self._device_disk.items() if d == disk]:
+                        del self._device_disk[key]
+                    self._decided.pop(disk, None)
+
+    def _submit(self, key, event, target=None):
+        with self._lock:
+            if key in self._queued or key in self._device_disk:
+                return
+            self._queued.add(key)
+        self._pool.submit(self._handle, key, event, target)
+
+    def _handle(self, key, event, target):
+        try:
+            if target is None:
+                target = self.devices.disk_for_device(event.device)
+                if target is None:
+                    return
+            disk = drive_tag(target)
+            with self._lock:
+                self._device_disk[key] = disk
+                if disk in self._decided:
+                    return
+                self._decided[disk] = None
+            try:
+                decision = self._decide(target, event)
+            except Exception:
+                with self._lock:
+                    self._decided.pop(disk, None)
+                raise
+            with self._lock:
+                self._decided[disk] = decision
+            self.decisions.append(decision)
+            if self.on_decision:
+                self.on_decision(decision)
+        except Exception as e:
+            logging.error(f"Policy check of {event.device} failed: {e}")
+        finally:
+            with self._lock:
+                self._queued.discard(key)
+
+    def _decide(self, drive, event):
+        try:
+            serial = self.devices.serial(drive)
+        except Exception as e:
+            logging.warning(f"Could not read serial of drive {drive}: {e}")
+            serial = None
+        verdict = self.policy.check(serial)
+        message = None
+        if verdict == ALLOW:
+            outcome = 'allowed'
+        elif is_drive_disabled(drive, self.devices):
+            outcome = 'already_locked'
+        else:
+            success, message = disable_usb_drive(drive, self.devices, self.verify, serial)
+            outcome = 'locked' if success else 'lock_failed'
+        latency = time.monotonic() - event.timestamp
+        if outcome == 'locked':
+            self.latencies.append(latency)
+            observe('policy.lock_latency', latency)
+            logging.info(f"Policy locked drive {drive} ({serial}) {latency * 1000:.0f} ms after insertion")
+        else:
+            logging.info(f"Policy {outcome} drive {drive} ({serial})")
+        audit('policy', drive=drive_tag(drive), serial=serial, verdict=verdict, outcome=outcome,
+              latency_ms=round(latency * 1000, 3))
+        return Decision(drive, serial, verdict, outcome, latency, message)
+
+    def stats(self):
+        """Counts per outcome and insertion-to-lock latency percentiles in milliseconds"""
+        counts = {}
+        for decision in list(self.decisions):
+            counts[decision.outcome] = counts.get(decision.outcome, 0) + 1
+        latencies = sorted(self.latencies)
+        if latencies:
+            for name, q in (('p50_ms', 0.5), ('p95_ms', 0.95)):
+                counts[name] = round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 3)
+            counts['max_ms'] = round(latencies[-1] * 1000, 3)
+        return counts
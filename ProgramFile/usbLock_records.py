@@ -0,0 +1,161 @@
+import os
+import time
+from usbLock_enum import format_size
+
+
+class cached:
+    """A display string computed on first use and kept in the record's `_<name>` slot"""
+
+    def __init__(self, func):
+        self.func = func
+        self.slot = f"_{func.__name__}"
+        self.__doc__ = func.__doc__
+
+    def __get__(self, record, owner):
+        if record is None:
+            return self
+        try:
+            return getattr(record, self.slot)
+        except AttributeError:
+            value = self.func(record)
+            object.__setattr__(record, self.slot, value)
+            return value
+
+
+class Record:
+    """Base for immutable records with __slots__ and a precomputed hash.
+
+    Subclasses list their fields in `_fields` (optional ones in `_defaults`)
+    and put those, plus a `_<name>` slot per @cached display string, in
+    __slots__. Records compare equal when their type and every field match;
+    the hash is computed once, so unequal records are told apart in one
+    comparison and records can be diffed through sets and dicts.
+    `identity` is the part that stays the same while the object changes.
+    Like the namedtuples they replace, they offer _fields, _asdict() and _replace().
+    """
+    __slots__ = ('_hash',)
+    _fields = ()
+    _defaults = {}
+
+    def __init__(self, *args, **kwargs):
+        if len(args) > len(self._fields):
+            raise TypeError(f"{type(self).__name__} takes {len(self._fields)} fields, got {len(args)}")
+        values = dict(zip(self._fields, args))
+        for name, value in kwargs.items():
+            if name not in self._fields or name in values:
+                raise TypeError(f"{type(self).__name__} got an unexpected or repeated field {name!r}")
+            values[name] = value
+        for name in self._fields:
+            if name in values:
+                value = values[name]
+            elif name in self._defaults:
+                value = self._defaults[name]
+            else:
+                raise TypeError(f"{type(self).__name__} is missing field {name!r}")
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, '_hash', hash((type(self).__name__,) + self._values()))
+
+    @classmethod
+    def from_dict(cls, item):
+        """Builds a record from a loader's dict; keys that are not fields are ignored"""
+        if isinstance(item, cls):
+            return item
+        return cls(**{name: item[name] for name in cls._fields if name in item})
+
+    def _values(self):
+        return tuple(getattr(self, name) for name in self._fields)
+
+    def _asdict(self):
+        return dict(zip(self._fields, self._values()))
+
+    def _replace(self, **changes):
+        return type(self)(**dict(self._asdict(), **changes))
+
+    @property
+    def identity(self):
+        raise NotImplementedError
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self is other or (self._hash == other._hash and self._values() == other._values())
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return type(self), self._values()
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self._fields)
+        return f"{type(self).__name__}({fields})"
+
+
+class VolumeRecord(Record):
+    """A mounted volume on a removable drive; size_bytes is None when it could not be read"""
+    _fields = ('device', 'mountpoint', 'fstype', 'size_bytes', 'label')
+    _defaults = {'fstype': '', 'size_bytes': None, 'label': None}
+    __slots__ = _fields + ('_size',)
+
+    @property
+    def identity(self):
+        return self.device
+
+    @cached
+    def size(self):
+        """The size as the drive list shows it, e.g. '14.32 GB'"""
+        return format_size(self.size_bytes)
+
+
+class PhysicalDriveRecord(Record):
+    """A removable disk. signature is its partition table's 'gpt:<guid>' or 'mbr:<id>', if read.
+
+    The identity is the serial plus the signature, so two sticks reporting
+    the same serial (or none) are still told apart, and a disk keeps its
+    identity when the system renumbers it.
+    """
+    _fields = ('index', 'serial', 'signature')
+    _defaults = {'signature': None}
+    __slots__ = _fields + ('_title',)
+
+    @property
+    def identity(self):
+        if self.has_serial or self.signature:
+            return self.serial if self.has_serial else None, self.signature
+        return None, None, self.index
+
+    @property
+    def has_serial(self):
+        return bool(self.serial) and self.serial != "Unknown"
+
+    @cached
+    def title(self):
+        return f"Physical Drive {self.index}"
+
+
+class BackupEntry(Record):
+    """A catalogued backup: disk_size and size (of the backed-up sector) are bytes, created is epoch seconds"""
+    _fields = ('id', 'path', 'drive', 'serial', 'disk_size', 'disk_id', 'sha256', 'size', 'created')
+    __slots__ = _fields + ('_name', '_created_text')
+
+    @property
+    def identity(self):
+        return self.id
+
+    @cached
+    def name(self):
+        return os.path.basename(self.path)
+
+    @cached
+    def created_text(self):
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.created)) if self.created else ''
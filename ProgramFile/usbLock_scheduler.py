@@ -0,0 +1,207 @@
+import time
+import bisect
+import itertools
+import functools
+import threading
+import logging
+from collections import namedtuple
+from contextlib import contextmanager
+from usbLock_device import drive_tag
+from usbLock_topology import get_default_bus_source
+from usbLock_metrics import observe, gauge, count
+from usbLock_audit import annotate
+
+# Operations in flight at once behind one hub, and behind one host controller
+HUB_SLOTS = 2
+CONTROLLER_SLOTS = 4
+# Priorities: partition table reads and writes go ahead of imaging and wipe jobs
+METADATA = 0
+BULK = 1
+PRIORITY_NAMES = {METADATA: 'metadata', BULK: 'bulk'}
+
+Placement = namedtuple('Placement', ['hub', 'controller'])
+
+
+def _add(counts, key, n):
+    value = counts.get(key, 0) + n
+    if value:
+        counts[key] = value
+    else:
+        del counts[key]
+
+
+class _Ticket:
+    __slots__ = ('key', 'priority', 'placement', 'queued', 'granted')
+
+    def __init__(self, key, priority, placement):
+        self.key = key
+        self.priority = priority
+        self.placement = placement
+        self.queued = time.perf_counter()
+        self.granted = False
+
+
+class IOScheduler:
+    """Admits disk operations by where the drives sit on the USB bus.
+
+    At most `hub_slots` operations run behind one hub and `controller_slots`
+    behind one host controller, so sticks sharing a hub do not fight over
+    its bandwidth and one slow stick only holds up its own hub. Bulk jobs
+    (imaging, wiping) may fill all but one of the slots of a hub or
+    controller, which stays free for metadata work; queued metadata
+    operations are admitted first. Both limits must therefore be at least 2.
+    Drives whose place on the bus is unknown count as their own hub.
+    """
+
+    def __init__(self, source=None, hub_slots=HUB_SLOTS, controller_slots=CONTROLLER_SLOTS):
+        if hub_slots < 2 or controller_slots < 2:
+            # With one slot there is nothing to keep free for metadata while a bulk job runs
+            raise ValueError(f"hub_slots and controller_slots must be at least 2, "
+                             f"got {hub_slots} and {controller_slots}")
+        self.source = source or get_default_bus_source()
+        self.hub_slots = hub_slots
+        self.controller_slots = controller_slots
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting = []
+        self._hub = {}
+        self._controller = {}
+        self._bulk_hub = {}
+        self._bulk_controller = {}
+        self._held = threading.local()
+
+    def placement(self, drive_number):
+        """Returns the (hub, controller) keys the drive's operations are counted against"""
+        tag = drive_tag(drive_number)
+        try:
+            path = self.source.bus_path(tag)
+        except OSError as e:
+            logging.warning(f"Could not read the bus path of drive {drive_number}: {e}")
+            path = None
+        if path is None:
+            return Placement(('disk', tag), ('disk', tag))
+        return Placement((path.controller,) + path.ports[:-1], path.controller)
+
+    def _admit(self):
+        """Grants waiting tickets in priority order while their hub and controller have room"""
+        for _, _, ticket in list(self._waiting):
+            hub, controller = ticket.placement
+            if self._hub.get(hub, 0) >= self.hub_slots or self._controller.get(controller, 0) >= self.controller_slots:
+                continue
+            if ticket.priority == BULK and (self._bulk_hub.get(hub, 0) >= self.hub_slots - 1 or
+                                            self._bulk_controller.get(controller, 0) >= self.controller_slots - 1):
+                continue
+            _add(self._hub, hub, 1)
+            _add(self._controller, controller, 1)
+            if ticket.priority == BULK:
+                _add(self._bulk_hub, hub, 1)
+                _add(self._bulk_controller, controller, 1)
+            ticket.granted = True
+            self._waiting.remove((ticket.priority, ticket.key, ticket))
+        gauge('sched.queue_depth', len(self._waiting))
+        gauge('sched.in_flight', sum(self._hub.values()))
+
+    def _free(self, ticket):
+        """Returns a granted ticket's slots and admits whoever can use them; called under the lock"""
+        hub, controller = ticket.placement
+        _add(self._hub, hub, -1)
+        _add(self._controller, controller, -1)
+        if ticket.priority == BULK:
+            _add(self._bulk_hub, hub, -1)
+            _add(self._bulk_controller, controller, -1)
+        self._admit()
+        self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, drive_number, priority=METADATA):
+        """Holds one of the drive's hub slots for the duration of the block.
+
+        Re-entrant per thread and drive, so an operation that calls another
+        one on the same drive (disable -> backup) does not queue behind itself.
+        """
+        tag = drive_tag(drive_number)
+        held = getattr(self._held, 'drives', None)
+        if held is None:
+            held = self._held.drives = set()
+        if tag in held:
+            yield
+            return
+        ticket = _Ticket(next(self._seq), priority, self.placement(drive_number))
+        with self._cond:
+            bisect.insort(self._waiting, (priority, ticket.key, ticket))
+            count(f"sched.queued.{PRIORITY_NAMES[priority]}")
+            self._admit()
+            try:
+                while not ticket.granted:
+                    self._cond.wait()
+            except BaseException:
+                # Interrupted while queued: give the place or the slot back
+                if ticket.granted:
+                    self._free(ticket)
+                else:
+                    self._waiting.remove((priority, ticket.key, ticket))
+                raise
+        waited = time.perf_counter() - ticket.queued
+        observe(f"sched.wait.{PRIORITY_NAMES[priority]}", waited)
+        if waited >= 0.001:
+            annotate(queued_ms=round(waited * 1000, 3))
+            logging.info(f"Drive {drive_number} waited {waited * 1000:.0f} ms for hub {'/'.join(ticket.placement.hub)}")
+        held.add(tag)
+        try:
+            yield
+        finally:
+            held.discard(tag)
+            with self._cond:
+                self._free(ticket)
+
+    def interleave(self, items, key=lambda item: item):
+        """Reorders items (e.g. batch jobs by drive number) round-robin across hubs.
+
+        A worker pool working down the result reaches every hub early instead
+        of filling all its workers with drives queued behind the same one.
+        """
+        groups = {}
+        for item in items:
+            groups.setdefault(self.placement(key(item)).hub, []).append(item)
+        return [item for row in itertools.zip_longest(*groups.values()) for item in row if item is not None]
+
+    def stats(self):
+        """Returns queued and in-flight operation counts, overall and per hub"""
+        with self._cond:
+            hubs = {}
+            for hub, n in self._hub.items():
+                hubs.setdefault('/'.join(hub), {'in_flight': 0, 'queued': 0})['in_flight'] = n
+            for _, _, ticket in self._waiting:
+                hubs.setdefault('/'.join(ticket.placement.hub), {'in_flight': 0, 'queued': 0})['queued'] += 1
+            return {'queued': len(self._waiting), 'in_flight': sum(self._hub.values()), 'hubs': hubs}
+
+
+def scheduled(priority):
+    """Decorator running func(drive_number, ...) in a slot of the process-wide scheduler"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(drive_number, *args, **kwargs):
+            with get_scheduler().slot(drive_number, priority):
+                return func(drive_number, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Returns the process-wide I/O scheduler"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = IOScheduler()
+        return _scheduler
+
+
+def set_scheduler(scheduler):
+    """Replaces the process-wide I/O scheduler, e.g. one over a FakeBusSource"""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
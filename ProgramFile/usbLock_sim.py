@@ -0,0 +1,189 @@
+import os
+import time
+import uuid
+import zlib
+import struct
+from pathlib import Path
+from usbLock_device import ImageDevices, get_device_backend, set_device_backend
+from usbLock_enum import FakeBackend, make_drive
+from usbLock_metadata import GPT_ENTRIES_BYTES
+from usbLock_topology import (
+    BusPath, DiskLocation, FakeBusSource, FakeTopologySource, TopologyIndex, get_topology, set_topology
+)
+from usbLock_scheduler import IOScheduler, get_scheduler, set_scheduler
+
+LAYOUTS = ('mbr', 'gpt')
+SIM_DISK_SIZE = 64 * 1024 * 1024
+# Drives per simulated hub, and hubs per simulated host controller
+SIM_HUB_PORTS = 4
+SIM_CONTROLLER_HUBS = 4
+
+
+def gpt_header(logical, current, backup, last_usable, disk_guid, entries_lba, entries_crc):
+    header = bytearray(struct.pack(
+        '<8sIII4xQQQQ16sQIII', b'EFI PART', 0x10000, 92, 0, current, backup,
+        GPT_ENTRIES_BYTES // logical + 2, last_usable, disk_guid, entries_lba, 128, 128, entries_crc
+    ))
+    struct.pack_into('<I', header, 16, zlib.crc32(header))
+    return bytes(header) + bytes(logical - len(header))
+
+
+def make_gpt_image(path, size, logical=512):
+    """Writes a sparse image with a protective MBR, primary and backup GPT and one partition"""
+    last_lba = size // logical - 1
+    entry_lbas = GPT_ENTRIES_BYTES // logical
+    entries = bytearray(GPT_ENTRIES_BYTES)
+    struct.pack_into(
+        '<16s16sQQQ', entries, 0, uuid.UUID('EBD0A0A2-B9E5-4433-87C0-68B6B72699C7').bytes_le,
+        uuid.uuid4().bytes_le, 2048, last_lba - entry_lbas - 1, 0
+    )
+    entries_crc = zlib.crc32(entries)
+    disk_guid = uuid.uuid4().bytes_le
+
+    mbr = bytearray(logical)
+    struct.pack_into('<B3xB3xII', mbr, 446, 0, 0xEE, 1, min(last_lba, 0xFFFFFFFF))
+    mbr[510:512] = b'\x55\xaa'
+    with open(path, 'wb') as disk:
+        disk.truncate(size)
+        disk.write(mbr)
+        disk.write(gpt_header(logical, 1, last_lba, last_lba - entry_lbas - 1, disk_guid, 2, entries_crc))
+        disk.write(entries)
+        disk.seek((last_lba - entry_lbas) * logical)
+        disk.write(entries)
+        disk.write(gpt_header(logical, last_lba, 1, last_lba - entry_lbas - 1, disk_guid,
+                              last_lba - entry_lbas, entries_crc))
+
+
+def make_mbr_image(path, size, logical=512):
+    """Writes a sparse image with an MBR holding one FAT32 partition from 1 MiB to the end"""
+    start = 1024 * 1024 // logical
+    mbr = bytearray(logical)
+    struct.pack_into('<I', mbr, 440, zlib.crc32(os.fsencode(path)))
+    struct.pack_into('<B3xB3xII', mbr, 446, 0x80, 0x0C, start, min(size // logical - start, 0xFFFFFFFF))
+    mbr[510:512] = b'\x55\xaa'
+    with open(path, 'wb') as disk:
+        disk.truncate(size)
+        disk.write(mbr)
+
+
+class SimulatedDevices(ImageDevices):
+    """ImageDevices whose physical drive listing costs `query_latency` seconds, like a wmic call"""
+    name = 'simulated'
+
+    def __init__(self, directory, query_latency=0.0):
+        super().__init__(directory)
+        self.query_latency = query_latency
+
+    def physical_drives(self):
+        if self.query_latency:
+            time.sleep(self.query_latency)
+        return super().physical_drives()
+
+
+class SimulatedFleet:
+    """N removable disks backed by sparse image files, seen the same way by every backend.
+
+    Disk i is drive<i>.img with serial SIM<i>, alternating through `layouts`,
+    and is "mounted" at /media/sim<i>. Consecutive disks share a hub of
+    `hub_ports` ports and consecutive hubs a controller. Volumes whose index is below
+    `unresolved` come back from the bulk query without label and size, so
+    each costs one probe of `probe_latency` seconds.
+    """
+
+    def __init__(self, directory, count, size=SIM_DISK_SIZE, layouts=LAYOUTS, logical=512, physical=None,
+                 probe_latency=0.0, unresolved=0, query_latency=0.0, hub_ports=SIM_HUB_PORTS,
+                 controller_hubs=SIM_CONTROLLER_HUBS):
+        self.directory = Path(directory)
+        self.count = count
+        self.size = size
+        self.layouts = tuple(layouts)
+        self.logical = logical
+        self.physical = physical or logical
+        self.probe_latency = probe_latency
+        self.unresolved = unresolved
+        self.hub_ports = hub_ports
+        self.controller_hubs = controller_hubs
+        self.devices = SimulatedDevices(self.directory, query_latency)
+        self._saved = None
+
+    def serial(self, index):
+        return f"SIM{index:05d}"
+
+    def mountpoint(self, index):
+        return f"/media/sim{index}"
+
+    def layout(self, index):
+        return self.layouts[index % len(self.layouts)]
+
+    def bus_path(self, index):
+        hub, port = divmod(index, self.hub_ports)
+        controller, hub = divmod(hub, self.controller_hubs)
+        bus = controller + 1
+        return BusPath(f"sim-xhci{controller}", (f"usb{bus}", f"{bus}-{hub + 1}", f"{bus}-{hub + 1}.{port + 1}"))
+
+    def create(self):
+        """Writes every image with its serial and sector size files; returns self"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for i in range(self.count):
+            path = self.devices.path(i)
+            if self.layout(i) == 'gpt':
+                make_gpt_image(path, self.size, self.logical)
+            else:
+                make_mbr_image(path, self.size, self.logical)
+            (self.directory / f"drive{i}.serial").write_text(self.serial(i))
+            if (self.logical, self.physical) != (512, 512):
+                (self.directory / f"drive{i}.sectors").write_text(f"{self.logical} {self.physical}")
+        return self
+
+    def enum_backend(self):
+        """A FakeBackend listing one volume per disk"""
+        drives = [
+            make_drive(f"/dev/sim{i}1", self.mountpoint(i), 'vfat' if self.layout(i) == 'mbr' else 'exfat',
+                       self.size, f"SIM{i}")
+            for i in range(self.count)
+        ]
+        unresolved = [drive['device'] for drive in drives[:self.unresolved]]
+        return FakeBackend(drives, self.probe_latency, unresolved)
+
+    def topology_source(self):
+        return FakeTopologySource(
+            DiskLocation(self.mountpoint(i), 1, i, self.serial(i)) for i in range(self.count)
+        )
+
+    def bus_source(self):
+        return FakeBusSource((str(i), self.bus_path(i)) for i in range(self.count))
+
+    def install(self, **scheduler):
+        """Makes the fleet the process-wide device backend, topology and bus; returns self.
+
+        Keyword arguments go to the IOScheduler (hub_slots, controller_slots).
+        """
+        self._saved = (get_device_backend(), get_topology(), get_scheduler())
+        set_device_backend(self.devices)
+        set_topology(TopologyIndex(self.topology_source()))
+        set_scheduler(IOScheduler(self.bus_source(), **scheduler))
+        return self
+
+    def uninstall(self):
+        if self._saved is not None:
+            devices, topology, scheduler = self._saved
+            set_device_backend(devices)
+            set_topology(topology)
+            set_scheduler(scheduler)
+            self._saved = None
+
+    def __enter__(self):
+        # `with fleet.install(hub_slots=2):` is already installed
+        return self if self._saved is not None else self.install()
+
+    def __exit__(self, *exc):
+        self.uninstall()
+
+    def remove(self):
+        """Deletes the images and their side files"""
+        for i in range(self.count):
+            for suffix in ('.img', '.serial', '.sectors'):
+                try:
+                    os.remove(self.directory / f"drive{i}{suffix}")
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import zlib
+import hashlib
+import tempfile
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+OBJECTS_DIR = "objects"
+REF_SUFFIX = ".ref"
+# Captures at least this large are stored zlib-compressed when that makes them smaller
+COMPRESS_THRESHOLD = 4096
+# Blobs younger than this are never collected, so a backup in progress is safe from gc
+GC_GRACE = 3600
+SCRUB_WORKERS = 8
+
+_RAW = b'\x00'
+_ZLIB = b'\x01'
+
+ScrubResult = namedtuple('ScrubResult', ['checked', 'corrupt'])
+
+
+class StoreError(Exception):
+    """Raised when a backup reference or blob cannot be resolved"""
+
+
+def _sync_dir(path):
+    """Makes directory entries durable; Windows has no directory handles to fsync"""
+    if os.name == 'nt':
+        return
+    fd = os.open(str(path), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def is_reference(path):
+    return str(path).endswith(REF_SUFFIX)
+
+
+class BackupStore:
+    """Content-addressed blob store with small per-backup reference files.
+
+    Blobs live in <dir>/objects/ab/<sha256> and are named by the hash of
+    their uncompressed content, so identical captures are stored once.
+    """
+
+    def __init__(self, backup_dir):
+        self.backup_dir = Path(backup_dir)
+        self.objects = self.backup_dir / OBJECTS_DIR
+
+    def blob_path(self, digest):
+        return self.objects / digest[:2] / digest
+
+    def _write_atomic(self, path, data):
+        """Writes a file that, once this returns, survives a power loss whole.
+
+        The journal points at blobs and references written here, so recovery
+        needs them on disk before the journaled write starts.
+        """
+        created = []
+        parent = path.parent
+        while not parent.exists():
+            created.append(parent)
+            parent = parent.parent
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        # The rename, and the entries of any directories made for it
+        for directory in [path.parent] + [d.parent for d in created]:
+            _sync_dir(directory)
+
+    def put(self, data):
+        """Stores data if not already present and returns its sha256"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        if path.exists():
+            # Refresh the mtime so gc's grace period covers the new reference
+            os.utime(path)
+            return digest
+        payload = _RAW + data
+        if len(data) >= COMPRESS_THRESHOLD:
+            compressed = zlib.compress(data, 6)
+            if len(compressed) < len(data):
+                payload = _ZLIB + compressed
+        self._write_atomic(path, payload)
+        return digest
+
+    def get(self, digest):
+        """Returns the content of a blob, verifying its hash"""
+        try:
+            with open(self.blob_path(digest), "rb") as f:
+                payload = f.read()
+        except OSError as e:
+            raise StoreError(f"Blob {digest} is missing: {e}")
+        data = self._decode(payload, digest)
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise StoreError(f"Blob {digest} is corrupt")
+        return data
+
+    def _decode(self, payload, digest):
+        kind, body = payload[:1], payload[1:]
+        if kind == _RAW:
+            return body
+        if kind == _ZLIB:
+            try:
+                return zlib.decompress(body)
+            except zlib.error as e:
+                raise StoreError(f"Blob {digest} is corrupt: {e}")
+        raise StoreError(f"Blob {digest} has an unknown encoding")
+
+    def write_reference(self, name, data, **meta):
+        """Stores data and writes a reference file <dir>/<name>.ref; returns its path"""
+        digest = self.put(data)
+        ref = dict(meta, sha256=digest, size=len(data))
+        path = self.backup_dir / f"{name}{REF_SUFFIX}"
+        # Two backups of one drive within the same second must not replace each other
+        counter = 1
+        while path.exists():
+            path = self.backup_dir / f"{name}-{counter}{REF_SUFFIX}"
+            counter += 1
+        self._write_atomic(path, json.dumps(ref, sort_keys=True).encode())
+        return path
+
+    def read_reference(self, path):
+        try:
+            with open(path, "rb") as f:
+                ref = json.loads(f.read())
+        except (OSError, ValueError) as e:
+            raise StoreError(f"Backup reference {path} is unreadable: {e}")
+        if 'sha256' not in ref:
+            raise StoreError(f"Backup reference {path} has no content hash")
+        return ref
+
+    def references(self):
+        """Yields (path, reference dict) for every reference file"""
+        if not self.backup_dir.is_dir():
+            return
+        for entry in os.scandir(self.backup_dir):
+            if entry.name.endswith(REF_SUFFIX) and entry.is_file():
+                try:
+                    yield entry.path, self.read_reference(entry.path)
+                except StoreError as e:
+                    logging.warning(str(e))
+
+    def blobs(self):
+        """Yields (digest, path) for every blob in the store"""
+        if not self.objects.is_dir():
+            return
+        for bucket in os.scandir(self.objects):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if not entry.name.startswith('.tmp-'):
+                    yield entry.name, entry.path
+
+    def gc(self, extra_refs=(), grace=GC_GRACE, now=None):
+        """Deletes blobs no reference points to; returns the number removed"""
+        referenced = {ref['sha256'] for _, ref in self.references()}
+        referenced.update(extra_refs)
+        now = time.time() if now is None else now
+        removed = 0
+        for digest, path in list(self.blobs()):
+            if digest in referenced:
+                continue
+            try:
+                if now - os.stat(path).st_mtime < grace:
+                    continue
+                os.remove(path)
+                removed += 1
+            except OSError as e:
+                logging.warning(f"Could not collect blob {digest}: {e}")
+        if removed:
+            logging.info(f"Backup store gc removed {removed} unreferenced blob(s)")
+        return removed
+
+    def _check(self, item):
+        digest, path = item
+        try:
+            with open(path, "rb") as f:
+                data = self._decode(f.read(), digest)
+            return hashlib.sha256(data).hexdigest() == digest
+        except (OSError, StoreError):
+            return False
+
+    def scrub(self, workers=SCRUB_WORKERS):
+        """Re-hashes every blob in parallel; returns ScrubResult with the corrupt digests"""
+        items = list(self.blobs())
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            ok = list(executor.map(self._check, items))
+        corrupt = [digest for (digest, _), good in zip(items, ok) if not good]
+        for digest in corrupt:
+            logging.error(f"Backup store scrub: blob {digest} failed verification")
+        return ScrubResult(len(items), corrupt)
+
+
+def load_backup(path):
+    """Returns (captured bytes, reference dict) for a .ref file; legacy .bin files give an empty dict"""
+    path = Path(path)
+    if is_reference(path):
+        store = BackupStore(path.parent)
+        ref = store.read_reference(path)
+        return store.get(ref['sha256']), ref
+    with open(path, "rb") as f:
+        return f.read(), {}
+
+
+def read_backup(path):
+    """Returns the captured bytes for a backup, given its .ref file or a legacy .bin file"""
+    return load_backup(path)[0]
@@ -0,0 +1,351 @@
+import os
+import re
+import sys
+import subprocess
+import threading
+import logging
+from collections import namedtuple
+from usbLock_metrics import span
+
+# disk is the PhysicalDrive number on Windows and the parent device path (/dev/sdb) on Linux
+DiskLocation = namedtuple('DiskLocation', ['mountpoint', 'partition', 'disk', 'serial'])
+# Where a disk hangs off the bus: the host controller, then every hub down to the disk's own USB port
+BusPath = namedtuple('BusPath', ['controller', 'ports'])
+
+
+class TopologyError(LookupError):
+    """Raised when a mountpoint cannot be mapped to a physical disk"""
+
+
+def normalize_mountpoint(mountpoint):
+    """Returns the key used to index a drive letter or mountpoint"""
+    if re.match(r'^[A-Za-z]:', mountpoint):
+        return mountpoint[:2].upper()
+    return os.path.normpath(mountpoint)
+
+
+class TopologySource:
+    """Base class for topology sources.
+
+    build() returns every DiskLocation in one pass; signature() returns a
+    cheap value that changes whenever the set of devices changes.
+    """
+    name = 'base'
+
+    def build(self):
+        raise NotImplementedError
+
+    def signature(self):
+        raise NotImplementedError
+
+
+_PARTITION_LINK = re.compile(r'Disk #(\d+), Partition #(\d+).*?DeviceID="([A-Za-z]:)"')
+
+
+def parse_logical_disk_to_partition(output):
+    """Parses Win32_LogicalDiskToPartition output into (letter, disk, partition)"""
+    links = []
+    for line in output.splitlines():
+        match = _PARTITION_LINK.search(line)
+        if match:
+            links.append((match.group(3).upper(), int(match.group(1)), int(match.group(2))))
+    return links
+
+
+def parse_diskdrive_serials(output):
+    """Parses `wmic diskdrive get Index,SerialNumber /format:csv` into {index: serial}"""
+    serials = {}
+    header = None
+    for line in output.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        fields = line.split(',')
+        if header is None:
+            header = fields
+            continue
+        row = dict(zip(header, fields))
+        index = row.get('Index', '')
+        if index.isdigit():
+            serials[int(index)] = row.get('SerialNumber', '').strip() or "Unknown"
+    return serials
+
+
+class WindowsTopologySource(TopologySource):
+    """Two wmic queries for the whole machine, however many drives are attached"""
+    name = 'windows'
+
+    def _wmic(self, query):
+        with span('subprocess.wmic_topology'):
+            result = subprocess.run(query, capture_output=True, text=True, shell=True)
+        if result.returncode != 0:
+            raise TopologyError(f"wmic failed: {result.stderr.strip()}")
+        return result.stdout
+
+    def build(self):
+        links = parse_logical_disk_to_partition(
+            self._wmic('wmic path Win32_LogicalDiskToPartition get Antecedent,Dependent')
+        )
+        serials = parse_diskdrive_serials(
+            self._wmic('wmic diskdrive get Index,SerialNumber /format:csv')
+        )
+        return [
+            DiskLocation(f"{letter}\\", partition, disk, serials.get(disk, "Unknown"))
+            for letter, disk, partition in links
+        ]
+
+    def signature(self):
+        """The drive letter bitmask plus each local letter's volume serial number.
+
+        The bitmask alone misses one stick being swapped for another on the
+        same letter; the volume serial changes with the filesystem. No
+        subprocess is started, so this stays cheap enough to call per lookup.
+        """
+        import ctypes
+        from ctypes import wintypes
+        kernel32 = ctypes.windll.kernel32
+        mask = kernel32.GetLogicalDrives()
+        volumes = []
+        for bit in range(26):
+            if not mask & (1 << bit):
+                continue
+            root = f"{chr(ord('A') + bit)}:\\"
+            # DRIVE_REMOVABLE and DRIVE_FIXED (USB disks often report as fixed); skip network and optical
+            if kernel32.GetDriveTypeW(root) not in (2, 3):
+                continue
+            serial = wintypes.DWORD()
+            if kernel32.GetVolumeInformationW(root, None, 0, ctypes.byref(serial), None, None, None, 0):
+                volumes.append((root[0], serial.value))
+            else:
+                volumes.append((root[0], None))
+        return mask, tuple(volumes)
+
+
+class LinuxTopologySource(TopologySource):
+    """Resolves /dev/sdXN to its parent disk through sysfs"""
+    name = 'linux'
+
+    def __init__(self, root='/'):
+        self.root = root
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def disk_serial(self, disk):
+        dev = self._read(self._path('sys', 'class', 'block', disk, 'dev'))
+        if dev:
+            text = self._read(self._path('run', 'udev', 'data', f"b{dev}")) or ''
+            for line in text.splitlines():
+                if line.startswith('E:ID_SERIAL_SHORT='):
+                    return line.split('=', 1)[1]
+        # Walk up from the block device to the USB device that carries the serial
+        path = os.path.realpath(self._path('sys', 'class', 'block', disk))
+        sys_root = self._path('sys')
+        while path.startswith(sys_root) and path != sys_root:
+            serial = self._read(os.path.join(path, 'serial'))
+            if serial:
+                return serial
+            path = os.path.dirname(path)
+        return "Unknown"
+
+    def resolve(self, name):
+        """Returns (parent disk name, partition number) for a block device name"""
+        block = self._path('sys', 'class', 'block', name)
+        partition = self._read(os.path.join(block, 'partition'))
+        if partition is None:
+            if not os.path.exists(block):
+                raise TopologyError(f"/dev/{name} is not a block device")
+            return name, 0
+        return os.path.basename(os.path.dirname(os.path.realpath(block))), int(partition)
+
+    def build(self):
+        locations = []
+        serials = {}
+        text = self._read(self._path('proc', 'mounts')) or ''
+        for line in text.splitlines():
+            fields = line.split()
+            if len(fields) < 2 or not fields[0].startswith('/dev/'):
+                continue
+            name = os.path.basename(fields[0])
+            try:
+                disk, partition = self.resolve(name)
+            except TopologyError:
+                continue
+            if disk not in serials:
+                serials[disk] = self.disk_serial(disk)
+            mountpoint = fields[1].replace('\\040', ' ')
+            locations.append(DiskLocation(mountpoint, partition, f"/dev/{disk}", serials[disk]))
+        return locations
+
+    def signature(self):
+        try:
+            devices = tuple(sorted(os.listdir(self._path('sys', 'class', 'block'))))
+        except OSError:
+            devices = ()
+        # A stick is often mounted a moment after its block device appears
+        return devices, hash(self._read(self._path('proc', 'mounts')))
+
+
+class FakeTopologySource(TopologySource):
+    """In-memory topology for tests; change `locations` to simulate hotplug"""
+    name = 'fake'
+
+    def __init__(self, locations):
+        self.locations = list(locations)
+        self.build_count = 0
+
+    def build(self):
+        self.build_count += 1
+        return list(self.locations)
+
+    def signature(self):
+        return tuple(sorted(location.disk for location in self.locations)), len(self.locations)
+
+
+class BusSource:
+    """Base class for bus topology sources.
+
+    bus_path(disk) returns the BusPath of a physical disk, or None when the
+    disk is not on USB or its place on the bus is unknown (the base class
+    knows nothing, so every disk counts as its own hub).
+    """
+    name = 'none'
+
+    def bus_path(self, disk):
+        return None
+
+
+_PCI_FUNCTION = re.compile(r'^[0-9a-f]{4}:[0-9a-f]{2}:[0-9a-f]{2}\.[0-7]$')
+_USB_PORT = re.compile(r'^(usb\d+|\d+-\d+(\.\d+)*)$')
+
+
+def parse_sysfs_bus_path(path):
+    """Parses a resolved /sys/devices/... path of a block device into a BusPath.
+
+    /sys/devices/pci0000:00/0000:00:14.0/usb2/2-1/2-1.3/2-1.3:1.0/host6/.../block/sdb
+    is controller 0000:00:14.0 and ports ('usb2', '2-1', '2-1.3'): the stick
+    sits on port 3 of the hub at 2-1, which hangs off root hub usb2.
+    """
+    controller = None
+    ports = []
+    for part in path.replace('\\', '/').split('/'):
+        if _USB_PORT.match(part):
+            ports.append(part)
+        elif ports:
+            # The first USB interface (2-1.3:1.0) ends the device chain
+            break
+        elif _PCI_FUNCTION.match(part):
+            controller = part
+    if not ports:
+        return None
+    return BusPath(controller or ports[0], tuple(ports))
+
+
+class LinuxBusSource(BusSource):
+    """Reads a disk's place on the bus from its sysfs device path"""
+    name = 'linux'
+
+    def __init__(self, root='/'):
+        self.root = root
+
+    def bus_path(self, disk):
+        name = os.path.basename(str(disk).rstrip('/'))
+        block = os.path.join(self.root, 'sys', 'class', 'block', name)
+        if not os.path.exists(block):
+            return None
+        return parse_sysfs_bus_path(os.path.realpath(block))
+
+
+class FakeBusSource(BusSource):
+    """In-memory bus topology for tests: {disk: BusPath}"""
+    name = 'fake'
+
+    def __init__(self, paths):
+        self.paths = dict(paths)
+
+    def bus_path(self, disk):
+        return self.paths.get(disk)
+
+
+def get_default_bus_source():
+    """Picks the bus topology source; Windows and disk images fall back to one hub per disk"""
+    if sys.platform.startswith('linux') and not os.environ.get('USBLOCK_IMAGE_DIR'):
+        return LinuxBusSource()
+    return BusSource()
+
+
+def get_default_source():
+    """Picks the topology source for the running platform"""
+    if os.name == 'nt':
+        return WindowsTopologySource()
+    if sys.platform.startswith('linux'):
+        return LinuxTopologySource()
+    raise RuntimeError(f"No disk topology source for platform {sys.platform}")
+
+
+class TopologyIndex:
+    """In-memory mountpoint -> physical disk index, rebuilt only when devices change"""
+
+    def __init__(self, source=None):
+        self.source = source or get_default_source()
+        self._lock = threading.Lock()
+        self._by_mountpoint = None
+        self._signature = None
+
+    def invalidate(self):
+        with self._lock:
+            self._by_mountpoint = None
+
+    def _rebuild(self):
+        signature = self.source.signature()
+        by_mountpoint = {}
+        for location in self.source.build():
+            by_mountpoint[normalize_mountpoint(location.mountpoint)] = location
+        self._by_mountpoint = by_mountpoint
+        self._signature = signature
+        logging.info(f"Disk topology indexed: {len(by_mountpoint)} mountpoint(s)")
+
+    def locations(self):
+        """Returns every indexed DiskLocation"""
+        with self._lock:
+            if self._by_mountpoint is None or self.source.signature() != self._signature:
+                self._rebuild()
+            return list(self._by_mountpoint.values())
+
+    def lookup(self, mountpoint):
+        """Returns the DiskLocation for a mountpoint or raises TopologyError"""
+        key = normalize_mountpoint(mountpoint)
+        with self._lock:
+            if self._by_mountpoint is None or self.source.signature() != self._signature:
+                self._rebuild()
+            location = self._by_mountpoint.get(key)
+        if location is None:
+            raise TopologyError(f"No physical disk found for {mountpoint}")
+        return location
+
+
+_topology = None
+_topology_lock = threading.Lock()
+
+
+def get_topology():
+    """Returns the process-wide topology index"""
+    global _topology
+    with _topology_lock:
+        if _topology is None:
+            _topology = TopologyIndex()
+        return _topology
+
+
+def set_topology(index):
+    """Replaces the process-wide topology index, e.g. one over a FakeTopologySource in benchmarks"""
+    global _topology
+    with _topology_lock:
+        _topology = index
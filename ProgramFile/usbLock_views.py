@@ -0,0 +1,166 @@
+from collections import namedtuple
+
+# Backups shown per page of the enable view's backup list
+BACKUP_PAGE_SIZE = 50
+# Key of the message row ("No drives found.") shown in an otherwise empty list
+PLACEHOLDER = '!placeholder'
+
+DRIVE_COLUMNS = ('drive', 'label', 'size', 'fstype', 'serial')
+BACKUP_COLUMNS = ('created', 'serial', 'drive', 'name')
+
+# What turns `shown` rows into `rows`: keys to delete, (index, key, values) to insert,
+# (key, values) to update in place, and whether surviving rows changed order
+RowDiff = namedtuple('RowDiff', ['removed', 'added', 'changed', 'reordered'])
+
+
+def _unique(rows):
+    """Suffixes repeated keys (two sticks reporting the same serial) with #2, #3..."""
+    seen = {}
+    unique = []
+    for key, values in rows:
+        n = seen[key] = seen.get(key, 0) + 1
+        unique.append((key if n == 1 else f"{key}#{n}", values))
+    return unique
+
+
+def volume_key(record):
+    return record.device
+
+
+def drive_key(record):
+    """Physical drives are keyed by serial, so a selection survives the disk being renumbered"""
+    if record.has_serial:
+        return f"serial:{record.serial}"
+    if record.signature:
+        return f"disk:{record.signature}"
+    return f"drive:{record.index}"
+
+
+def backup_key(entry):
+    return f"backup:{entry.id}"
+
+
+def volume_rows(records):
+    """(key, values) per volume record, values in DRIVE_COLUMNS order"""
+    return _unique(
+        (volume_key(r), (r.device, r.label or '', r.size, r.fstype or '', '')) for r in records
+    )
+
+
+def drive_rows(records):
+    """(key, values) per physical drive record, values in DRIVE_COLUMNS order"""
+    return _unique(
+        (drive_key(r), (r.title, '', '', '', r.serial or '')) for r in records
+    )
+
+
+def backup_values(entry):
+    return entry.created_text, entry.serial or '', entry.drive or '', entry.name
+
+
+def diff_rows(shown, rows):
+    """Compares the rows on screen ({key: values} in display order) with the wanted ones.
+
+    Unchanged rows are left alone, so the widget keeps their selection and
+    scroll position and does not redraw them.
+    """
+    wanted = dict(rows)
+    removed = [key for key in shown if key not in wanted]
+    added = []
+    changed = []
+    for index, (key, values) in enumerate(rows):
+        if key not in shown:
+            added.append((index, key, values))
+        elif shown[key] != values:
+            changed.append((key, values))
+    kept = [key for key in shown if key in wanted]
+    reordered = kept != [key for key, _ in rows if key in shown]
+    return RowDiff(removed, added, changed, reordered)
+
+
+class BackupListModel:
+    """The enable view's backup list: catalog entries filtered, sorted and cut into pages.
+
+    Only the current page is ever handed to the widget, so the list stays
+    fast however many backups the catalog holds.
+    """
+
+    def __init__(self, page_size=BACKUP_PAGE_SIZE):
+        self.page_size = page_size
+        self.entries = {}
+        self.query = ''
+        self.sort_column = 'created'
+        self.descending = True
+        self.page = 0
+        self._values = {}
+        self._haystacks = {}
+        self._view = None
+
+    def set_entries(self, entries):
+        """Replaces the entries; display strings are kept for entries that did not change"""
+        entries = {backup_key(e): e for e in entries}
+        for key, entry in entries.items():
+            if self.entries.get(key) == entry:
+                # The old record already carries its formatted date and name
+                entries[key] = self.entries[key]
+            else:
+                self._values[key] = values = backup_values(entry)
+                self._haystacks[key] = ' '.join(values).lower()
+        for key in set(self._values) - set(entries):
+            del self._values[key]
+            del self._haystacks[key]
+        self.entries = entries
+        self._view = None
+        self.set_page(self.page)
+
+    def search(self, query):
+        """Keeps only backups whose date, serial, drive or file name contain every word of query"""
+        query = query.strip().lower()
+        if query != self.query:
+            self.query = query
+            self.page = 0
+            self._view = None
+
+    def sort_by(self, column):
+        """Sorts by a BACKUP_COLUMNS column; choosing the current column again reverses the order"""
+        if column == self.sort_column:
+            self.descending = not self.descending
+        else:
+            self.sort_column = column
+            self.descending = column == 'created'
+        self._view = None
+
+    def view(self):
+        """Keys of every backup that matches the search, in sort order"""
+        if self._view is None:
+            words = self.query.split()
+            keys = [k for k in self.entries if all(w in self._haystacks[k] for w in words)]
+            if self.sort_column == 'created':
+                sort_key = lambda k: self.entries[k].created or 0
+            else:
+                column = BACKUP_COLUMNS.index(self.sort_column)
+                sort_key = lambda k: self._values[k][column].lower()
+            keys.sort(key=sort_key, reverse=self.descending)
+            self._view = keys
+        return self._view
+
+    def page_count(self):
+        return max(1, -(-len(self.view()) // self.page_size))
+
+    def set_page(self, page):
+        self.page = max(0, min(page, self.page_count() - 1))
+
+    def page_of(self, key):
+        """The page showing `key`, or None if the search hides it"""
+        try:
+            return self.view().index(key) // self.page_size
+        except ValueError:
+            return None
+
+    def rows(self):
+        """(key, values) for the backups on the current page"""
+        start = self.page * self.page_size
+        return [(key, self._values[key]) for key in self.view()[start:start + self.page_size]]
+
+    def get(self, key):
+        return self.entries.get(key)
@@ -0,0 +1,257 @@
+import os
+import mmap
+import time
+import queue
+import random
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+from usbLock_device import get_device_backend
+from usbLock_metadata import RawDisk
+
+# Bytes written per request; a multiple of every sector size
+WIPE_CHUNK = 4 * 1024 * 1024
+# One buffer being filled, one being written, one spare
+WIPE_BUFFERS = 3
+# Chunks re-read by a sampled verification, besides the first and last one
+SAMPLE_CHUNKS = 64
+PROGRESS_INTERVAL = 0.5
+
+PATTERNS = ('zero', 'random')
+VERIFY_MODES = ('none', 'sample', 'full')
+
+WipeProgress = namedtuple('WipeProgress', ['phase', 'done', 'total', 'rate'])
+WipeResult = namedtuple('WipeResult', [
+    'drive', 'size', 'passes', 'sha256', 'verify', 'verified', 'seconds', 'complete'
+])
+
+
+class WipeError(Exception):
+    """Raised when a drive cannot be wiped or its verification fails to run"""
+
+
+class ZeroSource:
+    """Leaves buffers as they are: fresh anonymous mmaps are already zero-filled"""
+
+    def fill(self, buffer, offset, length):
+        pass
+
+    def close(self):
+        pass
+
+
+class RandomSource:
+    """Fills caller-owned buffers from the OS CSPRNG, without allocating per block"""
+
+    def __init__(self):
+        if os.name == 'nt':
+            import ctypes
+            self._bcrypt = ctypes.windll.bcrypt
+            self._urandom = None
+        else:
+            self._bcrypt = None
+            self._urandom = open('/dev/urandom', 'rb', buffering=0)
+
+    def fill(self, buffer, offset, length):
+        if self._bcrypt is not None:
+            import ctypes
+            target = (ctypes.c_char * length).from_buffer(buffer)
+            try:
+                # BCRYPT_USE_SYSTEM_PREFERRED_RNG
+                status = self._bcrypt.BCryptGenRandom(None, target, length, 2)
+            finally:
+                del target
+            if status:
+                raise WipeError(f"BCryptGenRandom failed with status {status & 0xFFFFFFFF:#x}")
+            return
+        with memoryview(buffer) as view:
+            done = 0
+            while done < length:
+                done += self._urandom.readinto(view[done:length])
+
+    def close(self):
+        if self._urandom is not None:
+            self._urandom.close()
+
+
+class DiskSource:
+    """Fills buffers by reading the drive back, for full verification"""
+
+    def __init__(self, disk):
+        self.disk = disk
+
+    def fill(self, buffer, offset, length):
+        if self.disk.read_into(buffer, offset, length) != length:
+            raise WipeError(f"Short read at offset {offset}")
+
+    def close(self):
+        pass
+
+
+def _filler(source, free, filled, size, cancel):
+    offset = 0
+    try:
+        while offset < size and not cancel.is_set():
+            buffer = free.get()
+            length = min(WIPE_CHUNK, size - offset)
+            source.fill(buffer, offset, length)
+            filled.put((offset, buffer, length))
+            offset += length
+        filled.put(None)
+    except BaseException as e:
+        filled.put(e)
+
+
+def _pipeline(source, size, consume, cancel, phase, on_progress):
+    """Fills buffers on a worker thread while consume(offset, view) handles the previous one.
+
+    Returns the number of bytes consumed, which is less than `size` if cancelled.
+    """
+    buffers = [mmap.mmap(-1, WIPE_CHUNK) for _ in range(WIPE_BUFFERS)]
+    free = queue.Queue()
+    filled = queue.Queue()
+    for buffer in buffers:
+        free.put(buffer)
+    worker = threading.Thread(target=_filler, args=(source, free, filled, size, cancel), daemon=True)
+    began = last_progress = time.perf_counter()
+    done = 0
+    worker.start()
+    try:
+        while True:
+            item = filled.get()
+            if item is None:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            offset, buffer, length = item
+            with memoryview(buffer) as whole, whole[:length] as view:
+                consume(offset, view)
+            free.put(buffer)
+            done = offset + length
+            now = time.perf_counter()
+            if on_progress and now - last_progress >= PROGRESS_INTERVAL:
+                last_progress = now
+                on_progress(WipeProgress(phase, done, size, done / (now - began) / 1e6))
+    except BaseException:
+        cancel.set()
+        while worker.is_alive():
+            # Hand buffers back so a filler blocked on the pool can see `cancel`
+            try:
+                item = filled.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if isinstance(item, tuple):
+                free.put(item[1])
+        raise
+    finally:
+        worker.join()
+        for buffer in buffers:
+            buffer.close()
+    if on_progress:
+        on_progress(WipeProgress(phase, done, size, done / max(time.perf_counter() - began, 1e-9) / 1e6))
+    return done
+
+
+def _write_pass(disk, pattern, size, samples, cancel, on_progress):
+    """Writes one pattern over the drive; returns (bytes written, sha256, {chunk index: sha256})"""
+    source = RandomSource() if pattern == 'random' else ZeroSource()
+    hasher = hashlib.sha256()
+    sample_digests = {}
+
+    def consume(offset, view):
+        hasher.update(view)
+        index = offset // WIPE_CHUNK
+        if index in samples:
+            sample_digests[index] = hashlib.sha256(view).hexdigest()
+        if disk.write_from(view, offset) != len(view):
+            raise WipeError(f"Short write at offset {offset}")
+
+    try:
+        done = _pipeline(source, size, consume, cancel, pattern, on_progress)
+    finally:
+        source.close()
+    os.fsync(disk.file.fileno())
+    return done, hasher.hexdigest(), sample_digests
+
+
+def _verify_samples(disk, size, sample_digests, on_progress):
+    buffer = mmap.mmap(-1, WIPE_CHUNK)
+    try:
+        for count, index in enumerate(sorted(sample_digests), 1):
+            offset = index * WIPE_CHUNK
+            length = min(WIPE_CHUNK, size - offset)
+            if disk.read_into(buffer, offset, length) != length:
+                raise WipeError(f"Short read at offset {offset}")
+            with memoryview(buffer) as whole, whole[:length] as view:
+                if hashlib.sha256(view).hexdigest() != sample_digests[index]:
+                    logging.error(f"Wipe verification failed at offset {offset}")
+                    return False
+            if on_progress:
+                on_progress(WipeProgress('verify', count, len(sample_digests), 0.0))
+    finally:
+        buffer.close()
+    return True
+
+
+def wipe_drive(drive_number, passes=('zero',), verify='sample', devices=None, on_progress=None, cancel=None):
+    """Overwrites every sector of a drive with each pattern in `passes`, then verifies the last one.
+
+    verify='sample' re-reads the first, last and SAMPLE_CHUNKS random chunks;
+    'full' re-reads the whole drive. Returns a WipeResult whose sha256 is the
+    hash of everything the last pass wrote; verified is None without verification.
+    """
+    if not passes or any(p not in PATTERNS for p in passes):
+        raise WipeError(f"Passes must be a sequence of {', '.join(PATTERNS)}")
+    if verify not in VERIFY_MODES:
+        raise WipeError(f"Verification must be one of {', '.join(VERIFY_MODES)}")
+    devices = devices or get_device_backend()
+    cancel = cancel or threading.Event()
+    began = time.perf_counter()
+    digest = None
+    verified = None
+    complete = True
+
+    with devices.exclusive(drive_number), RawDisk.open(devices, drive_number, writable=True) as disk:
+        size = disk.size()
+        if size <= 0 or size % disk.geometry.logical:
+            # Nothing to overwrite means nothing was wiped, not a verified success
+            raise WipeError(f"Drive {drive_number} reports an unusable size of {size} bytes")
+        chunks = -(-size // WIPE_CHUNK)
+        samples = set()
+        if verify == 'sample':
+            samples = {0, chunks - 1} | set(random.sample(range(chunks), min(SAMPLE_CHUNKS, chunks)))
+
+        for number, pattern in enumerate(passes, 1):
+            last = number == len(passes)
+            done, digest, sample_digests = _write_pass(
+                disk, pattern, size, samples if last else set(), cancel, on_progress
+            )
+            logging.info(f"Wipe pass {number}/{len(passes)} ({pattern}) of drive {drive_number}: {done} bytes")
+            if done != size:
+                complete = False
+                break
+
+        if complete and verify == 'sample':
+            verified = _verify_samples(disk, size, sample_digests, on_progress)
+        elif complete and verify == 'full':
+            hasher = hashlib.sha256()
+            done = _pipeline(DiskSource(disk), size, lambda offset, view: hasher.update(view),
+                             cancel, 'verify', on_progress)
+            if done == size:
+                verified = hasher.hexdigest() == digest
+            else:
+                complete = False
+
+    seconds = time.perf_counter() - began
+    result = WipeResult(drive_number, size, tuple(passes), digest if complete else None, verify, verified,
+                        seconds, complete)
+    if complete:
+        # The audit record: what was written, how it was checked, and the hash to check it against
+        logging.info(
+            f"Wiped drive {drive_number}: {size} bytes, passes={'+'.join(passes)}, verify={verify}, "
+            f"verified={verified}, sha256={digest}, {size * len(passes) / max(seconds, 1e-9) / 1e6:.1f} MB/s"
+        )
+    else:
+        logging.warning(f"Wipe of drive {drive_number} was cancelled; the drive is partly overwritten")
+    return result